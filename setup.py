@@ -685,6 +685,7 @@ setup(
             include_dirs=[get_python_inc(), numpy.get_include()],
             extra_compile_args=['-D_FILE_OFFSET_BITS=64', '-Wextra'] + omp_arg,
             extra_link_args=[] + omp_lib,
+            libraries=['z'],
             sources=[op.join('src', 'gf', 'ext', 'store_ext.c')]),
 
         Extension(
@@ -694,6 +695,13 @@ setup(
             extra_link_args=[] + omp_lib,
             sources=[op.join('src', 'ext', 'parstack_ext.c')]),
 
+        Extension(
+            'spit_ext',
+            include_dirs=[get_python_inc(), numpy.get_include()],
+            extra_compile_args=['-Wextra'] + omp_arg,
+            extra_link_args=[] + omp_lib,
+            sources=[op.join('src', 'ext', 'spit_ext.c')]),
+
         Extension(
             'ahfullgreen_ext',
             include_dirs=[get_python_inc(), numpy.get_include()],
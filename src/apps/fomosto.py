@@ -31,6 +31,7 @@ subcommand_descriptions = {
     'check':         'check for problems in GF store',
     'decimate':      'build decimated variant of a GF store',
     'redeploy':      'copy traces from one GF store into another',
+    'convert':       'convert GF store to different traces file layout',
     'view':          'view selected traces',
     'extract':       'extract selected traces',
     'import':        'convert Kiwi GFDB to GF store format',
@@ -55,6 +56,7 @@ subcommand_usages = {
     'check':         'check [store-dir] [options]',
     'decimate':      'decimate [store-dir] <factor> [options]',
     'redeploy':      'redeploy <source> <destination> [options]',
+    'convert':       'convert [store-dir] <destination> [options]',
     'view':          'view [store-dir] ... [options]',
     'extract':       'extract [store-dir] <selection>',
     'import':        'import <source> <destination> [options]',
@@ -85,6 +87,7 @@ Subcommands:
     check         %(check)s
     decimate      %(decimate)s
     redeploy      %(redeploy)s
+    convert       %(convert)s
     view          %(view)s
     extract       %(extract)s
     import        %(import)s
@@ -291,6 +294,31 @@ def command_build(args):
             '--block', dest='iblock', type='int', metavar='I',
             help='process block number IBLOCK')
 
+        parser.add_option(
+            '--distributed', dest='distributed', action='store_true',
+            help='work-queue mode: cooperate with other instances of '
+                 '"fomosto build --distributed", possibly on different hosts '
+                 'sharing the store directory, claiming blocks through lock '
+                 'files in STOREDIR/.build. Rerun to resume. Remove '
+                 'STOREDIR/.build to start over.')
+
+        parser.add_option(
+            '--lease', dest='lease', type='float', metavar='SECONDS',
+            help='in distributed mode, reclaim blocks of workers which have '
+                 'not shown activity for SECONDS (default: %g)' % (
+                     gf.builder.g_lease))
+
+        parser.add_option(
+            '--run-cache', dest='run_cache', action='store_true',
+            help='reuse identical runs of the external modelling code, e.g. '
+                 'from other stores or previous builds, keeping their output '
+                 'in a cache directory (default: %s)' % op.join(
+                     config.config().cache_dir, 'fomosto_runs'))
+
+        parser.add_option(
+            '--run-cache-dir', dest='run_cache_dir', metavar='DIR',
+            help='use DIR as cache directory for --run-cache')
+
     parser, options, args = cl_parse('build', args, setup=setup)
 
     store_dir = get_store_dir(args)
@@ -312,7 +340,10 @@ def command_build(args):
             force=options.force,
             nworkers=options.nworkers, continue_=options.continue_,
             step=step,
-            iblock=iblock)
+            iblock=iblock,
+            distributed=options.distributed,
+            lease=options.lease,
+            run_cache=options.run_cache_dir or options.run_cache)
 
     except gf.StoreError as e:
         die(e)
@@ -371,6 +402,19 @@ def command_decimate(args):
             '--force', dest='force', action='store_true',
             help='overwrite existing files')
 
+        parser.add_option(
+            '--nworkers', dest='nworkers', type='int', metavar='N',
+            help='run N worker processes in parallel')
+
+        parser.add_option(
+            '--continue', dest='continue_', action='store_true',
+            help='continue suspended decimation')
+
+        parser.add_option(
+            '--incremental', dest='incremental', action='store_true',
+            help='update existing decimated store, only blocks with changed '
+                 'source traces are decimated again')
+
     parser, options, args = cl_parse('decimate', args, setup=setup)
     try:
         decimate = int(args.pop())
@@ -386,7 +430,9 @@ def command_decimate(args):
     try:
         store = gf.Store(store_dir)
         store.make_decimated(decimate, config=config, force=options.force,
-                             show_progress=True)
+                             show_progress=True, nworkers=options.nworkers,
+                             continue_=options.continue_,
+                             incremental=options.incremental)
 
     except gf.StoreError as e:
         die(e)
@@ -445,6 +491,54 @@ def command_redeploy(args):
         pbar.finish()
 
 
+def command_convert(args):
+
+    def setup(parser):
+        parser.add_option(
+            '--compression', dest='compression', metavar='NAME',
+            choices=['none'] + gf.meta.StoreCompression.choices,
+            help='compression of the new traces file: %s; by default, the '
+                 'compression of the source store is kept' % ', '.join(
+                    ['none'] + gf.meta.StoreCompression.choices))
+
+        parser.add_option(
+            '--record-order', dest='record_order', metavar='ORDER',
+            choices=['index', 'tiled'],
+            help='order of the trace data in the new traces file: index '
+                 '(ordered by record number), tiled (in tiles of about one '
+                 'memory page over the depth-distance plane); by default, '
+                 'the order of the source store is kept')
+
+        parser.add_option(
+            '--force', dest='force', action='store_true',
+            help='overwrite existing files')
+
+    parser, options, args = cl_parse('convert', args, setup=setup)
+    try:
+        dest_store_dir = args.pop()
+    except Exception:
+        parser.error('cannot get <destination> argument')
+
+    store_dir = get_store_dir(args)
+
+    try:
+        store = gf.Store(store_dir)
+
+        compression = options.compression
+        if compression is None:
+            compression = store.compression
+        elif compression == 'none':
+            compression = None
+
+        store.make_converted(
+            dest_store_dir, compression=compression,
+            record_order=options.record_order, force=options.force,
+            show_progress=True)
+
+    except gf.StoreError as e:
+        die(e)
+
+
 def command_view(args):
     def setup(parser):
         parser.add_option('--extract',
@@ -797,12 +891,18 @@ def command_ttt(args):
             '--force', dest='force', action='store_true',
             help='overwrite existing files')
 
+        parser.add_option(
+            '--nworkers', dest='nworkers', type='int', metavar='N',
+            help='run N worker processes in parallel')
+
     parser, options, args = cl_parse('ttt', args, setup=setup)
 
     store_dir = get_store_dir(args)
     try:
         store = gf.Store(store_dir)
-        store.make_ttt(force=options.force)
+        store.make_ttt(
+            force=options.force, nworkers=options.nworkers,
+            show_progress=True)
 
     except gf.StoreError as e:
         die(e)
@@ -857,11 +957,11 @@ def command_tttview(args):
             store.config.source_depth_max - store.config.source_depth_min)/2.
 
     if isinstance(store.config, gf.ConfigTypeA):
-        arrivals = num.empty(num_d)
+        args = num.zeros((num_d, 2))
+        args[:, 0] = depth
+        args[:, 1] = distances
         for phase_id in phase_ids:
-            arrivals[:] = num.NAN
-            for i, d in enumerate(distances):
-                arrivals[i] = store.t(phase_id, (depth, d))
+            arrivals = store.t_many(phase_id, args)
             axes.plot(distances/1000, arrivals, label=phase_id)
         axes.set_title('source depth %s km' % (depth/1000))
         axes.set_xlabel('distance [km]')
@@ -942,10 +1042,24 @@ def command_server(args):
             '--ip', dest='ip', metavar='IP', default='',
             help='serve on ip address IP')
 
+        parser.add_option(
+            '--workers', dest='nworkers', metavar='N', type='int', default=0,
+            help='process requests in a pool of N worker processes '
+                 '(default: process requests inline)')
+
+        parser.add_option(
+            '--max-requests-per-client', dest='max_requests_per_client',
+            metavar='N', type='int',
+            help='limit number of concurrent processing requests per client '
+                 'to N')
+
     parser, options, args = cl_parse('server', args, setup=setup)
 
     engine = gf.LocalEngine(store_superdirs=args)
-    server.run(options.ip, options.port, engine)
+    server.run(
+        options.ip, options.port, engine,
+        nworkers=options.nworkers,
+        max_requests_per_client=options.max_requests_per_client)
 
 
 def command_download(args):
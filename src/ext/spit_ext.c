@@ -0,0 +1,353 @@
+#define NPY_NO_DEPRECATED_API 7
+
+
+#include "Python.h"
+#include "numpy/arrayobject.h"
+
+#include <stdlib.h>
+#include <math.h>
+#if defined(_OPENMP)
+    # include <omp.h>
+#endif
+
+#define NDIM_MAX 10
+#define NPOINTS_MIN_PARALLEL 1000
+
+struct module_state {
+    PyObject *error;
+};
+
+#if PY_MAJOR_VERSION >= 3
+#define GETSTATE(m) ((struct module_state*)PyModule_GetState(m))
+#else
+#define GETSTATE(m) (&_state); (void) m;
+static struct module_state _state;
+#endif
+
+typedef enum {
+    SUCCESS = 0,
+    BAD_NDIM,
+} spit_error_t;
+
+const char* spit_error_names[] = {
+    "SUCCESS",
+    "BAD_NDIM",
+};
+
+/*
+ * Flat tree layout, cells in breadth first order, so that the children of
+ * each cell are stored contiguously:
+ *
+ *   xbounds[icell, idim, 2]   cell bounds
+ *   a[icell, idim, 2]         interpolation offsets
+ *   b[icell, idim, 2]         interpolation scales
+ *   f[icell, 2**ndim]         function values at cell corners
+ *   ok[icell]                 leaf has only finite corner values
+ *   ichild_first[icell]       index of first child
+ *   nchildren[icell]          number of children
+ *
+ * The order of the floating point operations mimics the NumPy
+ * implementation in Cell.interpolate_many, so that results are identical.
+ */
+
+static int inside(size_t ndim, const double *xbounds, const double *x) {
+    size_t idim;
+    for (idim=0; idim<ndim; idim++) {
+        if (!(xbounds[idim*2] <= x[idim] && x[idim] <= xbounds[idim*2+1])) {
+            return 0;
+        }
+    }
+    return 1;
+}
+
+static double interpolate1(
+        size_t ndim,
+        const double *xbounds,
+        const double *a,
+        const double *b,
+        const double *f,
+        const int8_t *ok,
+        const int32_t *ichild_first,
+        const int32_t *nchildren,
+        const double *x) {
+
+    size_t icell, ichild, idim, ncorners, icorner, n, i;
+    ssize_t ifound;
+    double ws[NDIM_MAX*2];
+    double v[1<<NDIM_MAX];
+
+    icell = 0;
+    while (nchildren[icell] > 0) {
+        ifound = -1;
+        /* last matching child wins, as in the Python implementation */
+        for (ichild=(size_t)ichild_first[icell];
+             ichild<(size_t)(ichild_first[icell] + nchildren[icell]);
+             ichild++) {
+
+            if (inside(ndim, &xbounds[ichild*ndim*2], x)) {
+                ifound = ichild;
+            }
+        }
+
+        if (ifound < 0) {
+            return NAN;
+        }
+
+        icell = ifound;
+    }
+
+    if (!ok[icell]) {
+        return NAN;
+    }
+
+    for (idim=0; idim<ndim; idim++) {
+        for (i=0; i<2; i++) {
+            ws[idim*2+i] = (x[idim] - a[icell*ndim*2 + idim*2 + i]) /
+                b[icell*ndim*2 + idim*2 + i];
+        }
+    }
+
+    ncorners = (size_t)1 << ndim;
+    for (icorner=0; icorner<ncorners; icorner++) {
+        v[icorner] = ws[(icorner >> (ndim-1)) & 1];
+        for (idim=1; idim<ndim; idim++) {
+            v[icorner] *= ws[idim*2 + ((icorner >> (ndim-1-idim)) & 1)];
+        }
+        v[icorner] *= f[icell*ncorners + icorner];
+    }
+
+    for (n=ncorners; n>1; n/=2) {
+        for (i=0; i<n/2; i++) {
+            v[i] = v[2*i] + v[2*i+1];
+        }
+    }
+
+    return v[0];
+}
+
+spit_error_t interpolate_many(
+        size_t ndim,
+        const double *xbounds,
+        const double *a,
+        const double *b,
+        const double *f,
+        const int8_t *ok,
+        const int32_t *ichild_first,
+        const int32_t *nchildren,
+        size_t npoints,
+        const double *x,
+        double *result,
+        int nthreads) {
+
+    ssize_t ipoint;
+
+    if (ndim < 1 || ndim > NDIM_MAX) {
+        return BAD_NDIM;
+    }
+
+#if defined(_OPENMP)
+    if (nthreads <= 0) {
+        nthreads = omp_get_max_threads();
+    }
+    #pragma omp parallel for schedule(static) num_threads(nthreads) if (npoints >= NPOINTS_MIN_PARALLEL)
+#else
+    (void)nthreads;
+#endif
+    for (ipoint=0; ipoint<(ssize_t)npoints; ipoint++) {
+        result[ipoint] = interpolate1(
+            ndim, xbounds, a, b, f, ok, ichild_first, nchildren,
+            &x[ipoint*ndim]);
+    }
+
+    return SUCCESS;
+}
+
+int good_array(PyObject* o, int typenum, ssize_t size_want, int ndim_want, npy_intp* shape_want) {
+    int i;
+
+    if (!PyArray_Check(o)) {
+        PyErr_SetString(PyExc_AttributeError, "not a NumPy array" );
+        return 0;
+    }
+
+    if (PyArray_TYPE((PyArrayObject*)o) != typenum) {
+        PyErr_SetString(PyExc_AttributeError, "array of unexpected type");
+        return 0;
+    }
+
+    if (!PyArray_ISCARRAY((PyArrayObject*)o)) {
+        PyErr_SetString(PyExc_AttributeError, "array is not contiguous or not well behaved");
+        return 0;
+    }
+
+    if (size_want != -1 && size_want != PyArray_SIZE((PyArrayObject*)o)) {
+        PyErr_SetString(PyExc_AttributeError, "array is of unexpected size");
+        return 0;
+    }
+
+    if (ndim_want != -1 && ndim_want != PyArray_NDIM((PyArrayObject*)o)) {
+        PyErr_SetString(PyExc_AttributeError, "array is of unexpected ndim");
+        return 0;
+    }
+
+    if (ndim_want != -1 && shape_want != NULL) {
+        for (i=0; i<ndim_want; i++) {
+            if (shape_want[i] != -1 && shape_want[i] != PyArray_DIMS((PyArrayObject*)o)[i]) {
+                PyErr_SetString(PyExc_AttributeError, "array is of unexpected shape");
+                return 0;
+            }
+        }
+    }
+    return 1;
+}
+
+static PyObject* w_interpolate_many(PyObject *module, PyObject *args) {
+    PyObject *xbounds_arr, *a_arr, *b_arr, *f_arr, *ok_arr;
+    PyObject *ichild_first_arr, *nchildren_arr, *x_arr;
+    PyObject *result_arr;
+    npy_intp shape_want[3];
+    npy_intp shape_result[1];
+    size_t ndim, ncells, npoints;
+    int nthreads;
+    spit_error_t err;
+    struct module_state *st = GETSTATE(module);
+
+    if (!PyArg_ParseTuple(args, "OOOOOOOOi", &xbounds_arr, &a_arr, &b_arr,
+                          &f_arr, &ok_arr, &ichild_first_arr, &nchildren_arr,
+                          &x_arr, &nthreads)) {
+        PyErr_SetString(
+            st->error,
+            "usage: interpolate_many(xbounds, a, b, f, ok, ichild_first, "
+            "nchildren, x, nthreads)");
+        return NULL;
+    }
+
+    shape_want[0] = -1;
+    shape_want[1] = -1;
+    shape_want[2] = 2;
+    if (!good_array(xbounds_arr, NPY_FLOAT64, -1, 3, shape_want)) return NULL;
+
+    ncells = PyArray_DIMS((PyArrayObject*)xbounds_arr)[0];
+    ndim = PyArray_DIMS((PyArrayObject*)xbounds_arr)[1];
+
+    if (ncells < 1 || ndim < 1 || ndim > NDIM_MAX) {
+        PyErr_SetString(st->error, "unsupported number of cells or dimensions");
+        return NULL;
+    }
+
+    shape_want[0] = ncells;
+    shape_want[1] = ndim;
+    if (!good_array(a_arr, NPY_FLOAT64, -1, 3, shape_want)) return NULL;
+    if (!good_array(b_arr, NPY_FLOAT64, -1, 3, shape_want)) return NULL;
+
+    shape_want[1] = 1 << ndim;
+    if (!good_array(f_arr, NPY_FLOAT64, -1, 2, shape_want)) return NULL;
+    if (!good_array(ok_arr, NPY_INT8, ncells, 1, NULL)) return NULL;
+    if (!good_array(ichild_first_arr, NPY_INT32, ncells, 1, NULL)) return NULL;
+    if (!good_array(nchildren_arr, NPY_INT32, ncells, 1, NULL)) return NULL;
+
+    shape_want[0] = -1;
+    shape_want[1] = ndim;
+    if (!good_array(x_arr, NPY_FLOAT64, -1, 2, shape_want)) return NULL;
+
+    npoints = PyArray_DIMS((PyArrayObject*)x_arr)[0];
+
+    shape_result[0] = npoints;
+    result_arr = PyArray_SimpleNew(1, shape_result, NPY_FLOAT64);
+    if (result_arr == NULL) return NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+    err = interpolate_many(
+        ndim,
+        PyArray_DATA((PyArrayObject*)xbounds_arr),
+        PyArray_DATA((PyArrayObject*)a_arr),
+        PyArray_DATA((PyArrayObject*)b_arr),
+        PyArray_DATA((PyArrayObject*)f_arr),
+        PyArray_DATA((PyArrayObject*)ok_arr),
+        PyArray_DATA((PyArrayObject*)ichild_first_arr),
+        PyArray_DATA((PyArrayObject*)nchildren_arr),
+        npoints,
+        PyArray_DATA((PyArrayObject*)x_arr),
+        PyArray_DATA((PyArrayObject*)result_arr),
+        nthreads);
+    Py_END_ALLOW_THREADS
+
+    if (err != SUCCESS) {
+        Py_DECREF(result_arr);
+        PyErr_SetString(st->error, spit_error_names[err]);
+        return NULL;
+    }
+
+    return Py_BuildValue("N", result_arr);
+}
+
+
+static PyMethodDef SpitExtMethods[] = {
+    {"interpolate_many",  (PyCFunction) w_interpolate_many, METH_VARARGS,
+        "Interpolate many points in flattened space partitioning tree." },
+
+    {NULL, NULL, 0, NULL}        /* Sentinel */
+};
+
+
+#if PY_MAJOR_VERSION >= 3
+
+static int spit_ext_traverse(PyObject *m, visitproc visit, void *arg) {
+    Py_VISIT(GETSTATE(m)->error);
+    return 0;
+}
+
+static int spit_ext_clear(PyObject *m) {
+    Py_CLEAR(GETSTATE(m)->error);
+    return 0;
+}
+
+static struct PyModuleDef moduledef = {
+        PyModuleDef_HEAD_INIT,
+        "spit_ext",
+        NULL,
+        sizeof(struct module_state),
+        SpitExtMethods,
+        NULL,
+        spit_ext_traverse,
+        spit_ext_clear,
+        NULL
+};
+
+#define INITERROR return NULL
+
+PyMODINIT_FUNC
+PyInit_spit_ext(void)
+
+#else
+#define INITERROR return
+
+void
+initspit_ext(void)
+#endif
+
+{
+#if PY_MAJOR_VERSION >= 3
+    PyObject *module = PyModule_Create(&moduledef);
+#else
+    PyObject *module = Py_InitModule("spit_ext", SpitExtMethods);
+#endif
+    import_array();
+
+    if (module == NULL)
+        INITERROR;
+    struct module_state *st = GETSTATE(module);
+
+    st->error = PyErr_NewException("pyrocko.spit_ext.SpitExtError", NULL, NULL);
+    if (st->error == NULL){
+        Py_DECREF(module);
+        INITERROR;
+    }
+
+    Py_INCREF(st->error);
+    PyModule_AddObject(module, "SpitExtError", st->error);
+
+#if PY_MAJOR_VERSION >= 3
+    return module;
+#endif
+}
@@ -243,8 +243,9 @@ def init(store_dir, variant):
 
 
 def build(store_dir, force=False, nworkers=None, continue_=False, step=None,
-          iblock=None):
+          iblock=None, distributed=False, lease=None, run_cache=None):
 
     return AhfullGFBuilder.build(
         store_dir, force=force, nworkers=nworkers, continue_=continue_,
-        step=step, iblock=iblock)
+        step=step, iblock=iblock, distributed=distributed, lease=lease,
+        run_cache=run_cache)
@@ -8,6 +8,9 @@ from builtins import range
 import logging
 import os
 import signal
+import shutil
+from tempfile import mkdtemp
+from os.path import join as pjoin
 
 import numpy as num
 
@@ -23,12 +26,57 @@ class Interrupted(gf.store.StoreError):
         return 'Interrupted.'
 
 
+program = 'pyrocko.fomosto.dummy-1'
+
+
+class DummyRunner(object):
+    '''
+    Emulates the runner of an external modelling code.
+
+    The input file lists record numbers and the number of samples, the output
+    file contains a constant trace for each record.
+    '''
+
+    def __init__(self, tmp=None, run_cache=None):
+        self.tempdir = mkdtemp(prefix='dummyrun-', dir=tmp)
+        self.run_cache = run_cache
+
+    def run(self, irecords, nsamples):
+        input_str = ('%i\n' % nsamples + ''.join(
+            '%i\n' % irec for irec in irecords)).encode('ascii')
+
+        with open(pjoin(self.tempdir, 'input'), 'wb') as f:
+            f.write(input_str)
+
+        if self.run_cache is not None:
+            key = self.run_cache.key(program, input_str)
+            if self.run_cache.restore(key, self.tempdir):
+                return
+
+        data = num.repeat(
+            num.array(irecords, dtype=num.float)[:, num.newaxis],
+            nsamples, axis=1)
+
+        num.save(pjoin(self.tempdir, 'output.npy'), data)
+
+        if self.run_cache is not None:
+            self.run_cache.save(key, self.tempdir)
+
+    def get_data(self):
+        return num.load(pjoin(self.tempdir, 'output.npy'))
+
+    def __del__(self):
+        shutil.rmtree(self.tempdir)
+
+
 class DummyGFBuilder(gf.builder.Builder):
     def __init__(self, store_dir, step, shared, force=False):
         self.store = gf.store.Store(store_dir, 'w')
         gf.builder.Builder.__init__(
             self, self.store.config, step, block_size=(1, 51), force=force)
 
+        self.run_cache = self.get_run_cache(shared)
+
     def work_block(self, index):
         (sz, firstx), (sz, lastx), (ns, nx) = \
             self.get_block_extents(index)
@@ -36,6 +84,17 @@ class DummyGFBuilder(gf.builder.Builder):
         logger.info(
             'Starting block %i / %i' % (index+1, self.nblocks))
 
+        all_args = [
+            (sz, x, ig)
+            for x in num.linspace(firstx, lastx, nx)
+            for ig in range(self.store.config.ncomponents)]
+
+        runner = DummyRunner(run_cache=self.run_cache)
+        runner.run(
+            [self.store.config.irecord(*args) for args in all_args], 10000)
+
+        data = runner.get_data()
+
         interrupted = []
 
         def signal_handler(signum, frame):
@@ -45,20 +104,17 @@ class DummyGFBuilder(gf.builder.Builder):
         self.store.lock()
         duplicate_inserts = 0
         try:
-            for x in num.linspace(firstx, lastx, nx):
-                for ig in range(self.store.config.ncomponents):
-                    args = (sz, x, ig)
-                    irec = self.store.config.irecord(*args)
-                    tr = trace.Trace(
-                        deltat=self.store.config.deltat,
-                        ydata=num.zeros(10000)+float(irec))
+            for args, ydata in zip(all_args, data):
+                tr = trace.Trace(
+                    deltat=self.store.config.deltat,
+                    ydata=ydata)
 
-                    gf_tr = gf.store.GFTrace.from_trace(tr)
+                gf_tr = gf.store.GFTrace.from_trace(tr)
 
-                    try:
-                        self.store.put(args, gf_tr)
-                    except gf.store.DuplicateInsert:
-                        duplicate_inserts += 1
+                try:
+                    self.store.put(args, gf_tr)
+                except gf.store.DuplicateInsert:
+                    duplicate_inserts += 1
 
         finally:
             if duplicate_inserts:
@@ -86,6 +142,7 @@ def init(store_dir, variant):
     config = gf.meta.ConfigTypeA(
         id=store_id,
         ncomponents=2,
+        component_scheme='elastic2',
         sample_rate=1.0,
         receiver_depth=0*km,
         source_depth_min=0*km,
@@ -106,8 +163,12 @@ def build(
         nworkers=None,
         continue_=False,
         step=None,
-        iblock=None):
+        iblock=None,
+        distributed=False,
+        lease=None,
+        run_cache=None):
 
     return DummyGFBuilder.build(
         store_dir, force=force, nworkers=nworkers, continue_=continue_,
-        step=step, iblock=iblock)
+        step=step, iblock=iblock, distributed=distributed, lease=lease,
+        run_cache=run_cache)
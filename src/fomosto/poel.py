@@ -584,7 +584,10 @@ def build(
         nworkers=None,
         continue_=False,
         step=None,
-        iblock=None):
+        iblock=None,
+        distributed=False,
+        lease=None,
+        run_cache=None):
 
     return PoelGFBuilder.build(
         store_dir,
@@ -592,4 +595,7 @@ def build(
         nworkers=nworkers,
         continue_=continue_,
         step=step,
-        iblock=iblock)
+        iblock=iblock,
+        distributed=distributed,
+        lease=lease,
+        run_cache=run_cache)
@@ -329,11 +329,12 @@ class PsGrnRunner(object):
     Wrapper object to execute the program fomosto_psgrn.
     '''
 
-    def __init__(self, outdir):
+    def __init__(self, outdir, run_cache=None):
         outdir = os.path.abspath(outdir)
         if not os.path.exists(outdir):
             os.mkdir(outdir)
         self.outdir = outdir
+        self.run_cache = run_cache
         self.config = None
 
     def run(self, config, force=False):
@@ -356,6 +357,13 @@ class PsGrnRunner(object):
             f.write(input_str)
         program = program_bins['psgrn.%s' % config.version]
 
+        if self.run_cache is not None:
+            key = self.run_cache.key(program, input_str)
+            if self.run_cache.restore(key, self.outdir):
+                self.psgrn_output = b''
+                self.psgrn_error = b''
+                return
+
         old_wd = os.getcwd()
 
         os.chdir(self.outdir)
@@ -424,6 +432,9 @@ in the directory %s'''.lstrip() % (
 
         os.chdir(old_wd)
 
+        if self.run_cache is not None:
+            self.run_cache.save(key, self.outdir)
+
 
 pscmp_displ_names = ('un', 'ue', 'ud')
 pscmp_stress_names = ('snn', 'see', 'sdd', 'sne', 'snd', 'sed')
@@ -1141,11 +1152,12 @@ class PsCmpRunner(object):
         results are stored
     :param keep_tmp: boolean, if True the result directory is kept
     '''
-    def __init__(self, tmp=None, keep_tmp=False):
+    def __init__(self, tmp=None, keep_tmp=False, run_cache=None):
         if tmp is not None:
             tmp = os.path.abspath(tmp)
         self.tempdir = mkdtemp(prefix='pscmprun-', dir=tmp)
         self.keep_tmp = keep_tmp
+        self.run_cache = run_cache
         self.config = None
 
     def run(self, config):
@@ -1168,6 +1180,26 @@ class PsCmpRunner(object):
 
         program = program_bins['pscmp.%s' % config.version]
 
+        if self.run_cache is not None:
+            # the psgrn functions are identified by the psgrn input, not by
+            # their location
+            psgrn_input_fn = pjoin(config.psgrn_outdir, 'input')
+            with open(psgrn_input_fn, 'rb') as f:
+                psgrn_input_str = f.read()
+
+            key = self.run_cache.key(
+                program,
+                input_str.replace(
+                    config.psgrn_outdir.encode(), b'<psgrn_outdir>/'),
+                psgrn_input_str,
+                gf.builder.program_digest(
+                    program_bins['psgrn.%s' % config.version]))
+
+            if self.run_cache.restore(key, self.tempdir):
+                self.pscmp_output = b''
+                self.pscmp_error = b''
+                return
+
         old_wd = os.getcwd()
         os.chdir(self.tempdir)
 
@@ -1244,6 +1276,9 @@ in the directory {dir}'''.format(
 
         os.chdir(old_wd)
 
+        if self.run_cache is not None:
+            self.run_cache.save(key, self.tempdir)
+
     def get_results(self, component='displ'):
         '''
         Get the resulting components from the stored directory.
@@ -1370,6 +1405,7 @@ class PsGrnCmpGFBuilder(gf.builder.Builder):
 
         self.cg = cg
         self.cc = cc
+        self.run_cache = self.get_run_cache(shared)
 
     def work_block(self, iblock):
 
@@ -1409,7 +1445,8 @@ class PsGrnCmpGFBuilder(gf.builder.Builder):
                 start_distance=fc.distance_min / km,
                 end_distance=fc.distance_max / km)
 
-            runner = PsGrnRunner(outdir=self.cg.psgrn_outdir)
+            runner = PsGrnRunner(
+                outdir=self.cg.psgrn_outdir, run_cache=self.run_cache)
             runner.run(cg, force=self.force)
 
         else:
@@ -1428,7 +1465,7 @@ class PsGrnCmpGFBuilder(gf.builder.Builder):
                 n_steps=len(distances),
                 distances=distances)
 
-            runner = PsCmpRunner(keep_tmp=False)
+            runner = PsCmpRunner(keep_tmp=False, run_cache=self.run_cache)
 
             mtsize = float(dx * cc.rectangular_fault_size_factor)
 
@@ -1555,8 +1592,12 @@ def build(store_dir,
           nworkers=None,
           continue_=False,
           step=None,
-          iblock=None):
+          iblock=None,
+          distributed=False,
+          lease=None,
+          run_cache=None):
 
     return PsGrnCmpGFBuilder.build(
         store_dir, force=force, nworkers=nworkers, continue_=continue_,
-        step=step, iblock=iblock)
+        step=step, iblock=iblock, distributed=distributed, lease=lease,
+        run_cache=run_cache)
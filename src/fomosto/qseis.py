@@ -598,9 +598,10 @@ class Interrupted(gf.store.StoreError):
 
 class QSeisRunner(object):
 
-    def __init__(self, tmp=None, keep_tmp=False):
+    def __init__(self, tmp=None, keep_tmp=False, run_cache=None):
         self.tempdir = mkdtemp(prefix='qseisrun-', dir=tmp)
         self.keep_tmp = keep_tmp
+        self.run_cache = run_cache
         self.config = None
 
     def run(self, config):
@@ -616,6 +617,13 @@ class QSeisRunner(object):
 
         program = program_bins['qseis.%s' % config.qseis_version]
 
+        if self.run_cache is not None:
+            key = self.run_cache.key(program, input_str)
+            if self.run_cache.restore(key, self.tempdir):
+                self.qseis_output = b''
+                self.qseis_error = b''
+                return
+
         old_wd = os.getcwd()
 
         os.chdir(self.tempdir)
@@ -690,6 +698,9 @@ in the directory %s'''.lstrip() % (
 
         os.chdir(old_wd)
 
+        if self.run_cache is not None:
+            self.run_cache.save(key, self.tempdir)
+
     def get_traces(self, which='seis'):
 
         if which == 'seis':
@@ -793,6 +804,8 @@ class QSeisGFBuilder(gf.builder.Builder):
         if self.tmp is not None:
             util.ensuredir(self.tmp)
 
+        self.run_cache = self.get_run_cache(shared)
+
     def work_block(self, index):
         if len(self.store.config.ns) == 2:
             (sz, firstx), (sz, lastx), (ns, nx) = \
@@ -811,7 +824,7 @@ class QSeisGFBuilder(gf.builder.Builder):
         conf.source_depth = float(sz/km)
         conf.receiver_depth = float(rz/km)
 
-        runner = QSeisRunner(tmp=self.tmp)
+        runner = QSeisRunner(tmp=self.tmp, run_cache=self.run_cache)
 
         dx = self.gf_config.distance_delta
 
@@ -1049,8 +1062,9 @@ def init(store_dir, variant):
 
 
 def build(store_dir, force=False, nworkers=None, continue_=False, step=None,
-          iblock=None):
+          iblock=None, distributed=False, lease=None, run_cache=None):
 
     return QSeisGFBuilder.build(
         store_dir, force=force, nworkers=nworkers, continue_=continue_,
-        step=step, iblock=iblock)
+        step=step, iblock=iblock, distributed=distributed, lease=lease,
+        run_cache=run_cache)
@@ -443,10 +443,11 @@ class Interrupted(gf.store.StoreError):
 
 class QSSPRunner(object):
 
-    def __init__(self, tmp=None, keep_tmp=False):
+    def __init__(self, tmp=None, keep_tmp=False, run_cache=None):
 
         self.tempdir = mkdtemp(prefix='qssprun-', dir=tmp)
         self.keep_tmp = keep_tmp
+        self.run_cache = run_cache
         self.config = None
 
     def run(self, config):
@@ -462,6 +463,20 @@ class QSSPRunner(object):
 
         program = program_bins['qssp.%s' % config.qssp_version]
 
+        if self.run_cache is not None:
+            # Green's functions computed in the run are cached along with the
+            # output, the key must not depend on the location of the store
+            gf_directory = os.path.abspath(config.gf_directory) + '/'
+            run_dirs = {'output': self.tempdir, 'green': gf_directory}
+            key = self.run_cache.key(
+                program,
+                input_str.replace(gf_directory.encode(), b'<gf_directory>/'))
+
+            if self.run_cache.restore(key, run_dirs):
+                self.qssp_output = b''
+                self.qssp_error = b''
+                return
+
         old_wd = os.getcwd()
 
         os.chdir(self.tempdir)
@@ -534,6 +549,17 @@ qssp has been invoked as "%s"'''.lstrip() % (
 
         os.chdir(old_wd)
 
+        if self.run_cache is not None:
+            gf_fns = []
+            for green in config.greens_functions:
+                if green.calculate:
+                    gf_fns.extend(
+                        os.path.basename(fn) for fn in glob.glob(
+                            pjoin(gf_directory, '?_' + green.filename)))
+
+            self.run_cache.save(
+                key, run_dirs, select={'green': sorted(gf_fns)})
+
     def get_traces(self):
 
         fns = self.config.get_output_filenames(self.tempdir)
@@ -624,6 +650,7 @@ class QSSPGFBuilder(gf.builder.Builder):
         util.ensuredir(conf.gf_directory)
 
         self.qssp_config = conf
+        self.run_cache = self.get_run_cache(shared)
 
     def work_block(self, iblock):
         if len(self.store.config.ns) == 2:
@@ -654,7 +681,7 @@ class QSSPGFBuilder(gf.builder.Builder):
 
         tbeg = time.time()
 
-        runner = QSSPRunner(tmp=self.tmp)
+        runner = QSSPRunner(tmp=self.tmp, run_cache=self.run_cache)
 
         conf.receiver_depth = rz/km
         conf.sampling_interval = 1.0 / self.gf_config.sample_rate
@@ -883,8 +910,12 @@ def build(
         nworkers=None,
         continue_=False,
         step=None,
-        iblock=None):
+        iblock=None,
+        distributed=False,
+        lease=None,
+        run_cache=None):
 
     return QSSPGFBuilder.build(
         store_dir, force=force, nworkers=nworkers, continue_=continue_,
-        step=step, iblock=iblock)
+        step=step, iblock=iblock, distributed=distributed, lease=lease,
+        run_cache=run_cache)
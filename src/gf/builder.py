@@ -8,13 +8,25 @@ from builtins import range
 import os
 import signal
 import errno
+import time
+import socket
+import shutil
+import logging
+import threading
+import hashlib
 from os.path import join as pjoin
 import numpy as num
 
 from collections import defaultdict
 from pyrocko.parimap import parimap
+from pyrocko import util, config
 from . import store
 
+logger = logging.getLogger('pyrocko.gf.builder')
+
+# default lease time [s] of block claims in distributed builds
+g_lease = 600.
+
 
 def int_arr(*args):
     return num.array(args, dtype=num.int)
@@ -25,6 +37,472 @@ class Interrupted(store.StoreError):
         return 'Interrupted.'
 
 
+class BlockQueue(object):
+    '''
+    Work queue of build blocks, coordinated through files.
+
+    Used by :py:meth:`Builder.build` in distributed mode. Any number of
+    workers, possibly on different hosts sharing a filesystem, can work on the
+    same store. The state is kept in the ``.build`` directory of the store:
+
+    * ``claims/STEP-IBLOCK``: claim of a block by a worker. It is created
+      exclusively and contains the worker id and a heartbeat counter, which
+      is incremented by the owner every ``lease / 4`` seconds.
+    * ``done/STEP-IBLOCK``: written when a block is finished. It contains
+      worker id, start time and end time of the block.
+
+    A claim is considered stale if its content has not changed for ``lease``
+    seconds, as measured by the clock of the observing worker, so that clocks
+    of different hosts need not be synchronized. Stale claims are broken and
+    the block is processed again. A claim which has been renewed while being
+    broken is restored. An owner which finds its claim replaced after
+    renewing it gives up the block.
+    '''
+
+    def __init__(self, store_dir, lease=None, worker_id=None):
+        if lease is None:
+            lease = g_lease
+
+        if worker_id is None:
+            worker_id = '%s-%i-%s' % (
+                socket.gethostname(), os.getpid(),
+                util.time_to_str(time.time(), format='%Y%m%d%H%M%S.3FRAC'))
+
+        self.lease = lease
+        self.worker_id = worker_id
+        self.base_dir = pjoin(store_dir, '.build')
+        self.claims_dir = pjoin(self.base_dir, 'claims')
+        self.done_dir = pjoin(self.base_dir, 'done')
+        self._seen = {}
+
+    def _claim_fn(self, step, iblock):
+        return pjoin(self.claims_dir, '%i-%i' % (step, iblock))
+
+    def _done_fn(self, step, iblock):
+        return pjoin(self.done_dir, '%i-%i' % (step, iblock))
+
+    def initialize(self, store_dir, force=False):
+        '''
+        Set up queue and store files, once for all workers.
+
+        The first worker creates the ``.build`` directory and the store's
+        index and traces files. All other workers wait until this has been
+        done. If the ``.build`` directory exists, a previous distributed build
+        is continued.
+        '''
+
+        try:
+            os.mkdir(self.base_dir)
+            created = True
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+            created = False
+
+        initialized_fn = pjoin(self.base_dir, 'initialized')
+        if created:
+            for d in (self.claims_dir, self.done_dir):
+                os.mkdir(d)
+
+            store.Store.create_dependants(store_dir, force)
+            with open(initialized_fn, 'w'):
+                pass
+
+        else:
+            while not os.path.exists(initialized_fn):
+                time.sleep(0.1)
+
+    def is_done(self, step, iblock):
+        return os.path.exists(self._done_fn(step, iblock))
+
+    def _read(self, fn):
+        try:
+            with open(fn, 'r') as f:
+                return f.read()
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                return None
+
+            raise
+
+    def _claim_content(self, counter):
+        return '%s %i\n' % (self.worker_id, counter)
+
+    def _write_claim(self, fn, counter):
+        fn_temp = '%s.%s.temp' % (fn, self.worker_id)
+        with open(fn_temp, 'w') as f:
+            f.write(self._claim_content(counter))
+
+        os.rename(fn_temp, fn)
+
+    def _is_stale(self, fn):
+        content = self._read(fn)
+        if content is None:
+            return False
+
+        now = time.time()
+        seen = self._seen.get(fn, None)
+        if seen is None or seen[0] != content:
+            self._seen[fn] = (content, now)
+            return False
+
+        return now - seen[1] > self.lease
+
+    def _break(self, fn):
+        fn_broken = '%s.%s.broken' % (fn, self.worker_id)
+        try:
+            os.rename(fn, fn_broken)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+
+            raise
+
+        content = self._read(fn_broken)
+        if content != self._seen[fn][0]:
+            # the claim has been renewed after it has been checked, put it
+            # back unless its owner has recreated it in the meantime
+            try:
+                os.link(fn_broken, fn)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+            os.remove(fn_broken)
+            return False
+
+        os.remove(fn_broken)
+        del self._seen[fn]
+        logger.warning('Reclaiming block of unresponsive worker (%s)' % (
+            content or '?').split()[0])
+
+        return True
+
+    def claim(self, step, iblocks):
+        '''
+        Claim next available block.
+
+        :returns: block index or ``None`` if no block is available
+        '''
+
+        for iblock in iblocks:
+            if self.is_done(step, iblock):
+                continue
+
+            fn = self._claim_fn(step, iblock)
+            for attempt in range(2):
+                try:
+                    fd = os.open(fn, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                    os.write(fd, self._claim_content(0).encode('ascii'))
+                    os.close(fd)
+
+                    # may have been finished by previous owner in the
+                    # meantime
+                    if self.is_done(step, iblock):
+                        os.remove(fn)
+                        break
+
+                    return iblock
+
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+
+                    if not (self._is_stale(fn) and self._break(fn)):
+                        break
+
+        return None
+
+    def owns(self, step, iblock):
+        content = self._read(self._claim_fn(step, iblock))
+        return content is not None and content.split()[0] == self.worker_id
+
+    def renew(self, step, iblock, counter):
+        '''
+        Renew lease of claimed block.
+
+        :returns: ``False`` if the claim has been lost
+        '''
+
+        if not self.owns(step, iblock):
+            return False
+
+        fn = self._claim_fn(step, iblock)
+        self._write_claim(fn, counter)
+
+        # another worker may have broken the claim and claimed the block
+        # between the check and the rename, only the last rename survives
+        return self._read(fn) == self._claim_content(counter)
+
+    def finish(self, step, iblock, tstart, tend):
+        fn = self._done_fn(step, iblock)
+        fn_temp = '%s.%s.temp' % (fn, self.worker_id)
+        with open(fn_temp, 'w') as f:
+            f.write('%s %.3f %.3f\n' % (self.worker_id, tstart, tend))
+
+        os.rename(fn_temp, fn)
+
+        if self.owns(step, iblock):
+            os.remove(self._claim_fn(step, iblock))
+
+    def release(self, step, iblock):
+        if self.owns(step, iblock):
+            os.remove(self._claim_fn(step, iblock))
+
+    def timings(self, step=None):
+        '''
+        Get timings of finished blocks.
+
+        :returns: list of tuples ``(step, iblock, worker_id, tstart, tend)``
+        '''
+
+        timings = []
+        for fn in os.listdir(self.done_dir):
+            if fn.endswith('.temp'):
+                continue
+
+            istep, iblock = [int(x) for x in fn.split('-')]
+            if step is not None and istep != step:
+                continue
+
+            content = self._read(pjoin(self.done_dir, fn))
+            if content is None:
+                continue
+
+            worker_id, tstart, tend = content.split()
+            timings.append(
+                (istep, iblock, worker_id, float(tstart), float(tend)))
+
+        timings.sort()
+        return timings
+
+    def remove(self):
+        shutil.rmtree(self.base_dir)
+
+
+class Heartbeat(threading.Thread):
+    '''
+    Background thread renewing the lease of a claimed block.
+    '''
+
+    def __init__(self, queue, step, iblock):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._queue = queue
+        self._step = step
+        self._iblock = iblock
+        self._stop_event = threading.Event()
+        self.lost = False
+
+    def run(self):
+        counter = 0
+        while not self._stop_event.wait(self._queue.lease / 4.):
+            counter += 1
+            try:
+                if not self._queue.renew(self._step, self._iblock, counter):
+                    self.lost = True
+                    logger.warning(
+                        'Lost claim on block %i, it has been reclaimed by '
+                        'another worker' % (self._iblock+1))
+                    return
+
+            except (IOError, OSError) as e:
+                logger.warning('Renewing claim failed: %s' % e)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+g_program_digests = {}
+
+
+def find_program(program):
+    '''
+    Get path of an executable, searching in ``PATH``.
+
+    :returns: absolute path or ``None`` if the executable cannot be found
+    '''
+
+    if os.path.dirname(program):
+        candidates = [program]
+    else:
+        candidates = [
+            pjoin(d, program)
+            for d in os.environ.get('PATH', '').split(os.pathsep)]
+
+    for fn in candidates:
+        if os.path.isfile(fn) and os.access(fn, os.X_OK):
+            return os.path.abspath(fn)
+
+    return None
+
+
+def program_digest(program):
+    '''
+    Get digest identifying the version of an external program.
+
+    The digest is computed from the content of the executable, so that it
+    changes when the program is recompiled, and is independent of the
+    location of the executable. If the executable cannot be found, the
+    program name is returned.
+    '''
+
+    fn = find_program(program)
+    if fn is None:
+        return program
+
+    st = os.stat(fn)
+    k = (fn, st.st_size, st.st_mtime)
+    if k not in g_program_digests:
+        h = hashlib.sha1()
+        with open(fn, 'rb') as f:
+            while True:
+                data = f.read(1024*1024)
+                if not data:
+                    break
+
+                h.update(data)
+
+        g_program_digests[k] = h.hexdigest()
+
+    return g_program_digests[k]
+
+
+class RunCache(object):
+    '''
+    Content addressed cache of external modelling code runs.
+
+    The output files of a run are kept in the cache directory under a key
+    computed from the digest of the program executable and the rendered input
+    file, see :py:meth:`key`. Identical runs, e.g. when building stores
+    sharing earth model and depth ranges, or when rebuilding a store, can then
+    be reused instead of executing the modelling code again.
+
+    Entries are added atomically, so the cache can be shared by concurrent
+    builds.
+
+    :param cache_dir: cache directory, defaults to ``fomosto_runs`` in
+        pyrocko's cache directory
+    '''
+
+    def __init__(self, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = pjoin(config.config().cache_dir, 'fomosto_runs')
+
+        self.cache_dir = cache_dir
+        self.nhits = 0
+        self.nmisses = 0
+
+    def key(self, program, input_str, *extra):
+        '''
+        Get cache key for a run.
+
+        :param program: name or path of the executable, or a version string
+            for codes which are not run through an executable
+        :param input_str: rendered input file
+        :param extra: further strings affecting the output of the run
+        '''
+
+        h = hashlib.sha1()
+        for x in (program_digest(program), input_str) + extra:
+            if not isinstance(x, bytes):
+                x = x.encode('utf-8')
+
+            h.update(x)
+            h.update(b'\0')
+
+        return h.hexdigest()
+
+    def _entry_dir(self, key):
+        return pjoin(self.cache_dir, key[:2], key)
+
+    def restore(self, key, run_dirs):
+        '''
+        Copy output files of a cached run into place.
+
+        :param run_dirs: directory to copy the output files to, or, if the run
+            produces output in several directories, dict mapping part names
+            to directories
+        :returns: ``True`` if the run has been found in the cache
+        '''
+
+        if not isinstance(run_dirs, dict):
+            run_dirs = {'output': run_dirs}
+
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            self.nmisses += 1
+            return False
+
+        for part, run_dir in run_dirs.items():
+            part_dir = pjoin(entry_dir, part)
+            for (dirpath, _, fns) in os.walk(part_dir):
+                dirpath_run = pjoin(
+                    run_dir, os.path.relpath(dirpath, part_dir))
+
+                util.ensuredir(dirpath_run)
+                for fn in fns:
+                    shutil.copyfile(
+                        pjoin(dirpath, fn), pjoin(dirpath_run, fn))
+
+        self.nhits += 1
+        logger.info('Reusing cached run %s' % key)
+        return True
+
+    def save(self, key, run_dirs, exclude=('input',), select=None):
+        '''
+        Add output files of a run to the cache.
+
+        :param run_dirs: directory or dict of directories containing the
+            output of the run, see :py:meth:`restore`
+        :param exclude: names of files in the run directories not to be
+            cached
+        :param select: optional dict mapping part names to lists of file names
+            to be cached, instead of the complete directory
+        '''
+
+        if not isinstance(run_dirs, dict):
+            run_dirs = {'output': run_dirs}
+
+        select = select or {}
+
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return
+
+        util.ensuredir(os.path.dirname(entry_dir))
+        temp_dir = '%s.%i.temp' % (entry_dir, os.getpid())
+        try:
+            for part, run_dir in run_dirs.items():
+                part_dir = pjoin(temp_dir, part)
+                if part in select:
+                    util.ensuredir(part_dir)
+                    for fn in select[part]:
+                        shutil.copyfile(
+                            pjoin(run_dir, fn), pjoin(part_dir, fn))
+
+                else:
+                    shutil.copytree(
+                        run_dir, part_dir,
+                        ignore=lambda d, fns, run_dir=run_dir: [
+                            fn for fn in fns
+                            if os.path.samefile(d, run_dir)
+                            and fn in exclude])
+
+            os.rename(temp_dir, entry_dir)
+
+        except OSError as e:
+            # concurrently added by another process
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+
+        finally:
+            if os.path.exists(temp_dir):
+                shutil.rmtree(temp_dir)
+
+
 class Builder(object):
     nsteps = 1
 
@@ -54,6 +532,23 @@ class Builder(object):
     def warn(self, msg):
         self.warnings[msg] += 1
 
+    @staticmethod
+    def get_run_cache(shared):
+        '''
+        Get run cache of external modelling codes, if enabled for the build.
+
+        :returns: :py:class:`RunCache` object or ``None``
+        '''
+
+        run_cache = shared.get('run_cache', None)
+        if not run_cache:
+            return None
+
+        if run_cache is True:
+            return RunCache()
+
+        return RunCache(run_cache)
+
     def log_warnings(self, index, logger):
         for warning, noccur in self.warnings.items():
             msg = "block {}: " + warning
@@ -93,9 +588,148 @@ class Builder(object):
 
         return store_dir, step, iblock
 
+    @classmethod
+    def __work_queue(cls, args):
+        store_dir, steps, force, lease, poll, run_cache = args
+        try:
+            queue = BlockQueue(store_dir, lease=lease)
+            queue.initialize(store_dir, force=force)
+            shared = {'run_cache': run_cache}
+            ndone = 0
+            for step in steps:
+                builder = cls(store_dir, step, shared, force=force)
+                nblocks = builder.nblocks
+                iblocks = builder.all_block_indices()
+                while True:
+                    iblock = queue.claim(step, iblocks)
+                    if iblock is None:
+                        if all(queue.is_done(step, i) for i in iblocks):
+                            break
+
+                        time.sleep(poll)
+                        continue
+
+                    heartbeat = Heartbeat(queue, step, iblock)
+                    heartbeat.start()
+                    tstart = time.time()
+                    try:
+                        builder.work_block(iblock)
+                    except BaseException:
+                        heartbeat.stop()
+                        queue.release(step, iblock)
+                        raise
+
+                    heartbeat.stop()
+                    tend = time.time()
+
+                    # the block has been reclaimed by another worker, which
+                    # is responsible for finishing it now
+                    if heartbeat.lost or not queue.owns(step, iblock):
+                        logger.warning(
+                            'Block %i / %i of step %i done by %s after its '
+                            'claim has been lost, not marking it finished' % (
+                                iblock+1, nblocks, step+1, queue.worker_id))
+                        continue
+
+                    queue.finish(step, iblock, tstart, tend)
+                    ndone += 1
+                    logger.info(
+                        'Block %i / %i of step %i done in %.1f s by %s' % (
+                            iblock+1, nblocks, step+1, tend - tstart,
+                            queue.worker_id))
+
+                del builder
+
+        except KeyboardInterrupt:
+            raise Interrupted()
+        except IOError as e:
+            if e.errno == errno.EINTR:
+                raise Interrupted()
+            else:
+                raise
+
+        return ndone
+
+    @classmethod
+    def build_distributed(cls, store_dir, force=False, nworkers=1,
+                          step=None, lease=None, poll=1.0, run_cache=None):
+        '''
+        Build store in work-queue mode.
+
+        Any number of instances of this method, e.g. started with ``fomosto
+        build --distributed`` on different hosts sharing the store directory,
+        cooperate on the build. Blocks are claimed through lock files with
+        leases, see :py:class:`BlockQueue`. Blocks of crashed workers are
+        reclaimed after ``lease`` seconds. All blocks of a step are finished
+        before the next step is started.
+
+        :param nworkers: number of worker processes to run locally
+        :param lease: lease time [s] of block claims, defaults to
+            :py:data:`g_lease`
+        :param poll: interval [s] of polling for claimable blocks when waiting
+            for other workers
+        :param run_cache: see :py:meth:`build`
+        :returns: list of tuples ``(step, iblock, worker_id, tstart, tend)``
+            with the timings of all finished blocks
+        '''
+
+        if step is None:
+            steps = list(range(cls.nsteps))
+        else:
+            steps = [step]
+
+        if nworkers is None:
+            nworkers = 1
+
+        original = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            for _ in parimap(
+                    cls.__work_queue,
+                    [(store_dir, steps, force, lease, poll, run_cache)]
+                    * nworkers,
+                    nprocs=nworkers,
+                    eprintignore=(Interrupted, store.StoreError)):
+                pass
+
+        finally:
+            signal.signal(signal.SIGINT, original)
+
+        queue = BlockQueue(store_dir, lease=lease)
+        timings = queue.timings()
+        durations = num.array([tend - tstart for (_, _, _, tstart, tend)
+                               in timings])
+
+        if durations.size:
+            nworkers_all = len(set(x[2] for x in timings))
+            logger.info(
+                'Block timings: %i blocks by %i workers, mean %.1f s, '
+                'min %.1f s, max %.1f s' % (
+                    durations.size, nworkers_all, num.mean(durations),
+                    num.min(durations), num.max(durations)))
+
+        return timings
+
     @classmethod
     def build(cls, store_dir, force=False, nworkers=None, continue_=False,
-              step=None, iblock=None):
+              step=None, iblock=None, distributed=False, lease=None,
+              run_cache=None):
+        '''
+        Build store.
+
+        :param run_cache: reuse runs of external modelling codes through a
+            :py:class:`RunCache`: ``True`` to use the default cache directory
+            or path of the cache directory
+        '''
+
+        if distributed:
+            if iblock is not None:
+                raise store.StoreError(
+                    'distributed mode cannot be combined with block selection')
+
+            return cls.build_distributed(
+                store_dir, force=force, nworkers=nworkers, step=step,
+                lease=lease, run_cache=run_cache)
+
         if step is None:
             steps = list(range(cls.nsteps))
         else:
@@ -123,7 +757,7 @@ class Builder(object):
                     except IOError:
                         raise store.StoreError('nothing to continue')
 
-        shared = {}
+        shared = {'run_cache': run_cache}
         for step in steps:
             builder = cls(store_dir, step, shared, force=force)
             if not (0 <= step < builder.nsteps):
@@ -175,4 +809,4 @@ class Builder(object):
         os.remove(status_fn)
 
 
-__all__ = ['Builder']
+__all__ = ['Builder', 'BlockQueue', 'RunCache']
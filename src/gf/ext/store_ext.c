@@ -26,6 +26,7 @@
 #include <unistd.h>
 #include <stdio.h>
 #include <stdlib.h>
+#include <zlib.h>
 #if defined(_OPENMP)
     #include <omp.h>
 #endif
@@ -113,6 +114,7 @@ typedef enum {
     MMAP_TRACES_FAILED,
     INDEX_OUT_OF_BOUNDS,
     NTARGETS_OUT_OF_BOUNDS,
+    DECOMPRESSION_FAILED,
 } store_error_t;
 
 const char* store_error_names[] = {
@@ -132,6 +134,7 @@ const char* store_error_names[] = {
     "MMAP_TRACES_FAILED",
     "INDEX_OUT_OF_BOUNDS",
     "NTARGETS_OUT_OF_BOUNDS",
+    "DECOMPRESSION_FAILED",
 };
 
 #define NDIMS_CONTINUOUS_MAX 4
@@ -196,6 +199,11 @@ const mapping_scheme_t mapping_schemes[] = {
 #define REC_ZERO 1
 #define REC_SHORT 2
 
+/* compression of the traces file (see store.py for the block layout) */
+
+#define COMPRESSION_NONE 0
+#define COMPRESSION_ZLIB 1
+
 typedef struct {
     uint64_t data_offset;
     int32_t itmin;
@@ -215,8 +223,29 @@ typedef struct {
     gf_dtype **memdata;
     const mapping_scheme_t *mapping_scheme;
     mapping_t *mapping;
+    int compression;
 } store_t;
 
+/* Decoded records of compressed stores are kept in a small direct-mapped
+ * cache, owned by a single caller of store_get (one per summation and per
+ * thread). Records shared by neighboring source points are decoded only once
+ * per summation, while the memory used stays bounded and is released when
+ * the summation is done. Data returned through the cache is valid until the
+ * next store_get with the same cache. */
+
+#define DECODE_CACHE_NSLOTS 1024
+#define DECODE_CACHE_NBYTES_MAX (16*1024*1024)
+
+typedef struct {
+    size_t nslots;
+    uint64_t *irecords;
+    gf_dtype **data;
+    size_t *nbytes;
+    size_t nbytes_total;
+    gf_dtype *scratch;
+    size_t nbytes_scratch;
+} decode_cache_t;
+
 typedef struct {
     int is_zero;
     int32_t itmin;
@@ -366,7 +395,7 @@ int good_array(PyObject* o, int typenum_want, npy_intp size_want, int ndim_want,
 }
 
 static const trace_t ZERO_TRACE = { 1, 0, 0, 0.0, 0.0, NULL };
-static const store_t ZERO_STORE = { 0, 0, 0, 0, 0.0, NULL, NULL, NULL, NULL, NULL };
+static const store_t ZERO_STORE = { 0, 0, 0, 0, 0.0, NULL, NULL, NULL, NULL, NULL, COMPRESSION_NONE };
 
 static store_error_t store_get_span(const store_t *store, uint64_t irecord,
                              int32_t *itmin, int32_t *nsamples, int *is_zero) {
@@ -408,8 +437,221 @@ static store_error_t store_read(
     return SUCCESS;
 }
 
+static store_error_t store_decode_zlib(
+        const store_t *store,
+        uint64_t data_offset,
+        int32_t nsamples,
+        gf_dtype *out) {
+
+    /* Decode compressed record block: uint32 size of the deflate stream,
+     * followed by the deflate stream of the byte-shuffled, delta-encoded
+     * 32-bit sample patterns. Output is in store byte order. */
+
+    uint32_t nbytes_compressed;
+    unsigned char *compressed, *shuffled;
+    uLongf nbytes_shuffled;
+    uint32_t u, x;
+    int32_t i;
+    store_error_t err;
+
+    if (data_offset + 4 > store->data_size) {
+        return BAD_DATA_OFFSET;
+    }
+
+    err = store_read(store, data_offset, 4, &nbytes_compressed);
+    if (SUCCESS != err) {
+        return err;
+    }
+
+    nbytes_compressed = xe32toh(nbytes_compressed);
+
+    if (data_offset + 4 + nbytes_compressed > store->data_size) {
+        return BAD_DATA_OFFSET;
+    }
+
+    if (NULL != store->data) {
+        compressed = (unsigned char*)store->data + data_offset + 4;
+    } else {
+        compressed = (unsigned char*)malloc(nbytes_compressed);
+        if (NULL == compressed) {
+            return ALLOC_FAILED;
+        }
+        err = store_read(store, data_offset + 4, nbytes_compressed, compressed);
+        if (SUCCESS != err) {
+            free(compressed);
+            return err;
+        }
+    }
+
+    nbytes_shuffled = nsamples * sizeof(gf_dtype);
+    shuffled = (unsigned char*)malloc(nbytes_shuffled);
+    if (NULL == shuffled) {
+        err = ALLOC_FAILED;
+    } else if (Z_OK != uncompress(shuffled, &nbytes_shuffled, compressed,
+                                  nbytes_compressed) ||
+               nbytes_shuffled != nsamples * sizeof(gf_dtype)) {
+        err = DECOMPRESSION_FAILED;
+    }
+
+    if (NULL == store->data) {
+        free(compressed);
+    }
+
+    if (SUCCESS != err) {
+        free(shuffled);
+        return err;
+    }
+
+    u = 0;
+    for (i=0; i<nsamples; i++) {
+        u += (uint32_t)shuffled[i]
+            | (uint32_t)shuffled[nsamples + i] << 8
+            | (uint32_t)shuffled[2*nsamples + i] << 16
+            | (uint32_t)shuffled[3*nsamples + i] << 24;
+
+        x = xe32toh(u);
+        memcpy(&out[i], &x, 4);
+    }
+
+    free(shuffled);
+    return SUCCESS;
+}
+
+static decode_cache_t *decode_cache_new(const store_t *store, size_t nslots) {
+
+    /* Returns NULL for uncompressed stores, which need no cache, and on
+     * allocation failure. With nslots == 0, records are decoded into a single
+     * scratch buffer. */
+
+    decode_cache_t *cache;
+    size_t i;
+
+    if (COMPRESSION_NONE == store->compression) {
+        return NULL;
+    }
+
+    cache = (decode_cache_t*)calloc(1, sizeof(decode_cache_t));
+    if (NULL == cache) {
+        return NULL;
+    }
+
+    if (nslots > 0) {
+        cache->irecords = (uint64_t*)malloc(nslots * sizeof(uint64_t));
+        cache->data = (gf_dtype**)calloc(nslots, sizeof(gf_dtype*));
+        cache->nbytes = (size_t*)calloc(nslots, sizeof(size_t));
+        if (NULL == cache->irecords || NULL == cache->data ||
+                NULL == cache->nbytes) {
+            free(cache->irecords);
+            free(cache->data);
+            free(cache->nbytes);
+            free(cache);
+            return NULL;
+        }
+        for (i=0; i<nslots; i++) {
+            cache->irecords[i] = UINT64_MAX;
+        }
+    }
+
+    cache->nslots = nslots;
+    return cache;
+}
+
+static void decode_cache_delete(decode_cache_t *cache) {
+    size_t i;
+
+    if (NULL == cache) {
+        return;
+    }
+
+    for (i=0; i<cache->nslots; i++) {
+        free(cache->data[i]);
+    }
+
+    free(cache->irecords);
+    free(cache->data);
+    free(cache->nbytes);
+    free(cache->scratch);
+    free(cache);
+}
+
+static store_error_t store_get_compressed(
+        const store_t *store,
+        decode_cache_t *cache,
+        uint64_t irecord,
+        uint64_t data_offset,
+        int32_t nsamples,
+        gf_dtype **data) {
+
+    /* Records which do not fit into the cache's byte budget are decoded into
+     * the scratch buffer. */
+
+    size_t islot, nbytes;
+    gf_dtype *buf;
+    store_error_t err;
+
+    if (NULL == cache) {
+        return ALLOC_FAILED;
+    }
+
+    nbytes = nsamples * sizeof(gf_dtype);
+    islot = 0;
+    buf = NULL;
+
+    if (cache->nslots > 0) {
+        islot = irecord % cache->nslots;
+        if (cache->irecords[islot] == irecord) {
+            *data = cache->data[islot];
+            return SUCCESS;
+        }
+
+        cache->irecords[islot] = UINT64_MAX;
+        if (cache->nbytes[islot] >= nbytes) {
+            buf = cache->data[islot];
+        } else if (cache->nbytes_total - cache->nbytes[islot] + nbytes
+                   <= DECODE_CACHE_NBYTES_MAX) {
+
+            free(cache->data[islot]);
+            cache->nbytes_total -= cache->nbytes[islot];
+            cache->nbytes[islot] = 0;
+            cache->data[islot] = (gf_dtype*)malloc(nbytes > 0 ? nbytes : 1);
+            if (NULL == cache->data[islot]) {
+                return ALLOC_FAILED;
+            }
+            cache->nbytes[islot] = nbytes;
+            cache->nbytes_total += nbytes;
+            buf = cache->data[islot];
+        }
+    }
+
+    if (NULL == buf) {
+        if (cache->nbytes_scratch < nbytes) {
+            free(cache->scratch);
+            cache->nbytes_scratch = 0;
+            cache->scratch = (gf_dtype*)malloc(nbytes);
+            if (NULL == cache->scratch) {
+                return ALLOC_FAILED;
+            }
+            cache->nbytes_scratch = nbytes;
+        }
+        buf = cache->scratch;
+    }
+
+    err = store_decode_zlib(store, data_offset, nsamples, buf);
+    if (SUCCESS != err) {
+        return err;
+    }
+
+    if (cache->nslots > 0 && buf == cache->data[islot]) {
+        cache->irecords[islot] = irecord;
+    }
+
+    *data = buf;
+    return SUCCESS;
+}
+
 static store_error_t store_get(
         const store_t *store,
+        decode_cache_t *cache,
         uint64_t irecord,
         trace_t *trace) {
 
@@ -448,13 +690,22 @@ static store_error_t store_get(
 
     trace->is_zero = 0;
 
-    if (data_offset + trace->nsamples*sizeof(gf_dtype) > store->data_size) {
+    if (COMPRESSION_NONE == store->compression &&
+            data_offset + trace->nsamples*sizeof(gf_dtype) > store->data_size) {
         *trace = ZERO_TRACE;
         return BAD_DATA_OFFSET;
     }
 
     if (REC_SHORT == data_offset) {
         trace->data = &record->begin_value;
+    } else if (COMPRESSION_ZLIB == store->compression) {
+        err = store_get_compressed(
+            store, cache, irecord, data_offset, trace->nsamples,
+            &trace->data);
+        if (SUCCESS != err) {
+            *trace = ZERO_TRACE;
+            return err;
+        }
     } else {
         if (NULL != store->data) {
             trace->data = &store->data[data_offset/sizeof(gf_dtype)];
@@ -553,6 +804,7 @@ static store_error_t store_sum_extent(
 
 static store_error_t store_sum(
         const store_t *store,
+        decode_cache_t *cache,
         const uint64_t *irecords,
         const float32_t *delays,
         const float32_t *weights,
@@ -604,7 +856,7 @@ static store_error_t store_sum(
             continue;
         }
 
-        err = store_get(store, irecords[j], &trace);
+        err = store_get(store, cache, irecords[j], &trace);
         if (SUCCESS != err)
             return err;
 
@@ -696,6 +948,7 @@ static store_error_t store_sum_static(
     int j, itarget, idx;
     uint isummand, nsummands_src;
     float w1, w2;
+    decode_cache_t *cache;
     store_error_t err=SUCCESS;
     (void) nthreads;
 
@@ -717,10 +970,13 @@ static store_error_t store_sum_static(
         #pragma omp parallel \
             shared (store, irecords, delays, weights, ntargets, nsummands, \
                     result, it, deltat) \
-            private (j, isummand, delay, weight, idelay_floor, idelay_ceil, idx, trace, w1, w2) \
+            private (j, isummand, delay, weight, idelay_floor, idelay_ceil, idx, trace, w1, w2, cache) \
             reduction (+: err) \
             num_threads (nthreads)
         {
+    #endif
+        cache = decode_cache_new(store, DECODE_CACHE_NSLOTS);
+    #if defined(_OPENMP)
         #pragma omp for schedule (static)
     #endif
         for (itarget=0; itarget<ntargets; itarget++) {
@@ -738,7 +994,7 @@ static store_error_t store_sum_static(
                 if (!inlimits(idelay_floor) || !inlimits(idelay_ceil))
                     err += BAD_REQUEST;
 
-                err += store_get(store, irecords[j], &trace);
+                err += store_get(store, cache, irecords[j], &trace);
 
                 if (trace.is_zero)
                     continue;
@@ -756,6 +1012,7 @@ static store_error_t store_sum_static(
                 }
             }
         }
+        decode_cache_delete(cache);
     #if defined(_OPENMP)
         }
     #endif
@@ -764,7 +1021,8 @@ static store_error_t store_sum_static(
     return SUCCESS;
 }
 
-static store_error_t store_init(int f_index, int f_data, store_t *store) {
+static store_error_t store_init(
+        int f_index, int f_data, int compression, store_t *store) {
     void *p;
     struct stat st;
     size_t mmap_index_size;
@@ -779,6 +1037,12 @@ static store_error_t store_init(int f_index, int f_data, store_t *store) {
     store->mapping = NULL;
     store->mapping_scheme = NULL;
 
+    if (COMPRESSION_NONE != compression && COMPRESSION_ZLIB != compression) {
+        return BAD_REQUEST;
+    }
+
+    store->compression = compression;
+
     if (8 != pread(store->f_index, &store->nrecords, 8, 0)) {
         return READ_INDEX_FAILED;
     }
@@ -829,7 +1093,9 @@ static store_error_t store_init(int f_index, int f_data, store_t *store) {
         }
 
         store->data = (gf_dtype*)p;
-    } else {
+    }
+
+    if (!use_mmap) {
         if (store->nrecords > SIZE_MAX) {
             return ALLOC_FAILED;
         }
@@ -926,14 +1192,16 @@ static void w_store_delete(void *store) {
 #endif
 
 static PyObject* w_store_init(PyObject *m, PyObject *args) {
-    int f_index, f_data;
+    int f_index, f_data, compression;
     store_t *store;
     store_error_t err;
 
     struct module_state *st = GETSTATE(m);
 
-    if (!PyArg_ParseTuple(args, "ii", &f_index, &f_data)) {
-        PyErr_SetString(st->error, "usage store_init(f_index, f_data)" );
+    compression = COMPRESSION_NONE;
+
+    if (!PyArg_ParseTuple(args, "ii|i", &f_index, &f_data, &compression)) {
+        PyErr_SetString(st->error, "usage store_init(f_index, f_data[, compression])" );
         return NULL;
     }
 
@@ -943,7 +1211,7 @@ static PyObject* w_store_init(PyObject *m, PyObject *args) {
         return NULL;
     }
 
-    err = store_init(f_index, f_data, store);
+    err = store_init(f_index, f_data, compression, store);
     if (SUCCESS != err) {
         PyErr_SetString(st->error, store_error_names[err]);
         store_deinit(store);
@@ -1063,6 +1331,7 @@ static PyObject* w_store_get(PyObject *m, PyObject *args) {
     store_t *store;
     gf_dtype *adata;
     trace_t trace;
+    decode_cache_t *cache;
     PyArrayObject *array = NULL;
     npy_intp array_dims[1] = {0};
     unsigned long long int irecord_;
@@ -1097,8 +1366,10 @@ static PyObject* w_store_get(PyObject *m, PyObject *args) {
     }
     nsamples = nsamples_;
 
-    err = store_get(store, irecord, &trace);
+    cache = decode_cache_new(store, 0);
+    err = store_get(store, cache, irecord, &trace);
     if (SUCCESS != err) {
+        decode_cache_delete(cache);
         PyErr_SetString(st->error, store_error_names[err]);
         return NULL;
     }
@@ -1114,6 +1385,8 @@ static PyObject* w_store_get(PyObject *m, PyObject *args) {
         adata[i] = fe32toh(trace.data[i]);
     }
 
+    decode_cache_delete(cache);
+
     return Py_BuildValue("Nififf", array, trace.itmin, store->deltat,
                          trace.is_zero, trace.begin_value, trace.end_value);
 }
@@ -1660,6 +1933,7 @@ static PyObject* w_store_sum(PyObject *m, PyObject *args) {
     PyObject *capsule, *irecords_arr, *delays_arr, *weights_arr;
     store_t *store;
     trace_t result;
+    decode_cache_t *cache;
     PyArrayObject *array = NULL;
     npy_intp array_dims[1] = {0};
     uint64_t *irecords;
@@ -1727,7 +2001,9 @@ static PyObject* w_store_sum(PyObject *m, PyObject *args) {
     result.itmin = itmin;
     result.data = (gf_dtype*)PyArray_DATA(array);
 
-    err = store_sum(store, irecords, delays, weights, n, &result);
+    cache = decode_cache_new(store, DECODE_CACHE_NSLOTS);
+    err = store_sum(store, cache, irecords, delays, weights, n, &result);
+    decode_cache_delete(cache);
     if (SUCCESS != err) {
         PyErr_SetString(st->error, store_error_names[err]);
         return NULL;
@@ -1738,7 +2014,7 @@ static PyObject* w_store_sum(PyObject *m, PyObject *args) {
 }
 
 static PyObject* w_store_sum_static(PyObject *m, PyObject *args) {
-    PyObject *capsule;
+    PyObject *capsule, *out_arr = Py_None;
     PyArrayObject *irecords_arr, *delays_arr, *weights_arr, *result_arr;
     store_t *store;
     gf_dtype *result;
@@ -1751,10 +2027,10 @@ static PyObject* w_store_sum_static(PyObject *m, PyObject *args) {
 
     struct module_state *st = GETSTATE(m);
 
-    if (!PyArg_ParseTuple(args, "OOOOiii", &capsule, &irecords_arr, &delays_arr,
-                                     &weights_arr, &it, &ntargets, &nthreads)) {
+    if (!PyArg_ParseTuple(args, "OOOOiii|O", &capsule, &irecords_arr, &delays_arr,
+                                     &weights_arr, &it, &ntargets, &nthreads, &out_arr)) {
         PyErr_SetString(st->error,
-            "usage: store_sum_static(cstore, irecords, delays, weights, it, ntargets, nthreads)");
+            "usage: store_sum_static(cstore, irecords, delays, weights, it, ntargets, nthreads[, out])");
 
         return NULL;
     }
@@ -1790,12 +2066,24 @@ static PyObject* w_store_sum_static(PyObject *m, PyObject *args) {
     delays = PyArray_DATA((PyArrayObject*)delays_arr);
     weights = PyArray_DATA((PyArrayObject*)weights_arr);
 
-    shape[0] = (npy_intp) ntargets;
-    result_arr = (PyArrayObject*) PyArray_ZEROS(1, shape, NPY_GFDTYPE, 0);
+    if (out_arr != Py_None) {
+        if (!good_array(out_arr, NPY_GFDTYPE, ntargets, 1, NULL)) {
+            return NULL;
+        }
+        result_arr = (PyArrayObject*) out_arr;
+        Py_INCREF(result_arr);
+        memset(PyArray_DATA(result_arr), 0, ntargets * sizeof(gf_dtype));
+    } else {
+        shape[0] = (npy_intp) ntargets;
+        result_arr = (PyArrayObject*) PyArray_ZEROS(1, shape, NPY_GFDTYPE, 0);
+    }
     result = PyArray_DATA(result_arr);
-    
+
+    Py_BEGIN_ALLOW_THREADS
     err = store_sum_static(store, irecords, delays, weights, it, ntargets, nsummands, nsources, nthreads, result);
+    Py_END_ALLOW_THREADS
     if (SUCCESS != err) {
+        Py_DECREF(result_arr);
         PyErr_SetString(st->error, store_error_names[err]);
         return NULL;
     }
@@ -1805,6 +2093,7 @@ static PyObject* w_store_sum_static(PyObject *m, PyObject *args) {
 
 static PyObject* w_make_sum_params(PyObject *m, PyObject *args) {
     PyObject *capsule, *source_coords_arr, *receiver_coords_arr, *ms_arr;
+    PyObject *out = Py_None, *out_item;
     float64_t *source_coords, *receiver_coords, *ms;
     npy_intp shape_want_coords[2] = {-1, 5};
     npy_intp shape_want_ms[2] = {-1, 6};
@@ -1826,11 +2115,11 @@ static PyObject* w_make_sum_params(PyObject *m, PyObject *args) {
     struct module_state *st = GETSTATE(m);
 
     if (!PyArg_ParseTuple(
-            args, "OOOOssI", &capsule, &source_coords_arr, &ms_arr,
+            args, "OOOOssI|O", &capsule, &source_coords_arr, &ms_arr,
             &receiver_coords_arr, &component_scheme_name, 
-            &interpolation_scheme_name, &nthreads)) {
+            &interpolation_scheme_name, &nthreads, &out)) {
         PyErr_SetString(st->error,
-            "usage: make_sum_params(cstore, source_coords, moment_tensors, receiver_coords, component_scheme, interpolation_name, nthreads)");
+            "usage: make_sum_params(cstore, source_coords, moment_tensors, receiver_coords, component_scheme, interpolation_name, nthreads[, out])");
         return NULL;
     }
 
@@ -1881,11 +2170,33 @@ static PyObject* w_make_sum_params(PyObject *m, PyObject *args) {
         vicinities_nip = mscheme->vicinity_nip;
     }
 
+    if (out != Py_None) {
+        if (!PyList_Check(out) || (size_t)PyList_Size(out) != cscheme->ncomponents) {
+            PyErr_SetString(st->error, "w_make_sum_params: out must be a list with one (weights, irecords) tuple per component");
+            return NULL;
+        }
+    }
+
     out_list = Py_BuildValue("[]");
     for (icomponent=0; icomponent<cscheme->ncomponents; icomponent++) {
         array_dims[0] = nsources * nreceivers * cscheme->nsummands[icomponent] * vicinities_nip;
-        weights_arr = (PyArrayObject*)PyArray_SimpleNew(1, array_dims, NPY_FLOAT32);
-        irecords_arr = (PyArrayObject*)PyArray_SimpleNew(1, array_dims, NPY_UINT64);
+        if (out != Py_None) {
+            /* reuse buffers given by the caller */
+            out_item = PyList_GetItem(out, icomponent);
+            if (!PyTuple_Check(out_item) || PyTuple_Size(out_item) != 2 ||
+                    !good_array(PyTuple_GetItem(out_item, 0), NPY_FLOAT32, array_dims[0], 1, NULL) ||
+                    !good_array(PyTuple_GetItem(out_item, 1), NPY_UINT64, array_dims[0], 1, NULL)) {
+                Py_DECREF(out_list);
+                return NULL;
+            }
+            weights_arr = (PyArrayObject*)PyTuple_GetItem(out_item, 0);
+            irecords_arr = (PyArrayObject*)PyTuple_GetItem(out_item, 1);
+            Py_INCREF(weights_arr);
+            Py_INCREF(irecords_arr);
+        } else {
+            weights_arr = (PyArrayObject*)PyArray_SimpleNew(1, array_dims, NPY_FLOAT32);
+            irecords_arr = (PyArrayObject*)PyArray_SimpleNew(1, array_dims, NPY_UINT64);
+        }
 
         weights[icomponent] = PyArray_DATA(weights_arr);
         irecords[icomponent] = PyArray_DATA(irecords_arr);
@@ -80,6 +80,7 @@ class SeismosizerTrace(Object):
 
 class SeismosizerResult(Object):
     n_records_stacked = Int.T(optional=True, default=1)
+    n_records_merged = Int.T(optional=True, default=0)
     t_stack = Float.T(optional=True, default=0.)
 
 
@@ -221,6 +222,17 @@ class StringID(StringPattern):
     pattern = r'^[A-Za-z][A-Za-z0-9._]{0,64}$'
 
 
+class StoreCompression(StringChoice):
+    '''
+    Compression of the GF store traces file.
+
+    ``zlib``: each record is delta encoded, byte shuffled and deflate
+    compressed. Encoding is lossless.
+    '''
+
+    choices = ['zlib']
+
+
 class ScopeType(StringChoice):
     choices = [
         'global',
@@ -495,6 +507,53 @@ class Timing(SObject):
         except spit.OutOfBounds:
             raise OutOfBounds(args)
 
+    def evaluate_many(self, get_phase_many, args):
+        '''
+        Vectorized version of :py:meth:`evaluate`.
+
+        :param get_phase_many: function returning a vectorized phase provider
+            for a given phase definition string, see
+            :py:meth:`pyrocko.gf.store.Store.get_phase_many`
+        :param args: indexing args, array of shape ``(n, nargs)``
+        :returns: array of shape ``(n,)`` with times, NaN where undefined
+        '''
+
+        args = num.asarray(args, dtype=num.float)
+        n = args.shape[0]
+
+        try:
+            if self.offset_is_slowness and self.offset != 0.0:
+                phase_offset = get_phase_many(
+                    'vel_surface:%g' % (1.0/self.offset))
+                offset = phase_offset(args)
+            else:
+                offset = self.offset
+
+            if self.phase_defs:
+                times = [
+                    get_phase_many(phase_def)(args)
+                    for phase_def in self.phase_defs]
+
+                if self.select == 'first':
+                    t = num.fmin.reduce(times, axis=0)
+                elif self.select == 'last':
+                    t = num.fmax.reduce(times, axis=0)
+                else:
+                    t = times[0].copy()
+                    for t_other in times[1:]:
+                        undefined = num.isnan(t)
+                        t[undefined] = t_other[undefined]
+
+                return t + offset
+
+            else:
+                t = num.empty(n, dtype=num.float)
+                t[:] = offset
+                return t
+
+        except spit.OutOfBounds:
+            raise OutOfBounds()
+
     phase_defs = List.T(String.T())
     offset = Float.T(default=0.0)
     offset_is_slowness = Bool.T(default=False)
@@ -585,10 +644,7 @@ class MultiLocation(Object):
         self._coords5 = None
         Object.__init__(self, *args, **kwargs)
 
-    @property
-    def coords5(self):
-        if self._coords5 is not None:
-            return self._coords5
+    def _coords_props(self):
         props = [self.lats, self.lons, self.north_shifts, self.east_shifts,
                  self.elevation]
         sizes = [p.size for p in props if p is not None]
@@ -597,18 +653,49 @@ class MultiLocation(Object):
         if num.unique(sizes).size != 1:
             raise AttributeError('Inconsistent coordinate sizes.')
 
-        self._coords5 = num.zeros((sizes[0], 5))
+        return props, sizes[0]
+
+    @property
+    def coords5(self):
+        if self._coords5 is not None:
+            return self._coords5
+
+        self._coords5 = self.get_coords5()
+        return self._coords5
+
+    def get_coords5(self, ia=0, ib=None):
+        '''
+        Get coordinates of a range of the locations.
+
+        Unlike :py:attr:`coords5`, the result is not cached, so that large
+        multi-locations can be processed in chunks without building the
+        full coordinate array.
+
+        :param ia: index of the first location
+        :param ib: index after the last location, ``None`` for all
+        :returns: ``(n, 5)`` array with lat, lon, north shift, east shift
+            and elevation of the locations
+        '''
+        if self._coords5 is not None:
+            return self._coords5[ia:ib]
+
+        props, n = self._coords_props()
+        ia, ib, _ = slice(ia, ib).indices(n)
+
+        coords = num.zeros((max(0, ib - ia), 5))
         for idx, p in enumerate(props):
             if p is not None:
-                self._coords5[:, idx] = p.flatten()
+                coords[:, idx] = p.ravel()[ia:ib]
 
-        return self._coords5
+        return coords
 
     @property
     def ncoords(self):
-        if self.coords5.shape[0] is None:
-            return 0
-        return int(self.coords5.shape[0])
+        if self._coords5 is not None:
+            return int(self._coords5.shape[0])
+
+        _, n = self._coords_props()
+        return int(n)
 
     def get_latlon(self):
         ''' Get all coordinates as lat lon
@@ -698,6 +785,10 @@ class DiscretizedSource(Object):
     east_shifts = Array.T(shape=(None,), dtype=num.float, optional=True)
     depths = Array.T(shape=(None,), dtype=num.float)
 
+    # name of the attribute holding the (linear) source terms, used by
+    # merged()
+    _source_terms_attribute = None
+
     @classmethod
     def check_scheme(cls, scheme):
         '''
@@ -846,6 +937,75 @@ class DiscretizedSource(Object):
     def nelements(self):
         return self.times.size
 
+    def merged(self, cell_size_parallel, cell_size_perpendicular, time_bin,
+               azimuth=0.0):
+        '''
+        Get copy with the point sources merged which share a grid cell.
+
+        The horizontal cells are aligned with ``azimuth`` [deg]. Their size is
+        ``cell_size_parallel`` [m] along the azimuth and
+        ``cell_size_perpendicular`` [m] perpendicular to it, the vertical cell
+        size is ``cell_size_parallel``. Point sources are only merged if
+        their times fall into the same bin of width ``time_bin`` [s].
+
+        The point sources of a cell are replaced by a single point source,
+        with the sum of their source terms. Its position and time are the
+        means of theirs, weighted by the norms of the source terms.
+
+        Sources with individual reference points (:py:attr:`lats`,
+        :py:attr:`lons`) and sources which do not support merging are
+        returned unchanged.
+        '''
+
+        name = self._source_terms_attribute
+        if name is None or self.lats is not None or self.lons is not None \
+                or self.nelements < 2:
+            return self
+
+        north_shifts = self.effective_north_shifts
+        east_shifts = self.effective_east_shifts
+
+        ca = math.cos(azimuth*d2r)
+        sa = math.sin(azimuth*d2r)
+
+        keys = num.floor(num.vstack((
+            (north_shifts*ca + east_shifts*sa) / cell_size_parallel,
+            (-north_shifts*sa + east_shifts*ca) / cell_size_perpendicular,
+            self.depths / cell_size_parallel,
+            self.times / time_bin)).T).astype(num.int64)
+
+        _, inverse = num.unique(keys, axis=0, return_inverse=True)
+        n = int(num.max(inverse)) + 1
+        if n == self.nelements:
+            return self
+
+        terms = getattr(self, name)
+        terms2 = terms.reshape((self.nelements, -1))
+
+        weights = num.sqrt(num.sum(terms2**2, axis=1))
+        weights_sum = num.bincount(inverse, weights, n)
+        zero = weights_sum == 0.0
+        if num.any(zero):
+            weights = num.where(zero[inverse], 1.0, weights)
+            weights_sum = num.bincount(inverse, weights, n)
+
+        def mean(values):
+            return num.bincount(inverse, weights*values, n) / weights_sum
+
+        terms_merged = num.zeros((n, terms2.shape[1]))
+        for i in range(terms2.shape[1]):
+            terms_merged[:, i] = num.bincount(inverse, terms2[:, i], n)
+
+        d = dict(self.T.inamevals(self))
+        d.update(
+            times=mean(self.times),
+            depths=mean(self.depths),
+            north_shifts=mean(north_shifts),
+            east_shifts=mean(east_shifts))
+
+        d[name] = terms_merged.reshape((n,) + terms.shape[1:])
+        return self.__class__(**d)
+
     @classmethod
     def combine(cls, sources, **kwargs):
         '''
@@ -899,6 +1059,16 @@ class DiscretizedSource(Object):
             north_shifts=north_shifts, east_shifts=east_shifts,
             depths=depths, **kwargs)
 
+    @property
+    def nbytes(self):
+        '''
+        Number of bytes occupied by the arrays of the discretized source.
+        '''
+
+        return sum(
+            v.nbytes for (_, v) in self.T.inamevals(self)
+            if isinstance(v, num.ndarray))
+
     def centroid_position(self):
         moments = self.moments()
         norm = num.sum(moments)
@@ -939,6 +1109,8 @@ class DiscretizedSource(Object):
 class DiscretizedExplosionSource(DiscretizedSource):
     m0s = Array.T(shape=(None,), dtype=num.float)
 
+    _source_terms_attribute = 'm0s'
+
     provided_schemes = (
         'elastic2',
         'elastic8',
@@ -1057,6 +1229,8 @@ class DiscretizedExplosionSource(DiscretizedSource):
 class DiscretizedSFSource(DiscretizedSource):
     forces = Array.T(shape=(None, 3), dtype=num.float)
 
+    _source_terms_attribute = 'forces'
+
     provided_schemes = (
         'elastic5',
     )
@@ -1148,6 +1322,8 @@ class DiscretizedMTSource(DiscretizedSource):
         shape=(None, 6), dtype=num.float,
         help='rows with (m_nn, m_ee, m_dd, m_ne, m_nd, m_ed)')
 
+    _source_terms_attribute = 'm6s'
+
     provided_schemes = (
         'elastic8',
         'elastic10',
@@ -1158,6 +1334,15 @@ class DiscretizedMTSource(DiscretizedSource):
         self.check_scheme(scheme)
         return self.m6s
 
+    def scaled(self, factor):
+        '''
+        Get copy of the discretized source with moment tensors scaled.
+        '''
+
+        d = dict(self.T.inamevals(self))
+        d['m6s'] = self.m6s * factor
+        return self.__class__(**d)
+
     def make_weights(self, receiver, scheme):
         self.check_scheme(scheme)
 
@@ -1277,6 +1462,8 @@ class DiscretizedMTSource(DiscretizedSource):
 class DiscretizedPorePressureSource(DiscretizedSource):
     pp = Array.T(shape=(None,), dtype=num.float)
 
+    _source_terms_attribute = 'pp'
+
     provided_schemes = (
         'poroelastic10',
     )
@@ -1441,6 +1628,7 @@ class Config(Object):
     component_scheme = ComponentScheme.T(default='elastic10')
     tabulated_phases = List.T(TPDef.T())
     ncomponents = Int.T(optional=True)
+    compression = StoreCompression.T(optional=True)
 
     def __init__(self, **kwargs):
         self._do_auto_updates = False
@@ -1493,6 +1681,40 @@ class Config(Object):
     def iter_nodes(self, level=None, minlevel=None):
         return nditer_outer(self.coords[minlevel:level])
 
+    def nodes(self, level=None, minlevel=None):
+        '''
+        Get all grid nodes as 2D array.
+
+        :returns: array of shape ``(nnodes, ndim)``, nodes ordered as with
+            :py:meth:`iter_nodes`
+        '''
+
+        coords = self.coords[minlevel:level]
+        grids = num.meshgrid(*coords, indexing='ij')
+        return num.array(
+            [grid.ravel() for grid in grids], dtype=num.float).T.copy()
+
+    def get_distances(self, args):
+        '''
+        Vectorized version of :py:meth:`get_distance`.
+
+        :param args: indexing args, array of shape ``(n, nargs)``
+        '''
+
+        return num.array(
+            [self.get_distance(tuple(x)) for x in args], dtype=num.float)
+
+    def get_surface_distances(self, args):
+        '''
+        Vectorized version of :py:meth:`get_surface_distance`.
+
+        :param args: indexing args, array of shape ``(n, nargs)``
+        '''
+
+        return num.array(
+            [self.get_surface_distance(tuple(x)) for x in args],
+            dtype=num.float)
+
     def iter_extraction(self, gdef, level=None):
         i = 0
         arrs = []
@@ -1617,6 +1839,12 @@ class ConfigTypeA(Config):
     def get_distance(self, args):
         return math.sqrt(args[0]**2 + args[1]**2)
 
+    def get_surface_distances(self, args):
+        return num.array(args[:, 1], dtype=num.float)
+
+    def get_distances(self, args):
+        return num.sqrt(args[:, 0]**2 + args[:, 1]**2)
+
     def get_source_depth(self, args):
         return args[0]
 
@@ -1792,6 +2020,12 @@ class ConfigTypeB(Config):
     def get_surface_distance(self, args):
         return args[2]
 
+    def get_distances(self, args):
+        return num.sqrt((args[:, 1] - args[:, 0])**2 + args[:, 2]**2)
+
+    def get_surface_distances(self, args):
+        return num.array(args[:, 2], dtype=num.float)
+
     def get_source_depth(self, args):
         return args[1]
 
@@ -6,7 +6,7 @@ from __future__ import absolute_import, division, print_function
 from builtins import range, map, zip
 from past.builtins import cmp
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from functools import cmp_to_key
 import time
 import math
@@ -14,6 +14,8 @@ import os
 import re
 import logging
 import resource
+import hashlib
+import struct
 
 import numpy as num
 
@@ -24,6 +26,7 @@ from pyrocko.guts_array import Array
 
 from pyrocko import moment_tensor as mt
 from pyrocko import trace, util, config, model
+from pyrocko.parimap import parimap
 from pyrocko.orthodrome import ne_to_latlon
 from pyrocko.model import Location
 
@@ -958,6 +961,101 @@ class Source(Location, Cloneable):
                 self.lon, self.east_shift, type(self).__name__) + \
             self.effective_stf_pre().base_key()
 
+    def discretization_key(self):
+        '''
+        Get key to decide if a discretized source can be reused.
+
+        Discretized sources are cached by the engine across requests. When
+        two source models return an equal key, the discretized sources differ
+        at most by the scaling given by :py:meth:`discretization_factor`.
+
+        By default, all parameters of the source model are included, except
+        origin time, name and the post-processing STF.
+        '''
+
+        return self._discretization_key()
+
+    def _discretization_key(self, exclude=()):
+        key = [type(self).__name__]
+        for (k, v) in self.T.inamevals(self):
+            if k in ('name', 'time', 'stf', 'stf_mode') or k in exclude:
+                continue
+
+            if isinstance(v, STF):
+                v = v.base_key()
+            elif isinstance(v, (list, num.ndarray)):
+                v = tuple(num.asarray(v).flat)
+
+            key.append(v)
+
+        return tuple(key) + self.effective_stf_pre().base_key()
+
+    def discretization_factor(self, store=None, target=None):
+        '''
+        Get the amplitude factor contained in the discretized source.
+
+        See :py:meth:`discretization_key`.
+        '''
+
+        return 1.0
+
+    def mt_basis_m6(self):
+        '''
+        Get weights of the elementary moment tensors for this source.
+
+        Point sources, which are discretized as a single moment tensor with
+        a source time function, return the six moment tensor components
+        used in :py:meth:`discretize_basesource`. Their base seismograms can
+        then be formed as a linear combination of the base seismograms of
+        six elementary moment tensor sources at the same location.
+
+        :returns: moment tensor components ``(mnn, mee, mdd, mne, mnd, med)``
+            as :py:class:`numpy.ndarray` or ``None`` if the source does not
+            support this.
+        '''
+
+        return None
+
+    def mt_basis_key(self):
+        '''
+        Get key to decide about sharing of elementary moment tensor stacks.
+
+        Sources returning an equal key differ only in their moment tensor
+        weights, see :py:meth:`mt_basis_m6`.
+
+        :returns: tuple or ``None`` if the source does not support this.
+        '''
+
+        if self.mt_basis_m6() is None:
+            return None
+
+        return ('mt_basis', self.depth, self.lat, self.north_shift,
+                self.lon, self.east_shift) + \
+            self.effective_stf_pre().base_key()
+
+    def mt_basis_sources(self):
+        '''
+        Get the six elementary moment tensor sources for this source.
+
+        See :py:meth:`mt_basis_m6`.
+        '''
+
+        sources = []
+        for i in range(6):
+            m6 = num.zeros(6)
+            m6[i] = 1.0
+            sources.append(MTSource(
+                lat=self.lat,
+                lon=self.lon,
+                north_shift=self.north_shift,
+                east_shift=self.east_shift,
+                depth=self.depth,
+                stf=self.stf,
+                stf_mode=self.stf_mode,
+                m6=m6))
+
+        return sources
+
     def get_timeshift(self):
         '''
         Get the timeshift to be applied during post-processing.
@@ -1437,6 +1535,10 @@ class DCSource(SourceWithMagnitude):
     def get_factor(self):
         return float(mt.magnitude_to_moment(self.magnitude))
 
+    def mt_basis_m6(self):
+        return mt.MomentTensor(
+            strike=self.strike, dip=self.dip, rake=self.rake).m6()
+
     def discretize_basesource(self, store, target=None):
         mot = mt.MomentTensor(strike=self.strike, dip=self.dip, rake=self.rake)
 
@@ -1511,6 +1613,9 @@ class CLVDSource(SourceWithMagnitude):
     def m6_astuple(self):
         return tuple(self.m6.tolist())
 
+    def mt_basis_m6(self):
+        return self.m6 / self.get_factor()
+
     def discretize_basesource(self, store, target=None):
         factor = self.get_factor()
         times, amplitudes = self.effective_stf_pre().discretize_t(
@@ -1585,6 +1690,9 @@ class MTSource(Source):
     def base_key(self):
         return Source.base_key(self) + self.m6_astuple
 
+    def mt_basis_m6(self):
+        return self.m6
+
     def discretize_basesource(self, store, target=None):
         times, amplitudes = self.effective_stf_pre().discretize_t(
             store.config.deltat, 0.0)
@@ -1707,6 +1815,19 @@ class RectangularSource(SourceWithDerivedMagnitude):
             self.decimation_factor,
             self.anchor)
 
+    def discretization_key(self):
+        if self.slip is not None:
+            return self._discretization_key()
+
+        # moment is contained in discretization_factor
+        return self._discretization_key(exclude=('magnitude',))
+
+    def discretization_factor(self, store=None, target=None):
+        if self.slip is not None:
+            return 1.0
+
+        return self.get_moment(store, target)
+
     def check_conflicts(self):
         if self.magnitude is not None and self.slip is not None:
             raise DerivedMagnitudeError(
@@ -2329,10 +2450,17 @@ class Request(Object):
     def has_statics(self):
         return True if len(self.targets_static) > 0 else False
 
-    def subsources_map(self):
+    def subsources_map(self, mt_basis=False):
         m = defaultdict(list)
         for source in self.sources:
-            m[source.base_key()].append(source)
+            key = None
+            if mt_basis:
+                key = source.mt_basis_key()
+
+            if key is None:
+                key = source.base_key()
+
+            m[key].append(source)
 
         return m
 
@@ -2343,8 +2471,16 @@ class Request(Object):
 
         return m
 
-    def subrequest_map(self):
-        ms = self.subsources_map()
+    def subrequest_map(self, mt_basis=False):
+        '''
+        Group sources and targets which can share processing.
+
+        If ``mt_basis`` is ``True``, point sources differing only in their
+        moment tensor are grouped together (see
+        :py:meth:`Source.mt_basis_key`).
+        '''
+
+        ms = self.subsources_map(mt_basis=mt_basis)
         mt = self.subtargets_map()
         m = {}
         for (ks, ls) in ms.items():
@@ -2373,6 +2509,15 @@ class ProcessingStats(Object):
     n_subrequests = Int.T(default=0)
     n_stores = Int.T(default=0)
     n_records_stacked = Int.T(default=0)
+    n_records_merged = Int.T(
+        default=0,
+        help='number of GF records saved by merging point sources, see '
+             ':py:meth:`LocalEngine.merged_basesource`. Counted before '
+             'identical records are combined by the summation optimization, '
+             'so the reduction of :py:attr:`n_records_stacked` may be '
+             'smaller.')
+    n_result_cache_hits = Int.T(default=0)
+    n_result_cache_misses = Int.T(default=0)
 
 
 class Response(Object):
@@ -2438,6 +2583,307 @@ class Response(Object):
         trace.snuffle(self.pyrocko_traces(), **kwargs)
 
 
+# binary representation of response chunks, see ResponseChunk.dump_binary
+# the last byte of the magic is the format version, it must be incremented
+# on any change of the layout (version 1 used b'GFRC')
+chunk_version = 2
+chunk_magic = b'GFR' + struct.pack('<B', chunk_version)
+chunk_header_fmt = '<4sI'
+chunk_header_size = struct.calcsize(chunk_header_fmt)
+chunk_trace_fmt = '<ddIIdIdI'
+
+CHUNK_RECORD_TRACE = 0
+CHUNK_RECORD_FAILURE = 1
+CHUNK_RECORD_YAML = 2
+
+
+class ResultFailure(Object):
+    '''
+    Failed computation of a source-target pair in a :py:class:`ResponseChunk`.
+    '''
+
+    isource = Int.T()
+    itarget = Int.T()
+    message = String.T()
+
+
+class ResponseChunk(Object):
+    '''
+    Part of a response, as streamed by the GF server.
+
+    Contains the results of an arbitrary subset of the source-target pairs of
+    a request. ``results[i]`` belongs to source ``isources[i]`` and target
+    ``itargets[i]`` of the request.
+    '''
+
+    isources = List.T(Int.T())
+    itargets = List.T(Int.T())
+    results = List.T(meta.SeismosizerResult.T())
+    failures = List.T(ResultFailure.T())
+
+    @classmethod
+    def from_results(cls, ii_results):
+        '''
+        Create chunk from ``(isource, itarget, result)`` tuples.
+
+        Results which are exceptions are converted to
+        :py:class:`ResultFailure` objects.
+        '''
+
+        chunk = cls()
+        for isource, itarget, result in ii_results:
+            if isinstance(result, Exception):
+                chunk.failures.append(ResultFailure(
+                    isource=isource, itarget=itarget, message=str(result)))
+            else:
+                chunk.isources.append(isource)
+                chunk.itargets.append(itarget)
+                chunk.results.append(result)
+
+        return chunk
+
+    def iter_results(self):
+        '''
+        Iterate over results as ``(isource, itarget, result)`` tuples.
+
+        Failures are yielded with an instance of :py:exc:`SeismosizerError`
+        as result.
+        '''
+
+        for x in zip(self.isources, self.itargets, self.results):
+            yield x
+
+        for failure in self.failures:
+            yield failure.isource, failure.itarget, \
+                SeismosizerError(failure.message)
+
+    def dump_binary(self):
+        '''
+        Get compact binary representation of the chunk.
+
+        Trace results are stored as raw little-endian samples with a small
+        fixed-size header, failures as their messages. Other results are
+        stored in YAML format.
+
+        :returns: bytes object, to be read with :py:meth:`iload_binary`
+        '''
+
+        parts = [struct.pack(
+            chunk_header_fmt, chunk_magic,
+            len(self.results) + len(self.failures))]
+
+        for isource, itarget, result in zip(
+                self.isources, self.itargets, self.results):
+
+            if type(result) is meta.Result and result.trace is not None:
+                tr = result.trace
+                data = num.asarray(tr.data, dtype='<f4')
+                parts.append(struct.pack(
+                    '<BII', CHUNK_RECORD_TRACE, isource, itarget))
+                for code in tr.codes:
+                    code = code.encode('utf-8')
+                    parts.append(struct.pack('<B', len(code)) + code)
+
+                parts.append(struct.pack(
+                    chunk_trace_fmt,
+                    tr.tmin, tr.deltat,
+                    result.n_records_stacked or 0,
+                    result.n_records_merged or 0,
+                    result.t_stack or 0.,
+                    result.n_shared_stacking or 0, result.t_optimize or 0.,
+                    data.size))
+
+                parts.append(data.tobytes())
+
+            else:
+                yaml = result.dump().encode('utf-8')
+                parts.append(struct.pack(
+                    '<BIII', CHUNK_RECORD_YAML, isource, itarget, len(yaml)))
+                parts.append(yaml)
+
+        for failure in self.failures:
+            message = failure.message.encode('utf-8')
+            parts.append(struct.pack(
+                '<BIII', CHUNK_RECORD_FAILURE, failure.isource,
+                failure.itarget, len(message)))
+            parts.append(message)
+
+        return b''.join(parts)
+
+    @classmethod
+    def iload_binary(cls, stream):
+        '''
+        Read chunks in binary representation from a file-like object.
+
+        Generator yielding :py:class:`ResponseChunk` objects, until the end
+        of the stream is reached.
+        '''
+
+        def read(n):
+            data = []
+            while n > 0:
+                d = stream.read(n)
+                if not d:
+                    raise SeismosizerError('Unexpected end of stream.')
+                data.append(d)
+                n -= len(d)
+
+            return b''.join(data)
+
+        def unpack(fmt):
+            return struct.unpack(fmt, read(struct.calcsize(fmt)))
+
+        while True:
+            header = stream.read(chunk_header_size)
+            if not header:
+                break
+
+            if len(header) < chunk_header_size:
+                header += read(chunk_header_size - len(header))
+
+            magic, nrecords = struct.unpack(chunk_header_fmt, header)
+            if magic != chunk_magic:
+                if magic[:3] != chunk_magic[:3]:
+                    raise SeismosizerError('Invalid response chunk.')
+
+                version = 1 if magic == b'GFRC' \
+                    else struct.unpack('<B', magic[3:])[0]
+
+                raise SeismosizerError(
+                    'Incompatible response chunk format version %i, '
+                    'expected version %i. Client and server versions '
+                    'differ.' % (version, chunk_version))
+
+            chunk = cls()
+            for irecord in range(nrecords):
+                kind, isource, itarget = unpack('<BII')
+                if kind == CHUNK_RECORD_TRACE:
+                    codes = []
+                    for i in range(4):
+                        n, = unpack('<B')
+                        codes.append(read(n).decode('utf-8'))
+
+                    tmin, deltat, n_records_stacked, n_records_merged, \
+                        t_stack, n_shared_stacking, t_optimize, nsamples = \
+                        unpack(chunk_trace_fmt)
+
+                    data = num.frombuffer(
+                        read(nsamples * 4), dtype='<f4').astype(num.float32)
+
+                    result = meta.Result(
+                        trace=meta.SeismosizerTrace(
+                            codes=tuple(codes),
+                            data=data,
+                            deltat=deltat,
+                            tmin=tmin),
+                        n_records_stacked=n_records_stacked,
+                        n_records_merged=n_records_merged,
+                        t_stack=t_stack,
+                        n_shared_stacking=n_shared_stacking,
+                        t_optimize=t_optimize)
+
+                else:
+                    n, = unpack('<I')
+                    payload = read(n).decode('utf-8')
+                    if kind == CHUNK_RECORD_YAML:
+                        result = meta.load(string=payload)
+                    elif kind == CHUNK_RECORD_FAILURE:
+                        chunk.failures.append(ResultFailure(
+                            isource=isource, itarget=itarget,
+                            message=payload))
+                        continue
+                    else:
+                        raise SeismosizerError('Invalid response chunk.')
+
+                chunk.isources.append(isource)
+                chunk.itargets.append(itarget)
+                chunk.results.append(result)
+
+            yield chunk
+
+
+class ArrayResponse(object):
+    '''
+    Synthetic seismograms of a request, stored in one contiguous array.
+
+    Returned by :py:meth:`LocalEngine.process_array`. Sample ``k`` of the
+    seismogram for source ``isource`` and target ``itarget`` is at time
+    ``tmins[isource, itarget] + k * deltat``. Beyond
+    ``nsamples[isource, itarget]``, rows are padded with their last sample
+    value. Where the computation failed, ``nsamples`` is zero, ``tmins`` is
+    ``NaN`` and the exception is kept in :py:attr:`errors`.
+
+    .. py:attribute:: data
+
+        ``(nsources, ntargets, nsamples)`` :py:class:`numpy.ndarray` of type
+        ``float32`` with the samples
+
+    .. py:attribute:: tmins
+
+        ``(nsources, ntargets)`` array with the times of the first samples
+
+    .. py:attribute:: nsamples
+
+        ``(nsources, ntargets)`` array with the number of computed samples
+
+    .. py:attribute:: deltat
+
+        sampling interval shared by all seismograms
+
+    .. py:attribute:: errors
+
+        dict with exceptions, keyed by ``(isource, itarget)``
+    '''
+
+    def __init__(self, request, data, tmins, nsamples, deltat, errors=None):
+        self.request = request
+        self.data = data
+        self.tmins = tmins
+        self.nsamples = nsamples
+        self.deltat = deltat
+        self.errors = errors or {}
+
+    def trace(self, isource, itarget):
+        '''
+        Get one seismogram as :py:class:`~pyrocko.trace.Trace` object.
+
+        The returned trace holds a copy of the samples.
+        '''
+
+        if (isource, itarget) in self.errors:
+            raise self.errors[isource, itarget]
+
+        c = self.request.targets[itarget].codes
+        n = self.nsamples[isource, itarget]
+        return trace.Trace(
+            c[0], c[1], c[2], c[3],
+            ydata=self.data[isource, itarget, :n].copy(),
+            deltat=self.deltat,
+            tmin=float(self.tmins[isource, itarget]))
+
+    def pyrocko_traces(self):
+        '''
+        Return a list of :class:`~pyrocko.trace.Trace` instances.
+
+        Failed computations are skipped.
+        '''
+
+        traces = []
+        for isource in range(self.data.shape[0]):
+            for itarget in range(self.data.shape[1]):
+                if (isource, itarget) not in self.errors:
+                    traces.append(self.trace(isource, itarget))
+
+        return traces
+
+    def snuffle(self, **kwargs):
+        '''
+        Open *snuffler* with requested traces.
+        '''
+
+        trace.snuffle(self.pyrocko_traces(), **kwargs)
+
+
 class Engine(Object):
     '''
     Base class for synthetic seismogram calculators.
@@ -2577,69 +3023,83 @@ class OutOfBoundsContext(Object):
     components = List.T(String.T())
 
 
-def process_subrequest_dynamic(work, pshared=None):
-    engine = pshared['engine']
-    _, _, isources, itargets = work
+def process_dynamic(work, psources, ptargets, engine, nthreads=0,
+                    mt_basis=False, raw=False, stf_fft=False,
+                    nsubrequests_per_batch_max=64):
 
-    sources = [pshared['sources'][isource] for isource in isources]
-    targets = [pshared['targets'][itarget] for itarget in itargets]
+    '''
+    Process dynamic subrequests in the calling process.
 
-    components = set()
-    for target in targets:
-        rule = engine.get_rule(sources[0], target)
-        components.update(rule.required_components(target))
+    Results are yielded as soon as each batch of at most
+    ``nsubrequests_per_batch_max`` subrequests sharing the same sources is
+    processed, so memory use is bounded for requests with many targets.
+    '''
 
-    try:
-        base_seismogram, tcounters = engine.base_seismogram(
-            sources[0],
-            targets[0],
-            components,
-            pshared['dsource_cache'])
-
-    except meta.OutOfBounds as e:
-        e.context = OutOfBoundsContext(
-            source=sources[0],
-            target=targets[0],
-            distance=sources[0].distance_to(targets[0]),
-            components=components)
-        raise
+    dsource_cache = engine.dsource_cache
 
-    n_records_stacked = 0
-    t_optimize = 0.0
-    t_stack = 0.0
-    for _, tr in base_seismogram.items():
-        n_records_stacked += tr.n_records_stacked
-        t_optimize += tr.t_optimize
-        t_stack += tr.t_stack
+    for works in iter_work_batches(work, nsubrequests_per_batch_max):
+        for x in process_subrequests_dynamic(
+                works, psources, ptargets, engine, dsource_cache, nthreads,
+                mt_basis, raw, stf_fft):
 
-    results = []
-    for isource, source in zip(isources, sources):
-        for itarget, target in zip(itargets, targets):
-            try:
-                result = engine._post_process_dynamic(
-                    base_seismogram, source, target)
-                result.n_records_stacked = n_records_stacked
-                result.n_shared_stacking = len(sources) * len(targets)
-                result.t_optimize = t_optimize
-                result.t_stack = t_stack
+            yield x
 
-            except SeismosizerError as e:
-                result = e
 
-            results.append((isource, itarget, result))
+def iter_work_batches(work, nsubrequests_max=64):
+    '''
+    Group consecutive subrequests sharing the same set of sources.
+
+    The base seismograms of all subrequests of a batch are held in memory
+    together, so batches are limited to ``nsubrequests_max`` subrequests.
+    '''
 
-    tcounters.append(xtime())
+    batch = []
+    for w in work:
+        if batch and (
+                batch[-1][2] != w[2] or len(batch) >= nsubrequests_max):
 
-    return results, tcounters
+            yield batch
+            batch = []
 
+        batch.append(w)
 
-def process_dynamic(work, psources, ptargets, engine, nthreads=0):
-    dsource_cache = {}
+    if batch:
+        yield batch
 
-    for w in work:
-        _, _, isources, itargets = w
 
-        sources = [psources[isource] for isource in isources]
+def process_subrequests_dynamic(
+        works, psources, ptargets, engine, dsource_cache, nthreads=0,
+        mt_basis=False, raw=False, stf_fft=False):
+
+    '''
+    Process dynamic subrequests sharing the same set of sources.
+
+    Targets within a subrequest share their location, so one base seismogram
+    per source and subrequest is computed. The base seismograms of all
+    subrequests are computed together with
+    :py:meth:`LocalEngine.base_seismograms`.
+
+    If ``mt_basis`` is ``True`` and the sources differ only in their moment
+    tensor, the base seismograms of the six elementary moment tensors are
+    computed once and the base seismogram of each source is formed as their
+    linear combination.
+
+    If ``stf_fft`` is ``True`` and the sources share their base seismogram
+    (e.g. they differ only in origin time, amplitude or source time
+    function), the base seismograms are computed only once and the source
+    time functions of all sources are applied in the frequency domain (see
+    :py:meth:`LocalEngine._post_process_dynamic_raw_stf_fft`).
+
+    If ``raw`` is ``True``, results are yielded as tuples ``(tmin, deltat,
+    data)`` instead of :py:class:`pyrocko.gf.meta.Result` objects.
+    '''
+
+    _, _, isources, _ = works[0]
+    sources = [psources[isource] for isource in isources]
+
+    subrequests = []
+    for w in works:
+        _, _, _, itargets = w
         targets = [ptargets[itarget] for itarget in itargets]
 
         components = set()
@@ -2647,42 +3107,328 @@ def process_dynamic(work, psources, ptargets, engine, nthreads=0):
             rule = engine.get_rule(sources[0], target)
             components.update(rule.required_components(target))
 
-        for isource, source in zip(isources, sources):
-            for itarget, target in zip(itargets, targets):
+        subrequests.append((itargets, targets, components))
 
-                try:
-                    base_seismogram, tcounters = engine.base_seismogram(
-                        source, target, components, dsource_cache, nthreads)
-                except meta.OutOfBounds as e:
-                    e.context = OutOfBoundsContext(
-                        source=sources[0],
-                        target=targets[0],
-                        distance=sources[0].distance_to(targets[0]),
-                        components=components)
-                    raise
+    subrequests = [x for x in subrequests if x[1]]
+    if not subrequests:
+        return
+
+    nresults = sum(len(targets) for (_, targets, _) in subrequests)
+
+    use_mt_basis = mt_basis and len(sources) > 6 and all(
+        source.mt_basis_key() is not None for source in sources)
+
+    if use_mt_basis:
+        basis_seismogramss = []
+        tbasis = 0.0
+        for basis_source in sources[0].mt_basis_sources():
+            basis_seismograms, tcounters = base_seismograms_checked(
+                engine, basis_source, subrequests, dsource_cache, nthreads)
+
+            basis_seismogramss.append(basis_seismograms)
+            tbasis += num.diff(tcounters)
+
+        tbasis /= nresults * len(sources)
+
+    elif stf_fft and len(sources) > 1 and len(set(
+            source.base_key() for source in sources)) == 1:
+
+        for x in process_subrequests_dynamic_stf_fft(
+                isources, sources, subrequests, engine, dsource_cache,
+                nthreads, raw):
+            yield x
+
+        return
 
-                n_records_stacked = 0
-                t_optimize = 0.0
-                t_stack = 0.0
+    for isource, source in zip(isources, sources):
+        if use_mt_basis:
+            t0 = xtime()
+            m6 = source.mt_basis_m6()
+            base_seismograms = [
+                combine_mt_basis(
+                    [basis_seismograms[i]
+                     for basis_seismograms in basis_seismogramss],
+                    m6)
+                for i in range(len(subrequests))]
+
+            tshared = tbasis.copy()
+            tshared[2] += (xtime() - t0) / nresults
+
+        else:
+            base_seismograms, tcounters = base_seismograms_checked(
+                engine, source, subrequests, dsource_cache, nthreads)
+
+            tshared = num.diff(tcounters) / nresults
 
-                for _, tr in base_seismogram.items():
-                    n_records_stacked += tr.n_records_stacked
-                    t_optimize += tr.t_optimize
-                    t_stack += tr.t_stack
+        for (itargets, targets, _), base_seismogram in zip(
+                subrequests, base_seismograms):
 
+            n_records_stacked = 0
+            n_records_merged = 0
+            t_optimize = 0.0
+            t_stack = 0.0
+
+            for _, tr in base_seismogram.items():
+                n_records_stacked += tr.n_records_stacked
+                n_records_merged += tr.n_records_merged
+                t_optimize += tr.t_optimize
+                t_stack += tr.t_stack
+
+            for itarget, target in zip(itargets, targets):
+                t0 = xtime()
                 try:
-                    result = engine._post_process_dynamic(
-                        base_seismogram, source, target)
-                    result.n_records_stacked = n_records_stacked
-                    result.n_shared_stacking = len(sources) *\
-                        len(targets)
-                    result.t_optimize = t_optimize
-                    result.t_stack = t_stack
+                    if raw:
+                        result = engine._post_process_dynamic_raw(
+                            base_seismogram, source, target)
+                    else:
+                        result = engine._post_process_dynamic(
+                            base_seismogram, source, target)
+                        result.n_records_stacked = n_records_stacked
+                        result.n_records_merged = int(n_records_merged)
+                        result.n_shared_stacking = len(targets)
+                        result.t_optimize = t_optimize
+                        result.t_stack = t_stack
                 except SeismosizerError as e:
                     result = e
 
-                tcounters.append(xtime())
-                yield (isource, itarget, result), tcounters
+                tcounters_result = num.zeros(tshared.size + 2)
+                tcounters_result[1:-1] = num.cumsum(tshared)
+                tcounters_result[-1] = tcounters_result[-2] + xtime() - t0
+
+                yield (isource, itarget, result), tcounters_result
+
+
+def process_subrequests_dynamic_stf_fft(
+        isources, sources, subrequests, engine, dsource_cache, nthreads,
+        raw):
+
+    '''
+    Process dynamic subrequests for sources sharing their base seismogram.
+
+    Helper of :py:func:`process_subrequests_dynamic`.
+    '''
+
+    nresults = sum(len(targets) for (_, targets, _) in subrequests)
+
+    base_seismograms, tcounters = base_seismograms_checked(
+        engine, sources[0], subrequests, dsource_cache, nthreads)
+
+    tshared = num.diff(tcounters) / (nresults * len(sources))
+
+    for (itargets, targets, _), base_seismogram in zip(
+            subrequests, base_seismograms):
+
+        n_records_stacked = 0
+        n_records_merged = 0
+        t_optimize = 0.0
+        t_stack = 0.0
+
+        for _, tr in base_seismogram.items():
+            n_records_stacked += tr.n_records_stacked
+            n_records_merged += tr.n_records_merged
+            t_optimize += tr.t_optimize
+            t_stack += tr.t_stack
+
+        for itarget, target in zip(itargets, targets):
+            t0 = xtime()
+            try:
+                raw_results = engine._post_process_dynamic_raw_stf_fft(
+                    base_seismogram, sources, target)
+
+            except SeismosizerError as e:
+                raw_results = [e] * len(sources)
+
+            tpost = (xtime() - t0) / len(sources)
+
+            for isource, source, raw_result in zip(
+                    isources, sources, raw_results):
+
+                t0 = xtime()
+                if raw or isinstance(raw_result, SeismosizerError):
+                    result = raw_result
+                else:
+                    try:
+                        result = engine._dynamic_result(
+                            raw_result, source, target)
+                        result.n_records_stacked = n_records_stacked
+                        result.n_records_merged = int(n_records_merged)
+                        result.n_shared_stacking = len(targets) * len(sources)
+                        result.t_optimize = t_optimize
+                        result.t_stack = t_stack
+                    except SeismosizerError as e:
+                        result = e
+
+                tcounters_result = num.zeros(tshared.size + 2)
+                tcounters_result[1:-1] = num.cumsum(tshared)
+                tcounters_result[-1] = tcounters_result[-2] + tpost \
+                    + xtime() - t0
+
+                yield (isource, itarget, result), tcounters_result
+
+
+def base_seismograms_checked(
+        engine, source, subrequests, dsource_cache, nthreads):
+
+    '''
+    Compute base seismograms of one source for a set of subrequests.
+
+    On :py:exc:`pyrocko.gf.meta.OutOfBounds`, the offending target is
+    identified and attached to the exception as context.
+    '''
+
+    try:
+        return engine.base_seismograms(
+            source,
+            [targets[0] for (_, targets, _) in subrequests],
+            [components for (_, _, components) in subrequests],
+            dsource_cache, nthreads)
+
+    except meta.OutOfBounds:
+        # find out which target is causing the problem
+        for (_, targets, components) in subrequests:
+            try:
+                engine.base_seismogram(
+                    source, targets[0], components, dsource_cache,
+                    nthreads)
+
+            except meta.OutOfBounds as e:
+                e.context = OutOfBoundsContext(
+                    source=source,
+                    target=targets[0],
+                    distance=source.distance_to(targets[0]),
+                    components=components)
+                raise
+
+        raise
+
+
+def combine_mt_basis(basis_seismograms, m6):
+    '''
+    Linear combination of elementary moment tensor base seismograms.
+
+    :param basis_seismograms: list of six base seismograms (dicts of
+        :py:class:`pyrocko.gf.store.GFTrace` objects, keyed by component)
+    :param m6: weights of the six elementary moment tensors
+    :returns: base seismogram as dict of
+        :py:class:`pyrocko.gf.store.GFTrace` objects
+    '''
+
+    components = list(basis_seismograms[0].keys())
+
+    aligned = store.make_same_span(dict(
+        ((i, component), basis_seismogram[component])
+        for (i, basis_seismogram) in enumerate(basis_seismograms)
+        for component in components))
+
+    base_seismogram = {}
+    for component in components:
+        trs = [aligned[i, component] for i in range(len(basis_seismograms))]
+        if all(tr.is_zero for tr in trs):
+            base_seismogram[component] = store.Zero
+            continue
+
+        tr0 = [tr for tr in trs if not tr.is_zero][0]
+        data = num.zeros(tr0.data.size, dtype=store.gf_dtype)
+        for weight, tr in zip(m6, trs):
+            if weight != 0.0 and not tr.is_zero:
+                data += weight * tr.data
+
+        tr_combined = store.GFTrace(data, tr0.itmin, tr0.deltat)
+        for tr in trs:
+            tr_combined.n_records_stacked += tr.n_records_stacked
+            tr_combined.n_records_merged += tr.n_records_merged
+            tr_combined.t_optimize += tr.t_optimize
+            tr_combined.t_stack += tr.t_stack
+
+        base_seismogram[component] = tr_combined
+
+    return base_seismogram
+
+
+def process_subrequest_dynamic(works, pshared=None):
+    '''
+    Process a chunk of dynamic subrequests in a worker process.
+
+    To be used with :py:func:`pyrocko.parimap.parimap`. The engine, the
+    request's sources and targets and the engine's discretized source cache
+    are passed in ``pshared``, which is inherited by the worker processes
+    through ``fork()``, together with the stores already opened by the
+    parent process.
+    '''
+
+    results = []
+    for works_batch in iter_work_batches(works):
+        results.extend(process_subrequests_dynamic(
+            works_batch,
+            pshared['sources'],
+            pshared['targets'],
+            pshared['engine'],
+            pshared['dsource_cache'],
+            pshared['nthreads'],
+            pshared['mt_basis'],
+            pshared['raw'],
+            pshared['stf_fft']))
+
+    return results
+
+
+def filter_work_cached(work, cached):
+    '''
+    Remove sources and targets from work items whose results are all cached.
+    '''
+
+    work_filtered = []
+    for (i, nsub, isources, itargets) in work:
+        isources_miss = [
+            isource for isource in isources
+            if any((isource, itarget) not in cached for itarget in itargets)]
+
+        itargets_miss = [
+            itarget for itarget in itargets
+            if any((isource, itarget) not in cached for isource in isources)]
+
+        if isources_miss and itargets_miss:
+            work_filtered.append((i, nsub, isources_miss, itargets_miss))
+
+    return work_filtered
+
+
+def process_dynamic_multiproc(work, psources, ptargets, engine, nprocs,
+                              nthreads=1, nchunks_per_proc=4,
+                              mt_basis=False, nsubrequests_per_chunk_max=64,
+                              raw=False, stf_fft=False):
+
+    '''
+    Process dynamic subrequests in a pool of worker processes.
+
+    The subrequests are partitioned into contiguous chunks of at most
+    ``nsubrequests_per_chunk_max`` subrequests, which are distributed over
+    ``nprocs`` worker processes. Results are yielded in the same order as
+    with :py:func:`process_dynamic`. New chunks are only handed out to the
+    workers as results are consumed.
+    '''
+
+    nchunks = max(1, min(len(work), nprocs * nchunks_per_proc))
+    chunksize = min(
+        int(math.ceil(len(work) / float(nchunks))), nsubrequests_per_chunk_max)
+    chunks = [work[i:i+chunksize] for i in range(0, len(work), chunksize)]
+
+    pshared = dict(
+        engine=engine,
+        sources=psources,
+        targets=ptargets,
+        dsource_cache=engine.dsource_cache,
+        nthreads=nthreads,
+        mt_basis=mt_basis,
+        raw=raw,
+        stf_fft=stf_fft)
+
+    for results in parimap(
+            process_subrequest_dynamic, chunks,
+            pshared=pshared, nprocs=nprocs):
+
+        for x in results:
+            yield x
 
 
 def process_static(work, psources, ptargets, engine, nthreads=0):
@@ -2714,7 +3460,287 @@ def process_static(work, psources, ptargets, engine, nthreads=0):
                 yield (isource, itarget, result), tcounters
 
 
-class LocalEngine(Engine):
+class DiscretizedSourceCache(object):
+    '''
+    Memory-bounded LRU cache of discretized sources.
+
+    Discretized sources are looked up by the store directory, the target's
+    interpolation setting and :py:meth:`Source.discretization_key`. When the
+    total size of the cached sources exceeds ``nbytes_max``, the least
+    recently used entries are evicted.
+
+    :param nbytes_max: byte budget of the cache
+    '''
+
+    def __init__(self, nbytes_max=100*1024**2):
+        self.nbytes_max = nbytes_max
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, source, store, target):
+        if target is not None:
+            interpolation = target.interpolation
+        else:
+            interpolation = None
+
+        return (store.store_dir, interpolation) + source.discretization_key()
+
+    def get(self, source, store, target=None):
+        '''
+        Get discretized source, discretizing it if it is not in the cache.
+        '''
+
+        key = self._key(source, store, target)
+        factor = source.discretization_factor(store, target)
+
+        if key in self._entries:
+            self.n_hits += 1
+            dsource, factor_cached = self._entries.pop(key)
+            self._entries[key] = dsource, factor_cached
+
+            if factor != factor_cached:
+                dsource = dsource.scaled(factor / factor_cached)
+
+            return dsource
+
+        self.n_misses += 1
+        dsource = source.discretize_basesource(store, target)
+        nbytes = dsource.nbytes
+        if nbytes <= self.nbytes_max:
+            self._entries[key] = dsource, factor
+            self.nbytes += nbytes
+            self._shrink()
+
+        return dsource
+
+    def _shrink(self):
+        while self.nbytes > self.nbytes_max and self._entries:
+            _, (dsource, _) = self._entries.popitem(last=False)
+            self.nbytes -= dsource.nbytes
+            self.n_evictions += 1
+
+    def set_nbytes_max(self, nbytes_max):
+        '''
+        Change the byte budget, evicting entries if needed.
+        '''
+
+        self.nbytes_max = nbytes_max
+        self._shrink()
+
+    def invalidate(self, store_dir=None):
+        '''
+        Remove cached discretized sources.
+
+        :param store_dir: if given, only remove the entries belonging to the
+            store in this directory
+        '''
+
+        for key in list(self._entries.keys()):
+            if store_dir is None or key[0] == store_dir:
+                dsource, _ = self._entries.pop(key)
+                self.nbytes -= dsource.nbytes
+
+    def stats(self):
+        '''
+        Get cache statistics as a dict.
+        '''
+
+        return dict(
+            nentries=len(self._entries),
+            nbytes=self.nbytes,
+            nbytes_max=self.nbytes_max,
+            n_hits=self.n_hits,
+            n_misses=self.n_misses,
+            n_evictions=self.n_evictions)
+
+
+class ResultCache(object):
+    '''
+    Content-addressed on-disk cache for results of :py:class:`LocalEngine`.
+
+    Results are looked up by a hash of the serialized source and target, of
+    the ID and modification time of the GF store and of the point source
+    merging tolerance of the engine. Traces and static
+    results are stored in NumPy ``.npz`` files below ``cache_dir``. When the
+    total size of the cache exceeds ``nbytes_max``, the least recently used
+    files are removed.
+
+    Only results of type :py:class:`pyrocko.gf.meta.Result` and
+    :py:class:`pyrocko.gf.meta.StaticResult` are cached.
+
+    :param cache_dir: directory where the cached results are stored
+    :param nbytes_max: byte budget of the cache
+    '''
+
+    def __init__(self, cache_dir, nbytes_max=10*1024**3):
+        self.cache_dir = cache_dir
+        self.nbytes_max = nbytes_max
+        self._nbytes = None
+        self.n_hits = 0
+        self.n_misses = 0
+
+    def source_hash(self, source, merge_tolerance=None):
+        s = source.dump()
+        if merge_tolerance is not None:
+            s += 'merge_tolerance %s' % repr(merge_tolerance)
+
+        return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+    def target_hash(self, target, store):
+        try:
+            mtime = os.stat(store.data_fn()).st_mtime
+        except OSError:
+            mtime = None
+
+        return hashlib.sha1(
+            (target.dump() + '%s %s' % (store.config.id, mtime)).encode(
+                'utf-8')).hexdigest()
+
+    def _path(self, source_hash, target_hash):
+        key = hashlib.sha1(
+            (source_hash + target_hash).encode('ascii')).hexdigest()
+
+        return pjoin(self.cache_dir, key[:2], key[2:] + '.npz')
+
+    def get(self, source_hash, target_hash):
+        '''
+        Get cached result or ``None`` if it is not available.
+        '''
+
+        fn = self._path(source_hash, target_hash)
+        try:
+            with open(fn, 'rb') as f:
+                d = num.load(f)
+                kind = str(d['kind'])
+                if kind == 'trace':
+                    result = meta.Result(
+                        trace=meta.SeismosizerTrace(
+                            codes=tuple(str(x) for x in d['codes']),
+                            data=d['data'],
+                            deltat=float(d['deltat']),
+                            tmin=float(d['tmin'])),
+                        n_records_stacked=0)
+                else:
+                    result = meta.StaticResult(
+                        result=dict(
+                            (k[len('result.'):], d[k]) for k in d.files
+                            if k.startswith('result.')),
+                        n_records_stacked=0)
+
+            os.utime(fn, None)
+
+        except (IOError, OSError, KeyError, ValueError):
+            self.n_misses += 1
+            return None
+
+        self.n_hits += 1
+        return result
+
+    def put(self, source_hash, target_hash, result):
+        '''
+        Put result into the cache.
+        '''
+
+        if type(result) is meta.Result and result.trace is not None:
+            tr = result.trace
+            d = dict(
+                kind='trace',
+                codes=num.array(tr.codes),
+                data=tr.data,
+                deltat=tr.deltat,
+                tmin=tr.tmin)
+
+        elif type(result) is meta.StaticResult:
+            d = dict(kind='static')
+            for k, v in result.result.items():
+                d['result.' + k] = v
+
+        else:
+            return
+
+        fn = self._path(source_hash, target_hash)
+        util.ensuredirs(fn)
+        fn_temp = fn + '.%i.temp' % os.getpid()
+        with open(fn_temp, 'wb') as f:
+            num.savez(f, **d)
+
+        os.rename(fn_temp, fn)
+
+        self._nbytes = self.nbytes + os.stat(fn).st_size
+        if self._nbytes > self.nbytes_max:
+            self.shrink()
+
+    def _iter_files(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        for dn in os.listdir(self.cache_dir):
+            dpath = pjoin(self.cache_dir, dn)
+            if not os.path.isdir(dpath):
+                continue
+
+            for fn in os.listdir(dpath):
+                if fn.endswith('.npz'):
+                    yield pjoin(dpath, fn)
+
+    @property
+    def nbytes(self):
+        '''
+        Total size of the cached results.
+        '''
+
+        if self._nbytes is None:
+            self._nbytes = sum(
+                os.stat(fn).st_size for fn in self._iter_files())
+
+        return self._nbytes
+
+    def shrink(self, nbytes_max=None):
+        '''
+        Remove least recently used results until size is below budget.
+        '''
+
+        if nbytes_max is None:
+            nbytes_max = self.nbytes_max
+
+        files = []
+        for fn in self._iter_files():
+            try:
+                st = os.stat(fn)
+                files.append((st.st_mtime, st.st_size, fn))
+            except OSError:
+                pass
+
+        files.sort()
+        nbytes = sum(size for (_, size, _) in files)
+        for (_, size, fn) in files:
+            if nbytes <= nbytes_max:
+                break
+
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+
+            nbytes -= size
+
+        self._nbytes = nbytes
+
+    def clear(self):
+        '''
+        Remove all cached results.
+        '''
+
+        self.shrink(0)
+
+
+class LocalEngine(Engine):
     '''
     Offline synthetic seismogram calculator.
 
@@ -2723,6 +3749,20 @@ class LocalEngine(Engine):
         GF_STORE_SUPERDIRS AND GF_STORE_DIRS
     :param use_config: if ``True``, fill :py:attr:`store_superdirs` and
         :py:attr:`store_dirs` with paths set in the user's config file.
+    :param dsource_cache_nbytes: byte budget of the cache of discretized
+        sources kept between requests (see :py:attr:`dsource_cache`).
+    :param result_cache_dir: if given, cache results on disk in this
+        directory (see :py:class:`ResultCache`).
+    :param result_cache_nbytes: byte budget of the on-disk result cache.
+    :param statics_nbytes_max: memory budget for the summation weights of
+        static targets. Targets with many locations are processed in chunks
+        to stay within this budget (see
+        :py:meth:`pyrocko.gf.store.Store.statics`).
+    :param merge_tolerance: if given, point sources of discretized extended
+        sources are merged for dynamic targets at larger distances (see
+        :py:meth:`merged_basesource`). The value is the tolerated error in
+        arrival time of the merged point sources, in units of the GF store's
+        sampling interval, e.g. ``0.25``.
     '''
 
     store_superdirs = List.T(
@@ -2741,6 +3781,14 @@ class LocalEngine(Engine):
     def __init__(self, **kwargs):
         use_env = kwargs.pop('use_env', False)
         use_config = kwargs.pop('use_config', False)
+        dsource_cache_nbytes = kwargs.pop(
+            'dsource_cache_nbytes', 100*1024**2)
+        result_cache_dir = kwargs.pop('result_cache_dir', None)
+        result_cache_nbytes = kwargs.pop(
+            'result_cache_nbytes', 10*1024**3)
+        statics_nbytes_max = kwargs.pop(
+            'statics_nbytes_max', store.g_statics_nbytes_max)
+        merge_tolerance = kwargs.pop('merge_tolerance', None)
         Engine.__init__(self, **kwargs)
         if use_env:
             env_store_superdirs = os.environ.get('GF_STORE_SUPERDIRS', '')
@@ -2760,6 +3808,35 @@ class LocalEngine(Engine):
         self._id_to_store_dir = {}
         self._open_stores = {}
         self._effective_default_store_id = None
+        self._dsource_cache = DiscretizedSourceCache(dsource_cache_nbytes)
+        self._statics_nbytes_max = statics_nbytes_max
+        self.merge_tolerance = merge_tolerance
+        self._merge_velocities = {}
+        if result_cache_dir is not None:
+            self._result_cache = ResultCache(
+                result_cache_dir, result_cache_nbytes)
+        else:
+            self._result_cache = None
+
+    @property
+    def dsource_cache(self):
+        '''
+        Cache of discretized sources, kept between requests.
+
+        :returns: :py:class:`DiscretizedSourceCache` object
+        '''
+
+        return self._dsource_cache
+
+    @property
+    def result_cache(self):
+        '''
+        On-disk result cache or ``None`` if result caching is disabled.
+
+        :returns: :py:class:`ResultCache` object or ``None``
+        '''
+
+        return self._result_cache
 
     def _check_store_dirs_type(self):
         for sdir in ['store_dirs', 'store_superdirs']:
@@ -2883,6 +3960,8 @@ class LocalEngine(Engine):
         for store_id in store_ids:
             self._open_stores.pop(store_id)
 
+        self._dsource_cache.invalidate()
+
     def get_rule(self, source, target):
         store_ = self.get_store(target.store_id)
         cprovided = source.provided_components(store_.config.component_scheme)
@@ -2911,10 +3990,102 @@ class LocalEngine(Engine):
                 source.__class__.__name__))
 
     def _cached_discretize_basesource(self, source, store, cache, target):
-        if (source, store) not in cache:
-            cache[source, store] = source.discretize_basesource(store, target)
+        return cache.get(source, store, target)
+
+    def _get_merge_velocity(self, store_):
+        store_id = store_.config.id
+        if store_id not in self._merge_velocities:
+            mod = store_.config.earthmodel_1d
+            v = None
+            if mod is not None:
+                vs = mod.profile('vs')
+                vs = vs[vs > 0.0]
+                if vs.size:
+                    v = float(num.min(vs))
+
+            self._merge_velocities[store_id] = v
+
+        return self._merge_velocities[store_id]
+
+    def merged_basesource(self, base_source, store_, receiver, cache=None):
+        '''
+        Merge point sources of discretized source for a distant receiver.
+
+        With :py:attr:`merge_tolerance` set, neighboring point sources of a
+        discretized source are replaced by single point sources (see
+        :py:meth:`pyrocko.gf.meta.DiscretizedSource.merged`), such that the
+        arrival times of the merged point sources at the receiver change by
+        no more than approximately ``merge_tolerance`` times the sampling
+        interval of the GF store.
+
+        With ``v`` the lowest S-wave velocity of the store's earth model and
+        ``dt`` the tolerated time error, the cells used for merging are
+        ``v * dt`` wide along the direction to the receiver and in depth.
+        Perpendicular to it, where travel times vary only to second order,
+        they are ``sqrt(2 * r * v * dt)`` wide, but at most eight times the
+        parallel width, where ``r`` is the distance to the nearest point
+        source. Merged sources are computed per distance band (powers of two)
+        and azimuth sector, so they can be shared between targets.
+
+        :param cache: optional dict, to share merged sources between
+            receivers
+        :returns: merged discretized source, or ``base_source`` if merging is
+            disabled or not applicable
+        '''
 
-        return cache[source, store]
+        tolerance = self.merge_tolerance
+        if tolerance is None or base_source.nelements < 2:
+            return base_source
+
+        v = self._get_merge_velocity(store_)
+        if v is None:
+            return base_source
+
+        dt = tolerance * store_.config.deltat
+        size_parallel = v * dt
+
+        rmin = float(num.min(base_source.distances_to(receiver)))
+        if rmin <= size_parallel:
+            return base_source
+
+        rband = 2.0**math.floor(math.log(rmin, 2.0))
+        size_perpendicular = min(
+            math.sqrt(2.0 * rband * size_parallel), 8.0 * size_parallel)
+
+        # sector width such that misalignment of the cells adds at most half
+        # the parallel cell size
+        nsectors = int(math.ceil(
+            2.0 * math.pi * size_perpendicular / size_parallel))
+
+        azis, _ = base_source.azibazis_to(receiver)
+        azi = math.atan2(
+            num.mean(num.sin(azis*d2r)), num.mean(num.cos(azis*d2r)))
+
+        isector = int(round(azi / (2.0 * math.pi) * nsectors)) % nsectors
+        key = (store_.config.id, rband, isector)
+
+        if cache is not None and key in cache:
+            return cache[key]
+
+        merged = base_source.merged(
+            size_parallel, size_perpendicular, dt,
+            azimuth=isector * 360. / nsectors)
+
+        if cache is not None:
+            cache[key] = merged
+
+        return merged
+
+    def _count_merged(self, base_seismogram, base_source, merged_source):
+        if merged_source is base_source:
+            return
+
+        # counted before the store's summation optimization, where the number
+        # of records is proportional to the number of point sources
+        ratio = float(base_source.nelements) / merged_source.nelements
+        for tr in base_seismogram.values():
+            if not tr.is_zero:
+                tr.n_records_merged = tr.n_records_requested * (ratio - 1.0)
 
     def base_seismogram(self, source, target, components, dsource_cache,
                         nthreads):
@@ -2943,14 +4114,18 @@ class LocalEngine(Engine):
         else:
             deltat = None
 
+        merged_source = self.merged_basesource(base_source, store_, receiver)
+
         base_seismogram = store_.seismogram(
-            base_source, receiver, components,
+            merged_source, receiver, components,
             deltat=deltat,
             itmin=itmin, nsamples=nsamples,
             interpolation=target.interpolation,
             optimization=target.optimization,
             nthreads=nthreads)
 
+        self._count_merged(base_seismogram, base_source, merged_source)
+
         tcounters.append(xtime())
 
         base_seismogram = store.make_same_span(base_seismogram)
@@ -2959,6 +4134,124 @@ class LocalEngine(Engine):
 
         return base_seismogram, tcounters
 
+    def base_seismograms(self, source, targets, componentss, dsource_cache,
+                         nthreads):
+
+        '''
+        Compute base seismograms of one source for many targets.
+
+        Targets using the same store, sampling rate, interpolation and
+        optimization settings and requiring the same components are handled
+        in a single call to :py:meth:`pyrocko.gf.store.Store.seismograms`.
+
+        :returns: list of base seismograms, one for each target, and time
+            counters
+        '''
+
+        tcounters = [xtime()]
+
+        groups = defaultdict(list)
+        for itarget, (target, components) in enumerate(
+                zip(targets, componentss)):
+
+            key = (target.store_id, target.sample_rate, target.interpolation,
+                   target.optimization, tuple(sorted(components)))
+
+            groups[key].append(itarget)
+
+        stores = {}
+        receivers = []
+        spans = []
+        for target in targets:
+            if target.store_id not in stores:
+                stores[target.store_id] = self.get_store(target.store_id)
+
+            store_ = stores[target.store_id]
+            receivers.append(target.receiver(store_))
+
+            if target.tmin and target.tmax is not None:
+                n_f = store_.config.sample_rate
+                itmin = int(num.floor(target.tmin * n_f))
+                nsamples = int(num.ceil((target.tmax - target.tmin) * n_f))
+            else:
+                itmin = None
+                nsamples = None
+
+            spans.append((itmin, nsamples))
+
+        tcounters.append(xtime())
+
+        base_sources = {}
+        for key, itargets in groups.items():
+            store_id = key[0]
+            if store_id not in base_sources:
+                base_sources[store_id] = self._cached_discretize_basesource(
+                    source, stores[store_id], dsource_cache,
+                    targets[itargets[0]])
+
+        tcounters.append(xtime())
+
+        # split groups by merged source
+        if self.merge_tolerance is not None:
+            merge_cache = {}
+            groups_merged = defaultdict(list)
+            for key, itargets in groups.items():
+                store_id = key[0]
+                for itarget in itargets:
+                    merged_source = self.merged_basesource(
+                        base_sources[store_id], stores[store_id],
+                        receivers[itarget], merge_cache)
+
+                    groups_merged[key, id(merged_source)].append(
+                        (itarget, merged_source))
+
+            groups_sources = [
+                (key, [x[0] for x in v], v[0][1])
+                for ((key, _), v) in groups_merged.items()]
+
+        else:
+            groups_sources = [
+                (key, itargets, base_sources[key[0]])
+                for (key, itargets) in groups.items()]
+
+        base_seismograms = [None] * len(targets)
+        for key, itargets, merged_source in groups_sources:
+            store_id, sample_rate, interpolation, optimization, components = \
+                key
+
+            if sample_rate is not None:
+                deltat = 1./sample_rate
+            else:
+                deltat = None
+
+            for itarget, base_seismogram in zip(
+                    itargets,
+                    stores[store_id].seismograms(
+                        merged_source,
+                        [receivers[i] for i in itargets],
+                        components,
+                        deltat=deltat,
+                        itmins=[spans[i][0] for i in itargets],
+                        nsamples=[spans[i][1] for i in itargets],
+                        interpolation=interpolation,
+                        optimization=optimization,
+                        nthreads=nthreads)):
+
+                self._count_merged(
+                    base_seismogram, base_sources[store_id], merged_source)
+
+                base_seismograms[itarget] = base_seismogram
+
+        tcounters.append(xtime())
+
+        base_seismograms = [
+            store.make_same_span(base_seismogram)
+            for base_seismogram in base_seismograms]
+
+        tcounters.append(xtime())
+
+        return base_seismograms, tcounters
+
     def base_statics(self, source, target, components, nthreads):
         tcounters = [xtime()]
         store_ = self.get_store(target.store_id)
@@ -2971,7 +4264,8 @@ class LocalEngine(Engine):
             itsnapshot = 1
         tcounters.append(xtime())
 
-        base_source = source.discretize_basesource(store_, target=target)
+        base_source = self._cached_discretize_basesource(
+            source, store_, self._dsource_cache, target)
 
         tcounters.append(xtime())
 
@@ -2981,13 +4275,30 @@ class LocalEngine(Engine):
             itsnapshot,
             components,
             target.interpolation,
-            nthreads)
+            nthreads,
+            nbytes_max=self._statics_nbytes_max)
 
         tcounters.append(xtime())
 
         return base_statics, tcounters
 
     def _post_process_dynamic(self, base_seismogram, source, target):
+        return self._dynamic_result(
+            self._post_process_dynamic_raw(base_seismogram, source, target),
+            source, target)
+
+    def _dynamic_result(self, raw_result, source, target):
+        tmin, deltat, data = raw_result
+
+        tr = meta.SeismosizerTrace(
+            codes=target.codes,
+            data=data,
+            deltat=deltat,
+            tmin=tmin)
+
+        return target.post_process(self, source, tr)
+
+    def _post_process_dynamic_raw(self, base_seismogram, source, target):
         deltat = list(base_seismogram.values())[0].deltat
 
         rule = self.get_rule(source, target)
@@ -3012,13 +4323,64 @@ class LocalEngine(Engine):
 
         tmin = itmin * deltat + times[0]
 
-        tr = meta.SeismosizerTrace(
-            codes=target.codes,
-            data=data[:-amplitudes.size],
-            deltat=deltat,
-            tmin=tmin)
+        return tmin, deltat, data[:-amplitudes.size]
 
-        return target.post_process(self, source, tr)
+    def _post_process_dynamic_raw_stf_fft(
+            self, base_seismogram, sources, target):
+
+        '''
+        Post-process a base seismogram shared by many sources.
+
+        Equivalent to calling :py:meth:`_post_process_dynamic_raw` for each
+        source, but the rule is applied only once and the source time
+        functions of all sources are applied in the frequency domain, in one
+        batched FFT. The sources must share their base seismogram, i.e. have
+        equal :py:meth:`Source.base_key`.
+
+        :returns: list of tuples ``(tmin, deltat, data)``, one for each source
+        '''
+
+        deltat = list(base_seismogram.values())[0].deltat
+
+        rule = self.get_rule(sources[0], target)
+        data = rule.apply_(target, base_seismogram)
+        itmin = list(base_seismogram.values())[0].itmin
+
+        stfs = [
+            source.effective_stf_post().discretize_t(
+                deltat, source.get_timeshift())
+            for source in sources]
+
+        nstf_max = max(amplitudes.size for (_, amplitudes) in stfs)
+
+        # repeat end point to prevent boundary effects, common padding is
+        # long enough for all source time functions
+        padded_data = num.empty(data.size + nstf_max, dtype=num.float)
+        padded_data[:data.size] = data
+        padded_data[data.size:] = data[-1]
+
+        nfft = trace.nextpow2(padded_data.size + nstf_max - 1)
+
+        target_factor = target.get_factor()
+        kernels = num.zeros((len(sources), nfft), dtype=num.float)
+        for isource, (source, (_, amplitudes)) in enumerate(
+                zip(sources, stfs)):
+
+            kernels[isource, :amplitudes.size] = amplitudes \
+                * (source.get_factor() * target_factor)
+
+        conv = num.fft.irfft(
+            num.fft.rfft(kernels, nfft, axis=1)
+            * num.fft.rfft(padded_data, nfft)[num.newaxis, :],
+            nfft, axis=1)
+
+        results = []
+        for isource, (times, amplitudes) in enumerate(stfs):
+            tmin = itmin * deltat + times[0]
+            nsamples = data.size + amplitudes.size - 1
+            results.append((tmin, deltat, conv[isource, :nsamples]))
+
+        return results
 
     def _post_process_statics(self, base_statics, source, starget):
         rule = self.get_rule(source, starget)
@@ -3031,22 +4393,7 @@ class LocalEngine(Engine):
 
         return starget.post_process(self, source, base_statics)
 
-    def process(self, *args, **kwargs):
-        '''
-        Process a request.
-
-        ::
-
-            process(**kwargs)
-            process(request, **kwargs)
-            process(sources, targets, **kwargs)
-
-        The request can be given a a :py:class:`Request` object, or such an
-        object is created using ``Request(**kwargs)`` for convenience.
-
-        :returns: :py:class:`Response` object
-        '''
-
+    def _process_args(self, args, kwargs):
         if len(args) not in (0, 1, 2):
             raise BadRequest('invalid arguments')
 
@@ -3057,45 +4404,105 @@ class LocalEngine(Engine):
             kwargs.update(Request.args2kwargs(args))
 
         request = kwargs.pop('request', None)
-        status_callback = kwargs.pop('status_callback', None)
-
-        nprocs = kwargs.pop('nprocs', None)
-        nthreads = kwargs.pop('nthreads', 1)
-        if nprocs:
-            nthreads = nprocs
+        options = dict(
+            status_callback=kwargs.pop('status_callback', None),
+            nprocs=kwargs.pop('nprocs', None),
+            nthreads=kwargs.pop('nthreads', None),
+            mt_basis=kwargs.pop('mt_basis', False),
+            stf_fft=kwargs.pop('stf_fft', False))
 
         if request is None:
             request = Request(**kwargs)
 
-        rs0 = resource.getrusage(resource.RUSAGE_SELF)
-        rc0 = resource.getrusage(resource.RUSAGE_CHILDREN)
-        tt0 = xtime()
+        return request, options
+
+    def _iter_process(self, request, status_callback=None, nprocs=None,
+                      nthreads=None, mt_basis=False, raw=False,
+                      stf_fft=False):
+
+        '''
+        Generator of results with their origin and time counters.
+
+        Yields tuples ``((isource, itarget, result), kind, tcounters)``,
+        where ``kind`` is one of ``'cached'``, ``'dynamic'`` and ``'static'``
+        and ``tcounters`` are the time differences of the processing stages
+        (``None`` for cached results).
+
+        If ``raw`` is ``True``, computed dynamic results are yielded as tuples
+        ``(tmin, deltat, data)``, see :py:meth:`process_array`.
+        '''
+
+        # unless given explicitly, use one thread per worker process, and
+        # nprocs threads where no worker processes are used
+        nthreads_worker = nthreads if nthreads is not None else 1
+        if nthreads is None:
+            nthreads = nprocs or 1
 
         # make sure stores are open before fork()
         store_ids = set(target.store_id for target in request.targets)
         for store_id in store_ids:
-            self.get_store(store_id)
+            self.get_store(store_id).open()
 
         source_index = dict((x, i) for (i, x) in
                             enumerate(request.sources))
         target_index = dict((x, i) for (i, x) in
                             enumerate(request.targets))
 
-        m = request.subrequest_map()
+        m = request.subrequest_map(mt_basis=mt_basis)
 
         skeys = sorted(m.keys(), key=cmp_to_key(cmp_none_aware))
-        results_list = []
 
-        for i in range(len(request.sources)):
-            results_list.append([None] * len(request.targets))
-
-        tcounters_dyn_list = []
-        tcounters_static_list = []
         nsub = len(skeys)
         isub = 0
 
-        # Processing dynamic targets through
-        # parimap(process_subrequest_dynamic)
+        result_cache = self._result_cache
+        cached = set()
+        if result_cache is not None:
+            source_hashes = [
+                result_cache.source_hash(source, self.merge_tolerance)
+                for source in request.sources]
+            target_hashes = [
+                result_cache.target_hash(target, self.get_store(
+                    target.store_id))
+                for target in request.targets]
+
+            for isource in range(len(request.sources)):
+                for itarget in range(len(request.targets)):
+                    result = result_cache.get(
+                        source_hashes[isource], target_hashes[itarget])
+
+                    if result is not None:
+                        cached.add((isource, itarget))
+                        yield (isource, itarget, result), 'cached', None
+
+        def computed(iter_results, kind):
+            for ii_results, tcounters in iter_results:
+                isource, itarget, result = ii_results
+
+                # work items filtered for cached results may still include
+                # some cached pairs
+                if (isource, itarget) in cached:
+                    continue
+
+                if result_cache is not None:
+                    if isinstance(result, tuple):
+                        tmin, deltat, data = result
+                        result_cache.put(
+                            source_hashes[isource], target_hashes[itarget],
+                            meta.Result(trace=meta.SeismosizerTrace(
+                                codes=request.targets[itarget].codes,
+                                data=data,
+                                deltat=deltat,
+                                tmin=tmin)))
+                    else:
+                        result_cache.put(
+                            source_hashes[isource], target_hashes[itarget],
+                            result)
+
+                yield ii_results, kind, num.diff(tcounters)
+
+        # Processing dynamic targets through process_dynamic or, with
+        # nprocs > 1, through parimap(process_subrequest_dynamic)
         if request.has_dynamic:
             work_dynamic = [
                 (i, nsub,
@@ -3104,13 +4511,27 @@ class LocalEngine(Engine):
                   if not isinstance(target, StaticTarget)])
                 for (i, k) in enumerate(skeys)]
 
-            for ii_results, tcounters_dyn in process_dynamic(
-              work_dynamic, request.sources, request.targets, self,
-              nthreads=nthreads):
+            if cached:
+                work_dynamic = filter_work_cached(work_dynamic, cached)
+
+            if nprocs is not None and nprocs > 1:
+                iter_dynamic = process_dynamic_multiproc(
+                    work_dynamic, request.sources, request.targets, self,
+                    nprocs=nprocs,
+                    nthreads=nthreads_worker,
+                    mt_basis=mt_basis,
+                    raw=raw,
+                    stf_fft=stf_fft)
+            else:
+                iter_dynamic = process_dynamic(
+                    work_dynamic, request.sources, request.targets, self,
+                    nthreads=nthreads,
+                    mt_basis=mt_basis,
+                    raw=raw,
+                    stf_fft=stf_fft)
 
-                tcounters_dyn_list.append(num.diff(tcounters_dyn))
-                isource, itarget, result = ii_results
-                results_list[isource][itarget] = result
+            for x in computed(iter_dynamic, 'dynamic'):
+                yield x
 
                 if status_callback:
                     status_callback(isub, nsub)
@@ -3126,13 +4547,15 @@ class LocalEngine(Engine):
                   if isinstance(target, StaticTarget)])
                 for (i, k) in enumerate(skeys)]
 
-            for ii_results, tcounters_static in process_static(
-              work_static, request.sources, request.targets, self,
-              nthreads=nthreads):
+            if cached:
+                work_static = filter_work_cached(work_static, cached)
 
-                tcounters_static_list.append(num.diff(tcounters_static))
-                isource, itarget, result = ii_results
-                results_list[isource][itarget] = result
+            iter_static = process_static(
+                work_static, request.sources, request.targets, self,
+                nthreads=nthreads)
+
+            for x in computed(iter_static, 'static'):
+                yield x
 
                 if status_callback:
                     status_callback(isub, nsub)
@@ -3142,13 +4565,103 @@ class LocalEngine(Engine):
         if status_callback:
             status_callback(nsub, nsub)
 
+    def iter_process(self, *args, **kwargs):
+        '''
+        Process a request, yielding results as soon as they are available.
+
+        ::
+
+            iter_process(**kwargs)
+            iter_process(request, **kwargs)
+            iter_process(sources, targets, **kwargs)
+
+        Takes the same arguments as :py:meth:`process`. Instead of collecting
+        all results in a :py:class:`Response` object, tuples ``(isource,
+        itarget, result)`` are yielded in the order in which they are
+        computed. Computation proceeds only as far as the consumer requests
+        results, so that large requests can be processed with bounded memory,
+        e.g. to write traces to disk or to reduce misfits on the fly.
+
+        Results of failed computations are yielded as exception objects, as
+        in :py:attr:`Response.results_list`.
+        '''
+
+        request, options = self._process_args(args, kwargs)
+        for ii_results, _, _ in self._iter_process(request, **options):
+            yield ii_results
+
+    def process(self, *args, **kwargs):
+        '''
+        Process a request.
+
+        ::
+
+            process(**kwargs)
+            process(request, **kwargs)
+            process(sources, targets, **kwargs)
+
+        The request can be given a a :py:class:`Request` object, or such an
+        object is created using ``Request(**kwargs)`` for convenience.
+
+        If ``nprocs`` is larger than one, dynamic targets are processed in a
+        pool of ``nprocs`` worker processes, sharing the stores opened before
+        the workers are forked. ``nthreads`` controls the number of threads
+        used within each worker.
+
+        If ``mt_basis`` is ``True``, point sources which differ only in their
+        moment tensor (e.g. in a moment tensor grid search) are processed
+        together: the seismograms of the six elementary moment tensors are
+        computed once per target and the result for each source is formed as
+        their linear combination.
+
+        If ``stf_fft`` is ``True``, sources which differ only in origin time,
+        amplitude or post-processing source time function (e.g. in a sweep
+        over the duration or shape of the STF) are processed together: the
+        Green's functions are stacked only once per target and the source
+        time functions of all sources are applied in the frequency domain, in
+        one batched FFT.
+
+        See :py:meth:`iter_process` for processing of large requests with
+        bounded memory.
+
+        :returns: :py:class:`Response` object
+        '''
+
+        request, options = self._process_args(args, kwargs)
+
+        rs0 = resource.getrusage(resource.RUSAGE_SELF)
+        rc0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        tt0 = xtime()
+
+        results_list = []
+
+        for i in range(len(request.sources)):
+            results_list.append([None] * len(request.targets))
+
+        tcounters_dyn_list = []
+        tcounters_static_list = []
+        n_result_cache_hits = 0
+
+        for ii_results, kind, tcounters in self._iter_process(
+                request, **options):
+
+            isource, itarget, result = ii_results
+            results_list[isource][itarget] = result
+
+            if kind == 'dynamic':
+                tcounters_dyn_list.append(tcounters)
+            elif kind == 'static':
+                tcounters_static_list.append(tcounters)
+            else:
+                n_result_cache_hits += 1
+
         tt1 = time.time()
         rs1 = resource.getrusage(resource.RUSAGE_SELF)
         rc1 = resource.getrusage(resource.RUSAGE_CHILDREN)
 
         s = ProcessingStats()
 
-        if request.has_dynamic:
+        if tcounters_dyn_list:
             tcumu_dyn = num.sum(num.vstack(tcounters_dyn_list), axis=0)
             t_dyn = float(num.sum(tcumu_dyn))
             perc_dyn = map(float, tcumu_dyn/t_dyn * 100.)
@@ -3160,7 +4673,7 @@ class LocalEngine(Engine):
         else:
             t_dyn = 0.
 
-        if request.has_statics:
+        if tcounters_static_list:
             tcumu_static = num.sum(num.vstack(tcounters_static_list), axis=0)
             t_static = num.sum(tcumu_static)
             perc_static = map(float, tcumu_static/t_static * 100.)
@@ -3178,15 +4691,24 @@ class LocalEngine(Engine):
             (rs0.ru_inblock + rc0.ru_inblock))
 
         n_records_stacked = 0.
+        n_records_merged = 0.
         for results in results_list:
             for result in results:
                 if not isinstance(result, meta.Result):
                     continue
                 shr = float(result.n_shared_stacking)
                 n_records_stacked += result.n_records_stacked / shr
+                n_records_merged += (result.n_records_merged or 0) / shr
                 s.t_perc_optimize += result.t_optimize / shr
                 s.t_perc_stack += result.t_stack / shr
         s.n_records_stacked = int(n_records_stacked)
+        s.n_records_merged = int(round(n_records_merged))
+        if self._result_cache is not None:
+            s.n_result_cache_hits = n_result_cache_hits
+            s.n_result_cache_misses = \
+                len(request.sources) * len(request.targets) \
+                - n_result_cache_hits
+
         if t_dyn != 0.:
             s.t_perc_optimize /= t_dyn * 100
             s.t_perc_stack /= t_dyn * 100
@@ -3196,21 +4718,264 @@ class LocalEngine(Engine):
             results_list=results_list,
             stats=s)
 
+    def process_array(self, *args, **kwargs):
+        '''
+        Process a request, storing all seismograms in one contiguous array.
+
+        ::
+
+            process_array(**kwargs)
+            process_array(request, **kwargs)
+            process_array(sources, targets, **kwargs)
+
+        Takes the same arguments as :py:meth:`process` and additionally
+        ``nsamples``, the length of the sample axis. Longer seismograms are
+        truncated. If not given, the sample axis grows to the length of the
+        longest seismogram.
+
+        The post-processed samples of each source-target pair are written
+        directly into the output array, without creating
+        :py:class:`~pyrocko.gf.meta.Result` or trace objects. Conversion to
+        :py:class:`~pyrocko.trace.Trace` objects is done on demand with
+        :py:meth:`ArrayResponse.trace`. This reduces memory usage and
+        overhead for requests with many small seismograms, e.g. in
+        inversions.
+
+        All targets must be dynamic targets and their seismograms must share
+        a common sampling interval.
+
+        :returns: :py:class:`ArrayResponse` object
+        '''
+
+        nsamples_fixed = kwargs.pop('nsamples', None)
+        request, options = self._process_args(args, kwargs)
+
+        if request.has_statics:
+            raise BadRequest(
+                'Array output is only available for dynamic targets.')
+
+        nsources = len(request.sources)
+        ntargets = len(request.targets)
+
+        data = num.zeros(
+            (nsources, ntargets, nsamples_fixed or 0), dtype=num.float32)
+        tmins = num.full((nsources, ntargets), num.nan)
+        nsamples = num.zeros((nsources, ntargets), dtype=int)
+        deltat = None
+        errors = {}
+
+        for (isource, itarget, result), _, _ in self._iter_process(
+                request, raw=True, **options):
+
+            if isinstance(result, meta.Result):
+                tr = result.trace
+                result = (tr.tmin, tr.deltat, tr.data)
+
+            elif not isinstance(result, tuple):
+                errors[isource, itarget] = result
+                continue
+
+            tmin, deltat_this, data_this = result
+
+            if deltat is None:
+                deltat = deltat_this
+            elif abs(deltat - deltat_this) > 1e-6 * deltat:
+                raise BadRequest(
+                    'Array output requires a common sampling interval for '
+                    'all targets.')
+
+            n = data_this.size
+            if nsamples_fixed is not None:
+                n = min(n, nsamples_fixed)
+
+            elif n > data.shape[2]:
+                data_new = num.zeros(
+                    (nsources, ntargets, max(n, data.shape[2] * 2)),
+                    dtype=num.float32)
+                data_new[:, :, :data.shape[2]] = data
+                data = data_new
+
+            data[isource, itarget, :n] = data_this[:n]
+            tmins[isource, itarget] = tmin
+            nsamples[isource, itarget] = n
+
+        if nsamples_fixed is None:
+            data = num.ascontiguousarray(
+                data[:, :, :num.max(nsamples, initial=0)])
+
+        for isource in range(nsources):
+            for itarget in range(ntargets):
+                n = nsamples[isource, itarget]
+                if 0 < n < data.shape[2]:
+                    data[isource, itarget, n:] = data[isource, itarget, n-1]
+
+        return ArrayResponse(
+            request=request,
+            data=data,
+            tmins=tmins,
+            nsamples=nsamples,
+            deltat=deltat,
+            errors=errors)
+
 
 class RemoteEngine(Engine):
     '''
     Client for remote synthetic seismogram calculator.
+
+    Requests are split into batches of at most :py:attr:`nresults_per_batch`
+    source-target pairs, which are sent to the server in parallel over a
+    pool of persistent connections. Results are transferred in compact
+    binary form and reassembled into one :py:class:`Response`.
     '''
 
     site = String.T(default=ws.g_default_site, optional=True)
     url = String.T(default=ws.g_url, optional=True)
+    nparallel = Int.T(
+        default=4,
+        help='number of batches processed in parallel, i.e. number of '
+             'concurrent connections to the server')
+    nresults_per_batch = Int.T(
+        default=1000,
+        help='maximum number of source-target pairs per batch')
+    nretries = Int.T(
+        default=10,
+        help='number of retries when the server rejects a batch because of '
+             'too many concurrent requests')
+
+    def __init__(self, **kwargs):
+        Engine.__init__(self, **kwargs)
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            import requests
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=self.nparallel)
+
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+
+        return self._session
+
+    def close(self):
+        '''
+        Close the connections to the server.
+        '''
+
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def iter_batches(self, request):
+        '''
+        Split request into batches.
+
+        :returns: generator yielding ``(isource_min, isource_max),
+            (itarget_min, itarget_max)`` index ranges of the batches
+        '''
+
+        nsources = len(request.sources)
+        ntargets = len(request.targets)
+        nresults = max(1, self.nresults_per_batch)
+
+        ntargets_batch = min(ntargets, nresults)
+        nsources_batch = max(1, nresults // max(1, ntargets_batch))
+
+        for isource_min in range(0, nsources, nsources_batch):
+            for itarget_min in range(0, ntargets, ntargets_batch):
+                yield (
+                    (isource_min, min(isource_min+nsources_batch, nsources)),
+                    (itarget_min, min(itarget_min+ntargets_batch, ntargets)))
+
+    def _process_batch(self, request, batch):
+        import requests
+
+        (isource_min, isource_max), (itarget_min, itarget_max) = batch
+        subrequest = Request(
+            sources=request.sources[isource_min:isource_max],
+            targets=request.targets[itarget_min:itarget_max])
+
+        for iretry in range(self.nretries + 1):
+            try:
+                results = []
+                for chunk in ws.seismosizer_stream(
+                        url=self.url, site=self.site, request=subrequest,
+                        format='binary', session=self._get_session()):
+
+                    for isource, itarget, result in chunk.iter_results():
+                        results.append(
+                            (isource_min + isource, itarget_min + itarget,
+                             result))
+
+                return results
+
+            except requests.HTTPError as e:
+                code = e.response.status_code
+                if code == 400:
+                    raise BadRequest(
+                        'Request rejected by server: %s' % e.response.reason)
+
+                if code != 429 or iretry == self.nretries:
+                    raise
+
+                time.sleep(min(0.05 * 2**iretry, 2.0))
 
     def process(self, request=None, status_callback=None, **kwargs):
+        '''
+        Process a request on the server.
+
+        ::
+
+            process(**kwargs)
+            process(request, **kwargs)
+
+        :returns: :py:class:`Response` object
+        '''
+
+        from multiprocessing.pool import ThreadPool
 
         if request is None:
             request = Request(**kwargs)
 
-        return ws.seismosizer(url=self.url, site=self.site, request=request)
+        tt0 = time.time()
+
+        results_list = [
+            [None] * len(request.targets) for _ in request.sources]
+
+        batches = list(self.iter_batches(request))
+        nbatches = len(batches)
+
+        if batches:
+            pool = ThreadPool(min(self.nparallel, nbatches))
+            try:
+                for ibatch, results in enumerate(pool.imap_unordered(
+                        lambda batch: self._process_batch(request, batch),
+                        batches)):
+
+                    for isource, itarget, result in results:
+                        results_list[isource][itarget] = result
+
+                    if status_callback:
+                        status_callback(ibatch, nbatches)
+
+            finally:
+                pool.terminate()
+                pool.join()
+
+        if status_callback:
+            status_callback(nbatches, nbatches)
+
+        s = ProcessingStats()
+        s.n_subrequests = nbatches
+        s.n_results = len(request.sources) * len(request.targets)
+        s.t_wallclock = time.time() - tt0
+
+        return Response(
+            request=request,
+            results_list=results_list,
+            stats=s)
 
 
 g_engine = None
@@ -3322,7 +5087,11 @@ STFMode
 Request
 ProcessingStats
 Response
+ResultFailure
+ResponseChunk
+ArrayResponse
 Engine
+DiscretizedSourceCache
 LocalEngine
 RemoteEngine
 source_classes
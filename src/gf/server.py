@@ -36,7 +36,10 @@ import urllib.request
 import urllib.parse
 import urllib.error
 import re
-from collections import deque
+import struct
+import time
+import zlib
+from collections import deque, defaultdict
 import logging
 
 import matplotlib.pyplot as plt
@@ -129,7 +132,7 @@ class RequestHandler(asynchat.async_chat, SHRH):
 
     def prepare_POST(self):
         """Prepare to read the request body"""
-        bytesToRead = int(self.headers.getheader('Content-length'))
+        bytesToRead = int(self.headers.get('Content-length'))
         # set terminator to length (will read bytesToRead bytes)
         self.set_terminator(bytesToRead)
         self.incoming.clear()
@@ -142,11 +145,16 @@ class RequestHandler(asynchat.async_chat, SHRH):
         self.rfile.seek(0)
         self.do_POST()
 
+        # prepare for next request on this connection
+        self.set_terminator(b'\r\n\r\n')
+        self.found_terminator = self.handle_request_line
+
     def parse_request_url(self):
         # Check for query string in URL
         qspos = self.path.find('?')
         if qspos >= 0:
-            self.body = cgi.parse_qs(self.path[qspos+1:], keep_blank_values=1)
+            self.body = urllib.parse.parse_qs(
+                self.path[qspos+1:], keep_blank_values=1)
             self.path = self.path[:qspos]
         else:
             self.body = {}
@@ -167,15 +175,27 @@ class RequestHandler(asynchat.async_chat, SHRH):
     def do_POST(self):
         """Begins serving a POST request. The request data must be readable
         on a file-like object called self.rfile"""
-        ctype, pdict = cgi.parse_header(self.headers.getheader('content-type'))
-        length = int(self.headers.getheader('content-length'))
+        self.parse_request_url()
+        query = self.body
+
+        ctype, pdict = cgi.parse_header(self.headers.get('content-type'))
+        length = int(self.headers.get('content-length'))
         if ctype == 'multipart/form-data':
             self.body = cgi.parse_multipart(self.rfile, pdict)
         elif ctype == 'application/x-www-form-urlencoded':
-            qs = self.rfile.read(length)
-            self.body = cgi.parse_qs(qs, keep_blank_values=1)
+            qs = self.rfile.read(length).decode('utf-8')
+            self.body = urllib.parse.parse_qs(qs, keep_blank_values=1)
+        elif ctype == 'application/x-pyrocko-gf-request+zlib':
+            try:
+                self.body = {
+                    'request': [zlib.decompress(self.rfile.read(length))]}
+            except zlib.error:
+                self.body = {}
         else:
             self.body = {}
+
+        for k, v in query.items():
+            self.body.setdefault(k, v)
         # self.handle_post_body()
         self.handle_data()
 
@@ -281,7 +301,7 @@ class RequestHandler(asynchat.async_chat, SHRH):
                     # allocations of buffers when they are enabled
                     out.appendleft(a)
                 elif self.use_buffer:
-                    out.appendleft(buffer(a, num_sent))
+                    out.appendleft(memoryview(a)[num_sent:])
                 else:
                     out.appendleft(a[num_sent:])
 
@@ -418,6 +438,8 @@ class SeismosizerHandler(RequestHandler):
     stores_path = '/gfws/static/stores/'
     api_path = '/gfws/api/'
     process_path = '/gfws/seismosizer/1/query'
+    process_stream_path = '/gfws/seismosizer/1/stream'
+    stats_path = '/gfws/seismosizer/1/stats'
 
     def send_head(self):
         S = self.stores_path
@@ -444,6 +466,12 @@ class SeismosizerHandler(RequestHandler):
         elif re.match(r'^' + P + '$', self.path):
             return self.process()
 
+        elif re.match(r'^' + self.process_stream_path + '$', self.path):
+            return self.process_stream()
+
+        elif re.match(r'^' + self.stats_path + '$', self.path):
+            return self.get_stats()
+
         else:
             self.send_error(404, "File not found")
             return None
@@ -650,26 +678,141 @@ class SeismosizerHandler(RequestHandler):
         return f.read()
 
     def process(self):
+        '''
+        Process request, respond with complete response object.
+        '''
 
-        request = gf.load(string=self.body['request'][0])
-        try:
-            resp = self.server.engine.process(request=request)
-        except (gf.BadRequest, gf.StoreError) as e:
-            self.send_error(400, str(e))
-            return
+        self.submit_job(JOB_QUERY)
 
-        f = BytesIO()
-        resp.dump(stream=f)
-        length = f.tell()
+    def process_stream(self):
+        '''
+        Process request, stream results as they become available.
 
-        f.seek(0)
+        The response body is a YAML stream of
+        :py:class:`~pyrocko.gf.seismosizer.ResponseChunk` documents, sent
+        with chunked transfer encoding. With ``format=binary``, the chunks
+        are sent in their binary representation (see
+        :py:meth:`~pyrocko.gf.seismosizer.ResponseChunk.dump_binary`).
+        '''
+
+        if self.body.get('format', ['yaml'])[0] == 'binary':
+            self.submit_job(JOB_STREAM_BINARY)
+        else:
+            self.submit_job(JOB_STREAM)
 
+    def get_stats(self):
+        s = json.dumps(self.server.stats.as_dict())
+        length = len(s)
+        f = BytesIO(s.encode('ascii'))
         self.send_response(200, 'OK')
-        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", str(length))
         self.end_headers()
         return f
 
+    def submit_job(self, kind):
+        server = self.server
+        client = self.client_address[0]
+
+        if 'request' not in self.body:
+            self.send_error(400, 'No request given')
+            return
+
+        if server.max_requests_per_client is not None \
+                and server.nrequests_client[client] \
+                >= server.max_requests_per_client:
+
+            server.stats.n_requests_rejected += 1
+            self.send_error(429, 'Too many concurrent requests')
+            return
+
+        request_data = self.body['request'][0]
+        if not isinstance(request_data, bytes):
+            request_data = request_data.encode('utf-8')
+
+        self._stream_started = False
+        server.nrequests_client[client] += 1
+        server.pool.submit(Job(self, kind, request_data))
+
+    def close(self):
+        # nothing can be sent anymore, output of running jobs is dropped
+        self.outgoing.clear()
+        RequestHandler.close(self)
+
+    def nbytes_outgoing(self):
+        '''
+        Get number of bytes buffered for sending to the client.
+        '''
+
+        return sum(
+            len(a) for a in self.outgoing
+            if a is not None and not hasattr(a, 'read'))
+
+    def output_blocked(self):
+        '''
+        Check if the output buffer of a connected client is full.
+        '''
+
+        return self.connected and \
+            self.nbytes_outgoing() > self.server.nbytes_outgoing_max
+
+    def job_data(self, job, data):
+        if not self.connected:
+            return
+
+        if job.kind == JOB_QUERY:
+            self.send_response(200, 'OK')
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        else:
+            self._start_stream(job)
+            self.wfile.write(
+                ('%x\r\n' % len(data)).encode('ascii') + data + b'\r\n')
+
+    def job_finished(self, job):
+        self._job_done(job)
+        if not self.connected:
+            return
+
+        if job.kind != JOB_QUERY:
+            self._start_stream(job)
+            self.wfile.write(b'0\r\n\r\n')
+
+    def job_failed(self, job, code, message):
+        self._job_done(job)
+        if not self.connected:
+            return
+
+        if self._stream_started:
+            # too late to send an error status, signal the failure to the
+            # client by closing the connection before the final chunk
+            self.log_info('streaming failed: %s' % message, 'error')
+            self.outgoing.append(None)
+        else:
+            # message ends up in the status line, must be a single line
+            self.send_error(code, message.strip().split('\n')[0])
+
+    def _job_done(self, job):
+        client = self.client_address[0]
+        self.server.nrequests_client[client] -= 1
+        if self.server.nrequests_client[client] == 0:
+            del self.server.nrequests_client[client]
+
+    def _start_stream(self, job):
+        if not self._stream_started:
+            self.send_response(200, 'OK')
+            if job.kind == JOB_STREAM_BINARY:
+                self.send_header("Content-Type", "application/octet-stream")
+            else:
+                self.send_header("Content-Type", "application/x-yaml")
+
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self._stream_started = True
+
     def guess_type(self, path):
         bn = os.path.basename
         dn = os.path.dirname
@@ -684,8 +827,397 @@ class SeismosizerHandler(RequestHandler):
                 or 'application/x-octet'
 
 
+JOB_QUERY = b'Q'
+JOB_STREAM = b'S'
+JOB_STREAM_BINARY = b'B'
+
+FRAME_DATA = b'D'
+FRAME_FINISHED = b'F'
+FRAME_ERROR = b'E'
+
+# kind, count, payload size; count is the number of results in data frames
+# and the HTTP status code in error frames
+frame_header_fmt = '<cIQ'
+frame_header_size = struct.calcsize(frame_header_fmt)
+
+
+def make_frame(kind, count, payload):
+    return struct.pack(frame_header_fmt, kind, count, len(payload)) + payload
+
+
+def run_job(engine, kind, request_data, send, nresults_per_chunk=100):
+    '''
+    Process a request and pass the results to ``send`` as frames.
+
+    ``send(kind, count, payload)`` is called for each frame. With
+    :py:data:`JOB_QUERY`, the complete response is sent in one data frame,
+    with :py:data:`JOB_STREAM` and :py:data:`JOB_STREAM_BINARY`, the results
+    are sent in chunks of ``nresults_per_chunk`` results as they become
+    available, in YAML or binary representation. The last frame is a
+    finished or an error frame.
+    '''
+
+    def dump_chunk(batch):
+        chunk = gf.ResponseChunk.from_results(batch)
+        if kind == JOB_STREAM_BINARY:
+            return chunk.dump_binary()
+        else:
+            return chunk.dump().encode('utf-8')
+
+    try:
+        request = gf.load(string=request_data.decode('utf-8'))
+        if kind == JOB_QUERY:
+            resp = engine.process(request=request)
+            send(FRAME_DATA, len(request.sources) * len(request.targets),
+                 resp.dump().encode('utf-8'))
+
+        else:
+            batch = []
+            for x in engine.iter_process(request=request):
+                batch.append(x)
+                if len(batch) == nresults_per_chunk:
+                    send(FRAME_DATA, len(batch), dump_chunk(batch))
+                    batch = []
+
+            if batch:
+                send(FRAME_DATA, len(batch), dump_chunk(batch))
+
+    except (gf.BadRequest, gf.StoreError, gf.meta.OutOfBounds) as e:
+        send(FRAME_ERROR, 400, str(e).encode('utf-8'))
+        return
+
+    except Exception as e:
+        logger.exception('processing failed')
+        send(FRAME_ERROR, 500, str(e).encode('utf-8'))
+        return
+
+    send(FRAME_FINISHED, 0, b'')
+
+
+def _recv_exact(sock, n):
+    data = []
+    while n > 0:
+        d = sock.recv(min(n, 1024*1024))
+        if not d:
+            return None
+
+        data.append(d)
+        n -= len(d)
+
+    return b''.join(data)
+
+
+def worker_main(sock, engine, nresults_per_chunk):
+    '''
+    Main loop of a worker process.
+
+    Reads jobs from ``sock`` and sends back the result frames, until the
+    server closes the connection.
+    '''
+
+    def send(kind, count, payload):
+        sock.sendall(make_frame(kind, count, payload))
+
+    while True:
+        header = _recv_exact(sock, frame_header_size)
+        if header is None:
+            return
+
+        kind, _, n = struct.unpack(frame_header_fmt, header)
+        request_data = _recv_exact(sock, n)
+        if request_data is None:
+            return
+
+        try:
+            run_job(engine, kind, request_data, send, nresults_per_chunk)
+        except socket.error:
+            return
+
+
+class ServerStats(object):
+    '''
+    Throughput and latency counters of the seismosizer server.
+    '''
+
+    def __init__(self):
+        self.t_start = time.time()
+        self.n_requests = 0
+        self.n_requests_rejected = 0
+        self.n_requests_failed = 0
+        self.n_requests_queued = 0
+        self.n_requests_active = 0
+        self.n_results = 0
+        self.nbytes_sent = 0
+        self.n_requests_done = 0
+        self.t_latency_sum = 0.0
+        self.t_duration_sum = 0.0
+        self.t_latency_max = 0.0
+        self.t_duration_max = 0.0
+
+    def as_dict(self):
+        t_uptime = time.time() - self.t_start
+        ndone = max(1, self.n_requests_done)
+        return dict(
+            t_uptime=t_uptime,
+            n_requests=self.n_requests,
+            n_requests_rejected=self.n_requests_rejected,
+            n_requests_failed=self.n_requests_failed,
+            n_requests_queued=self.n_requests_queued,
+            n_requests_active=self.n_requests_active,
+            n_results=self.n_results,
+            nbytes_sent=self.nbytes_sent,
+            results_per_second=self.n_results / t_uptime,
+            requests_per_second=self.n_requests_done / t_uptime,
+            t_latency_mean=self.t_latency_sum / ndone,
+            t_latency_max=self.t_latency_max,
+            t_duration_mean=self.t_duration_sum / ndone,
+            t_duration_max=self.t_duration_max)
+
+
+class Job(object):
+    '''
+    Processing job of a client connection, handled by :py:class:`WorkerPool`.
+
+    Forwards the result frames to the handler and updates the server's
+    counters. The latency is measured from submission to the first result
+    frame. Frames of jobs of closed client connections are dropped.
+    '''
+
+    def __init__(self, handler, kind, request_data):
+        self.handler = handler
+        self.kind = kind
+        self.request_data = request_data
+        self.stats = handler.server.stats
+        self.t_submit = time.time()
+        self.t_first = None
+
+    def queued(self):
+        self.stats.n_requests += 1
+        self.stats.n_requests_queued += 1
+
+    def started(self):
+        self.stats.n_requests_queued -= 1
+        self.stats.n_requests_active += 1
+
+    def blocked(self):
+        return self.handler.output_blocked()
+
+    def frame(self, kind, count, payload):
+        if self.t_first is None:
+            self.t_first = time.time()
+
+        stats = self.stats
+        if kind == FRAME_DATA:
+            stats.n_results += count
+            stats.nbytes_sent += len(payload)
+            self.handler.job_data(self, payload)
+            return
+
+        t = time.time()
+        stats.n_requests_active -= 1
+        stats.n_requests_done += 1
+        stats.t_latency_sum += self.t_first - self.t_submit
+        stats.t_duration_sum += t - self.t_submit
+        stats.t_latency_max = max(
+            stats.t_latency_max, self.t_first - self.t_submit)
+        stats.t_duration_max = max(stats.t_duration_max, t - self.t_submit)
+
+        if kind == FRAME_FINISHED:
+            self.handler.job_finished(self)
+        else:
+            stats.n_requests_failed += 1
+            self.handler.job_failed(self, count, payload.decode('utf-8'))
+
+
+class WorkerConnection(asynchat.async_chat):
+    '''
+    Server side of the connection to a worker process.
+    '''
+
+    def __init__(self, sock, pid, pool):
+        asynchat.async_chat.__init__(self, sock)
+        self.pid = pid
+        self.pool = pool
+        self.job = None
+        self._incoming = []
+        self._header = None
+        self.set_terminator(frame_header_size)
+
+    def start(self, job):
+        self.job = job
+        job.started()
+        self.push(make_frame(job.kind, 0, job.request_data))
+
+    def readable(self):
+        # no reading of result frames while the client's output buffer is
+        # full, so that the worker blocks on sending until the client has
+        # caught up
+        if self.job is not None and self.job.blocked():
+            return False
+
+        return asynchat.async_chat.readable(self)
+
+    def collect_incoming_data(self, data):
+        self._incoming.append(data)
+
+    def found_terminator(self):
+        data = b''.join(self._incoming)
+        self._incoming = []
+        if self._header is None:
+            kind, count, n = struct.unpack(frame_header_fmt, data)
+            if n == 0:
+                self.set_terminator(frame_header_size)
+                self._handle_frame(kind, count, b'')
+            else:
+                self._header = kind, count
+                self.set_terminator(n)
+        else:
+            kind, count = self._header
+            self._header = None
+            self.set_terminator(frame_header_size)
+            self._handle_frame(kind, count, data)
+
+    def _handle_frame(self, kind, count, payload):
+        job = self.job
+        if kind != FRAME_DATA:
+            self.job = None
+
+        job.frame(kind, count, payload)
+
+        if self.job is None:
+            self.pool.done(self)
+
+    def handle_close(self):
+        self.close()
+        self.pool.lost(self)
+        if self.job is not None:
+            job, self.job = self.job, None
+            job.frame(FRAME_ERROR, 500, b'worker process died')
+
+    def handle_error(self):
+        logger.exception('error in connection to worker process')
+        self.handle_close()
+
+
+class WorkerPool(object):
+    '''
+    Pool of worker processes, processing the jobs of the server.
+
+    The worker processes are forked when the pool is created. All stores
+    of the engine are opened before, so that they are shared by the workers.
+    Jobs are queued and handed to idle workers in order of submission. If
+    ``nworkers`` is zero, jobs are processed inline, blocking the server
+    while processing.
+    '''
+
+    def __init__(self, engine, nworkers, nresults_per_chunk=100):
+        self.engine = engine
+        self.nresults_per_chunk = nresults_per_chunk
+        self.workers = []
+        self.idle = []
+        self.queue = deque()
+
+        if nworkers == 0:
+            return
+
+        for store_id in engine.get_store_ids():
+            engine.get_store(store_id).open()
+
+        for i in range(nworkers):
+            sock_parent, sock_child = socket.socketpair()
+            pid = os.fork()
+            if pid == 0:
+                sock_parent.close()
+                for worker in self.workers:
+                    worker.socket.close()
+
+                try:
+                    worker_main(sock_child, engine, nresults_per_chunk)
+                finally:
+                    os._exit(0)
+
+            sock_child.close()
+            worker = WorkerConnection(sock_parent, pid, self)
+            self.workers.append(worker)
+            self.idle.append(worker)
+
+    def submit(self, job):
+        job.queued()
+        if not self.workers:
+            job.started()
+            run_job(
+                self.engine, job.kind, job.request_data, job.frame,
+                self.nresults_per_chunk)
+            return
+
+        self.queue.append(job)
+        self._dispatch()
+
+    def done(self, worker):
+        self.idle.append(worker)
+        self._dispatch()
+
+    def lost(self, worker):
+        logger.error('lost worker process %i' % worker.pid)
+        if worker in self.workers:
+            self.workers.remove(worker)
+        if worker in self.idle:
+            self.idle.remove(worker)
+
+        if not self.workers:
+            while self.queue:
+                job = self.queue.popleft()
+                job.started()
+                job.frame(FRAME_ERROR, 503, b'no worker processes available')
+
+    def _dispatch(self):
+        while self.idle and self.queue:
+            self.idle.pop().start(self.queue.popleft())
+
+    def close(self):
+        for worker in list(self.workers):
+            worker.close()
+
+        for worker in self.workers:
+            try:
+                os.waitpid(worker.pid, 0)
+            except OSError:
+                pass
+
+        self.workers = []
+        self.idle = []
+
+
 class Server(asyncore.dispatcher):
-    def __init__(self, ip, port, handler, engine):
+    '''
+    Seismosizer HTTP server.
+
+    :param nworkers: number of worker processes for the processing of
+        requests. If zero, requests are processed inline, blocking the server
+        while processing.
+    :param max_requests_per_client: maximum number of queued or active
+        processing requests per client IP address. Further requests are
+        rejected with HTTP status 429.
+    :param nresults_per_chunk: number of results per chunk in streamed
+        responses
+    :param nbytes_outgoing_max: number of bytes of response data buffered
+        per client connection, above which no further results are read from
+        the worker process of the request, until the client has received
+        them. Only effective with ``nworkers > 0``.
+    '''
+
+    def __init__(self, ip, port, handler, engine, nworkers=0,
+                 max_requests_per_client=None, nresults_per_chunk=100,
+                 nbytes_outgoing_max=4*1024**2):
+
+        self.stats = ServerStats()
+        self.max_requests_per_client = max_requests_per_client
+        self.nbytes_outgoing_max = nbytes_outgoing_max
+        self.nrequests_client = defaultdict(int)
+
+        # fork workers before creating the listening socket
+        self.pool = WorkerPool(engine, nworkers, nresults_per_chunk)
+
         asyncore.dispatcher.__init__(self)
         self.ip = ip
         self.port = port
@@ -725,6 +1257,10 @@ class Server(asyncore.dispatcher):
     def handle_close(self):
         self.close()
 
+    def close(self):
+        asyncore.dispatcher.close(self)
+        self.pool.close()
+
     def log_info(self, message, type='info'):
         {
             'debug': logger.debug,
@@ -734,8 +1270,14 @@ class Server(asyncore.dispatcher):
         }.get(type, 'info')(str(message))
 
 
-def run(ip, port, engine):
-    s = Server(ip, port, SeismosizerHandler, engine)
+def run(ip, port, engine, **kwargs):
+    '''
+    Run seismosizer server.
+
+    Additional keyword arguments are passed to :py:class:`Server`.
+    '''
+
+    s = Server(ip, port, SeismosizerHandler, engine, **kwargs)
     asyncore.loop()
     del s
 
@@ -7,6 +7,7 @@ from builtins import zip, range
 
 import errno
 import time
+import hashlib
 import os
 import struct
 import math
@@ -15,6 +16,11 @@ import fcntl
 import copy
 import logging
 import re
+import zlib
+import threading
+import multiprocessing
+import mmap
+from collections import OrderedDict
 
 import numpy as num
 from scipy import signal
@@ -81,6 +87,86 @@ def check_string_id(s):
 #
 # Values of first and last sample. These values are included in data[]
 # redunantly.
+#
+# The traces file starts with a header of 32 bytes. It is all zeros for
+# uncompressed stores. For compressed stores, it starts with a magic string
+# identifying the compression and each record's data is stored as a block:
+#
+#  uint32 - number of bytes of the compressed payload
+#  payload - deflate stream of the delta encoded and byte shuffled samples
+#
+# For the delta encoding, the samples are interpreted as 32-bit unsigned
+# integers. Byte shuffling groups the first bytes of all samples, followed by
+# all second bytes, and so on. Both steps are lossless.
+
+
+gf_data_header_size = 32
+
+gf_compression_magics = {
+    None: b'\0' * gf_data_header_size,
+    'zlib': b'GFZLIB01' + b'\0' * (gf_data_header_size - 8),
+}
+
+gf_compression_ids = {
+    None: 0,
+    'zlib': 1,
+}
+
+# default memory budget for the weight buffers in Store.statics
+g_statics_nbytes_max = 256 * 1024**2
+
+# default number of records per block in Store.make_decimated
+g_decimate_nrecords_block = 1000
+
+# number of grid nodes per cell of the interpolation tables of dynamic phases
+g_dynamic_phase_cell_nnodes = 64
+
+# number of exact ray tracings in a cell after which a dynamic phase builds
+# the cell's interpolation table
+g_dynamic_phase_cell_nexact = 10
+
+# maximum number of exact ray tracings memoized by a dynamic phase
+g_dynamic_phase_nexact_cache_max = 10000
+
+# in-memory cache of dynamic phase interpolation tables, shared between
+# stores, keyed by table key and cell index
+g_dynamic_phase_tables = {}
+
+
+def compress_record(data, level=6):
+    '''
+    Encode GF trace samples into a compressed record block.
+    '''
+
+    u = num.ascontiguousarray(data, dtype=gf_dtype_store).view(E + 'u4')
+    d = num.empty_like(u)
+    d[:1] = u[:1]
+    d[1:] = u[1:] - u[:-1]
+    shuffled = d.view(num.uint8).reshape((-1, 4)).T.tobytes()
+    payload = zlib.compress(shuffled, level)
+    return struct.pack(E + 'I', len(payload)) + payload
+
+
+def decompress_record(f, nsamples):
+    '''
+    Read and decode a compressed record block from file ``f``.
+    '''
+
+    header = f.read(4)
+    if len(header) != 4:
+        raise ShortRead()
+
+    nbytes, = struct.unpack(E + 'I', header)
+    payload = f.read(nbytes)
+    if len(payload) != nbytes:
+        raise ShortRead()
+
+    shuffled = zlib.decompress(payload)
+    d = num.frombuffer(shuffled, dtype=num.uint8).reshape((4, nsamples)).T
+    u = num.cumsum(
+        num.ascontiguousarray(d).view(E + 'u4').ravel(), dtype=E + 'u4')
+
+    return u.view(gf_dtype_store).astype(gf_dtype)
 
 
 class NotMultipleOfSamplingInterval(Exception):
@@ -125,6 +211,8 @@ class GFTrace(object):
         self.deltat = deltat
         self.is_zero = is_zero
         self.n_records_stacked = 0.
+        self.n_records_requested = 0.
+        self.n_records_merged = 0.
         self.t_stack = 0.
         self.t_optimize = 0.
 
@@ -209,7 +297,13 @@ def make_same_span(tracesdict):
                 data[lo:hi] = tr.data
                 data[hi:] = tr.data[-1]
 
-            tr = GFTrace(data, itmin, deltat)
+            tr_new = GFTrace(data, itmin, deltat)
+            tr_new.n_records_stacked = tr.n_records_stacked
+            tr_new.n_records_requested = tr.n_records_requested
+            tr_new.n_records_merged = tr.n_records_merged
+            tr_new.t_stack = tr.t_stack
+            tr_new.t_optimize = tr.t_optimize
+            tr = tr_new
 
         out[k] = tr
 
@@ -285,7 +379,7 @@ class BaseStore(object):
         return os.path.join(store_dir, 'traces')
 
     @staticmethod
-    def create(store_dir, deltat, nrecords, force=False):
+    def create(store_dir, deltat, nrecords, force=False, compression=None):
 
         try:
             util.ensuredir(store_dir)
@@ -304,7 +398,7 @@ class BaseStore(object):
             records.tofile(f)
 
         with open(data_fn, 'wb') as f:
-            f.write(b'\0' * 32)
+            f.write(gf_compression_magics[compression])
 
     def __init__(self, store_dir, mode='r', use_memmap=True):
         assert mode in 'rw'
@@ -316,6 +410,7 @@ class BaseStore(object):
         self._f_index = None
         self._f_data = None
         self._end_values = None
+        self._compression = None
         self.cstore = None
 
     def open(self):
@@ -336,9 +431,19 @@ class BaseStore(object):
             self.mode = ''
             raise CannotOpen('cannot open gf store: %s' % self.store_dir)
 
+        header = self._f_data.read(gf_data_header_size)
+        for compression, magic in gf_compression_magics.items():
+            if header == magic:
+                self._compression = compression
+                break
+        else:
+            raise StoreError(
+                'unknown traces file format in gf store: %s' % self.store_dir)
+
         try:
             self.cstore = store_ext.store_init(
-                self._f_index.fileno(), self._f_data.fileno())
+                self._f_index.fileno(), self._f_data.fileno(),
+                gf_compression_ids[self._compression])
         except store_ext.StoreExtError as e:
             raise StoreError(str(e))
 
@@ -381,6 +486,11 @@ class BaseStore(object):
 
     def unlock(self):
         self._f_data.flush()
+        if self._use_memmap and self.mode == 'w':
+            # make index changes visible to workers on other hosts, before
+            # the lock is released
+            self._records.flush()
+
         fcntl.lockf(self._f_index, fcntl.LOCK_UN)
 
     def put(self, irecord, trace):
@@ -402,9 +512,21 @@ class BaseStore(object):
         return self._sum(irecords, delays, weights, itmin, nsamples, decimate,
                          implementation, optimization)
 
-    def sum_statics(self, irecords, delays, weights, it, ntargets, nthreads=0):
+    def sum_statics(self, irecords, delays, weights, it, ntargets, nthreads=0,
+                    out=None):
         return self._sum_statics(irecords, delays, weights, it, ntargets,
-                                 nthreads)
+                                 nthreads, out)
+
+    @property
+    def compression(self):
+        '''
+        Compression of the traces file, ``None`` if uncompressed.
+        '''
+
+        if not self._f_index:
+            self.open()
+
+        return self._compression
 
     def irecord_format(self):
         return util.zfmt(self._nrecords)
@@ -490,7 +612,8 @@ class BaseStore(object):
         if decimate == 1:
             ilo = max(itmin, itmin_data) - itmin_data
             ihi = min(itmin+nsamples, itmin_data+nsamples_data) - itmin_data
-            data = self._get_data(ipos, begin_value, end_value, ilo, ihi)
+            data = self._get_data(ipos, begin_value, end_value, ilo, ihi,
+                                  nsamples_data)
 
             return GFTrace(data, itmin=itmin_data+ilo, deltat=self._deltat,
                            begin_value=begin_value, end_value=end_value)
@@ -519,7 +642,8 @@ class BaseStore(object):
 
             data_ext_pad = num.empty(nsamples_ext_pad, dtype=gf_dtype)
             data_ext_pad[ilo:ihi] = self._get_data(
-                ipos, begin_value, end_value, ilo_data, ihi_data)
+                ipos, begin_value, end_value, ilo_data, ihi_data,
+                nsamples_data)
 
             data_ext_pad[:ilo] = begin_value
             data_ext_pad[ihi:] = end_value
@@ -588,7 +712,10 @@ class BaseStore(object):
         if ndata > 2:
             self._f_data.seek(0, 2)
             ipos = self._f_data.tell()
-            trace.data.astype(gf_dtype_store).tofile(self._f_data)
+            if self._compression == 'zlib':
+                self._f_data.write(compress_record(trace.data))
+            else:
+                trace.data.astype(gf_dtype_store).tofile(self._f_data)
         else:
             ipos = 2
 
@@ -825,6 +952,8 @@ class BaseStore(object):
         if not self._f_index:
             self.open()
 
+        n_records_requested = irecords.size
+
         t0 = time.time()
         if optimization == 'enable':
             irecords, delays, weights = self._optimize(
@@ -871,6 +1000,7 @@ class BaseStore(object):
         t2 = time.time()
 
         tr.n_records_stacked = irecords.size
+        tr.n_records_requested = n_records_requested
         tr.t_optimize = t1 - t0
         tr.t_stack = t2 - t1
 
@@ -903,12 +1033,13 @@ class BaseStore(object):
         return val
 
     def _sum_statics(self, irecords, delays, weights, it, ntargets,
-                     nthreads):
+                     nthreads, out=None):
         if not self._f_index:
             self.open()
 
         return store_ext.store_sum_static(
-            self.cstore, irecords, delays, weights, it, ntargets, nthreads)
+            self.cstore, irecords, delays, weights, it, ntargets, nthreads,
+            out)
 
     def _load_index(self):
         if self._use_memmap:
@@ -939,13 +1070,17 @@ class BaseStore(object):
             self._records.tofile(self._f_index)
             self._f_index.flush()
 
-    def _get_data(self, ipos, begin_value, end_value, ilo, ihi):
+    def _get_data(self, ipos, begin_value, end_value, ilo, ihi,
+                  nsamples=None):
         if ihi - ilo > 0:
             if ipos == 2:
                 data_orig = num.empty(2, dtype=gf_dtype)
                 data_orig[0] = begin_value
                 data_orig[1] = end_value
                 return data_orig[ilo:ihi]
+            elif self._compression == 'zlib':
+                self._f_data.seek(int(ipos))
+                return decompress_record(self._f_data, nsamples)[ilo:ihi]
             else:
                 self._f_data.seek(
                     int(ipos + ilo*gf_dtype_nbytes_per_sample))
@@ -998,11 +1133,81 @@ class BaseStore(object):
             zero=counter[1],
             size_data=self.size_data,
             size_index=self.size_index,
+            compression=self.compression or 'none',
         )
 
         return stats
 
-    stats_keys = 'total inserted empty short zero size_data size_index'.split()
+    stats_keys = 'total inserted empty short zero size_data size_index ' \
+        'compression'.split()
+
+
+def tiled_irecords(config, tile_shape):
+    '''
+    Get record numbers of a GF store ordered in tiles.
+
+    The last two dimensions of the store's index space without the component
+    index, e.g. (source depth, distance), are divided into tiles of
+    ``tile_shape`` nodes. Tiles are ordered row-major and so are the nodes
+    within each tile. Leading dimensions, e.g. the receiver depth of a
+    :py:class:`~pyrocko.gf.meta.ConfigTypeB` store, vary slowest. All
+    components of a node are kept together. A tile shape of ``(1, n)``
+    reproduces the order of the record numbers.
+
+    :param config: GF store config
+    :type config: :py:class:`~pyrocko.gf.meta.Config`
+    :param tile_shape: number of nodes per tile in the last two dimensions
+    :type tile_shape: tuple of two int
+    :returns: record numbers as :py:class:`numpy.ndarray` of ``uint64``
+    '''
+
+    shape = [len(coords) for coords in config.coords]
+    ng = shape.pop()
+    nnodes = int(num.prod(shape))
+
+    indices = list(num.unravel_index(num.arange(nnodes), shape))
+    keys = indices[:-2]
+    for idim, ntile in zip((-2, -1), tile_shape):
+        keys.append(indices[idim] // ntile)
+
+    for idim, ntile in zip((-2, -1), tile_shape):
+        keys.append(indices[idim] % ntile)
+
+    inodes = num.lexsort(keys[::-1]).astype(num.uint64)
+    return (inodes[:, num.newaxis] * num.uint64(ng)
+            + num.arange(ng, dtype=num.uint64)).ravel()
+
+
+def default_tile_shape(config, node_nbytes, pagesize=None):
+    '''
+    Get tile shape for :py:func:`tiled_irecords` matched to the page size.
+
+    The summation of an extended source reads, for every receiver, a region
+    of nodes which is typically wider in distance than in depth. In index
+    order, each depth row of the region is a separate run in the traces
+    file, with partially used pages at both ends. Tiles of ``h`` depths by
+    one distance interleave bands of ``h`` depth rows along distance, which
+    reduces the number of runs by a factor of ``h``, at the cost of reading
+    unneeded rows at the upper and lower edge of the region. The band height
+    is chosen as the square root of the number of nodes per page, scaled
+    with the ratio of the distance and depth spacings. When a node holds half
+    a page or more, the tile shape is ``(1, 1)`` and the tiled order equals
+    the order of the record numbers.
+
+    :param config: GF store config
+    :type config: :py:class:`~pyrocko.gf.meta.Config`
+    :param node_nbytes: average number of bytes of trace data per node
+    :param pagesize: page size, defaults to the system's page size
+    :returns: tile shape ``(h, 1)``
+    '''
+
+    if pagesize is None:
+        pagesize = mmap.PAGESIZE
+
+    nnodes_per_page = pagesize / max(node_nbytes, 1.)
+    aspect = config.deltas[-1] / config.deltas[-2]
+    h = max(1, int(math.floor(math.sqrt(nnodes_per_page * aspect))))
+    return (h, 1)
 
 
 def remake_dir(dpath, force):
@@ -1019,6 +1224,426 @@ class MakeTimingParamsFailed(StoreError):
     pass
 
 
+def _config_nodes(config, ibegin, iend):
+    '''
+    Get nodes ``ibegin:iend`` of the sequence given by ``config.iter_nodes()``.
+    '''
+
+    coords = config.coords
+    indices = num.unravel_index(
+        num.arange(ibegin, iend), [len(c) for c in coords])
+
+    return list(zip(*[
+        num.asarray(c)[i].tolist() for (c, i) in zip(coords, indices)]))
+
+
+def _load_block_digests(fn):
+    digests = {}
+    try:
+        with open(fn, 'r') as f:
+            nrecords_block = int(f.readline())
+            for line in f:
+                iblock, digest = line.split()
+                digests[int(iblock)] = digest
+
+    except (IOError, OSError, ValueError):
+        return None, {}
+
+    return nrecords_block, digests
+
+
+def _ttt_digest(config, pdef):
+    from pyrocko import cake
+    ident = [
+        pdef.dump(),
+        cake.write_nd_model_str(config.earthmodel_1d),
+        repr(num.asarray(config.mins).tolist()),
+        repr(num.asarray(config.maxs).tolist()),
+        repr(num.asarray(config.deltas).tolist()),
+        repr(config.deltat)]
+
+    if len(config.mins) == 2:
+        # receiver depth range is covered by mins, maxs and deltas otherwise
+        ident.append(repr(config.receiver_depth))
+
+    return hashlib.sha1('\n'.join(ident).encode('utf-8')).hexdigest()
+
+
+def _first_arrival(mod, phases, horvels, receiver_depth, args):
+    '''
+    Get earliest arrival of ray traced phases and horizontal velocities.
+
+    :param mod: earth model
+    :type mod: :py:class:`pyrocko.cake.LayeredModel`
+    :param phases: list of :py:class:`pyrocko.cake.PhaseDef` objects
+    :param horvels: list of horizontal velocities [km/s]
+    :param receiver_depth: receiver depth [m], used if ``args`` does not
+        contain it
+    :param args: ``(source_depth, distance)`` or ``(receiver_depth,
+        source_depth, distance)``
+    :returns: arrival time [s] or ``None`` if undefined
+    '''
+
+    from pyrocko import cake
+
+    args = tuple(args)
+    if len(args) == 2:
+        zr, zs, x = (receiver_depth,) + args
+    elif len(args) == 3:
+        zr, zs, x = args
+    else:
+        assert False
+
+    t = []
+    if phases:
+        rays = mod.arrivals(
+            phases=phases,
+            distances=[x*cake.m2d],
+            zstart=zs,
+            zstop=zr)
+
+        for ray in rays:
+            t.append(ray.t)
+
+    for v in horvels:
+        t.append(x/(v*1000.))
+
+    if t:
+        return min(t)
+    else:
+        return None
+
+
+def _make_ttt_phase(args):
+    sconfig, phase_id, fn, digest = args
+
+    config = meta.load(string=sconfig)
+    mod = config.earthmodel_1d
+    pdef = [x for x in config.tabulated_phases if x.id == phase_id][0]
+
+    phases = pdef.phases
+    horvels = pdef.horizontal_velocities
+    receiver_depth = None
+    if len(config.mins) == 2:
+        receiver_depth = config.receiver_depth
+
+    def evaluate(args):
+        return _first_arrival(mod, phases, horvels, receiver_depth, args)
+
+    logger.info('making travel time table for phasegroup "%s"' % phase_id)
+
+    ip = spit.SPTree(
+        f=evaluate,
+        ftol=config.deltat*0.5,
+        xbounds=num.transpose((config.mins, config.maxs)),
+        xtols=config.deltas)
+
+    util.ensuredirs(fn)
+    fn_temp = '%s.%i.temp' % (fn, os.getpid())
+    ip.dump(fn_temp)
+    os.rename(fn_temp, fn)
+    with open(fn + '.sha1', 'w') as f:
+        f.write(digest + '\n')
+
+    return phase_id
+
+
+def _make_decimated_block(args):
+    store_dir, decimate, dest_dir, old_dir, iblock, ibegin, iend, \
+        digest_old = args
+
+    source = Store(store_dir)
+    # always decimate from the full rate records, not from an existing
+    # decimated sub-store
+    source._decimated.clear()
+    dest = Store(dest_dir, 'w')
+    nodes = _config_nodes(dest.config, ibegin, iend)
+
+    h = hashlib.sha1()
+    for args in nodes:
+        tr = source.get(args)
+        h.update(struct.pack('<?i', tr.is_zero, tr.itmin))
+        if not tr.is_zero:
+            h.update(tr.data.astype('<f4').tobytes())
+
+    digest = h.hexdigest()
+
+    reused = old_dir is not None and digest == digest_old
+    if reused:
+        old = Store(old_dir)
+        traces = [old.get(args) for args in nodes]
+        old.close()
+    else:
+        traces = [source.get(args, decimate=decimate) for args in nodes]
+
+    source.close()
+
+    dest.lock()
+    try:
+        for args, tr in zip(nodes, traces):
+            try:
+                dest.put(args, tr)
+            except DuplicateInsert:
+                # block partially written by interrupted run
+                pass
+
+    finally:
+        dest.unlock()
+
+    dest.close()
+
+    return iblock, digest, reused
+
+
+class DynamicPhase(object):
+    '''
+    Travel time provider for ``cake:`` and ``iaspei:`` phase definitions.
+
+    The interpolation table of the phase is filled lazily, cell by cell. The
+    extent of the store is divided into cells of about
+    :py:data:`g_dynamic_phase_cell_nnodes` grid nodes. Points are computed by
+    exact ray tracing, and memoized, until
+    :py:data:`g_dynamic_phase_cell_nexact` different points of a cell have
+    been traced. Then an interpolation table
+    (:py:class:`pyrocko.spit.SPTree`) is built for that cell, with the
+    tolerances of the stored travel time tables (see
+    :py:meth:`Store.make_ttt`), so that a single query never pays for more
+    than one small cell. Cell tables are cached in memory and on disk under
+    the Pyrocko cache directory, keyed by the phase definition, the earth
+    model, the grid extent and the cell index.
+
+    Points outside of the store's extent or in cells where the phase is only
+    partially defined are computed by exact ray tracing.
+    '''
+
+    def __init__(self, config, provider, phase_def, cache_dir=None):
+        from pyrocko import cake
+
+        self.mod = config.earthmodel_1d
+        self.receiver_depth = None
+        if len(config.mins) == 2:
+            self.receiver_depth = config.receiver_depth
+
+        if provider == 'cake':
+            self.phases = [cake.PhaseDef(phase_def)]
+        else:
+            self.phases = cake.PhaseDef.classic(phase_def)
+
+        self.nexact = 0
+        self._exact = OrderedDict()
+        self._cell_nexact = {}
+        self._cells_missing = set()
+
+        self.key = None
+        if self.mod is not None and len(config.mins) in (2, 3):
+            ndim = len(config.mins)
+            self.xbounds = num.transpose((config.mins, config.maxs))
+            self.xtols = num.array(config.deltas, dtype=num.float)
+            self.ftol = config.deltat * 0.5
+
+            nnodes = max(1, int(round(
+                g_dynamic_phase_cell_nnodes**(1.0 / ndim))))
+
+            nintervals = num.round(
+                (self.xbounds[:, 1] - self.xbounds[:, 0]) / self.xtols)
+
+            self.cell_size = self.xtols * nnodes
+            self.ncells = num.maximum(
+                1, num.ceil(nintervals / nnodes)).astype(num.int)
+
+            ident = [
+                provider, phase_def,
+                cake.write_nd_model_str(self.mod),
+                repr(self.xbounds.tolist()),
+                repr(self.xtols.tolist()),
+                repr(self.ftol),
+                repr(nnodes)]
+
+            if len(config.mins) == 2:
+                ident.append(repr(self.receiver_depth))
+
+            self.key = hashlib.sha1(
+                '\n'.join(ident).encode('utf-8')).hexdigest()
+
+            if cache_dir is None:
+                from pyrocko import config as pconfig
+                cache_dir = os.path.join(
+                    pconfig.config().cache_dir, 'gf_dynamic_phases')
+
+            self.cache_dir = os.path.join(cache_dir, self.key)
+
+    def _trace(self, args):
+        return _first_arrival(
+            self.mod, self.phases, (), self.receiver_depth, args)
+
+    def _inside(self, args):
+        return num.all(num.logical_and(
+            self.xbounds[:, 0] <= args, args <= self.xbounds[:, 1]), axis=-1)
+
+    def cell_index(self, args):
+        '''
+        Get index of the table cell containing given points.
+
+        :param args: indexing args, array of shape ``(nargs,)`` or ``(n,
+            nargs)``
+        :returns: cell index as array of ``int``, of the same shape as
+            ``args``
+        '''
+
+        icells = num.floor(
+            (num.asarray(args) - self.xbounds[:, 0]) / self.cell_size)
+
+        return num.clip(icells.astype(num.int), 0, self.ncells - 1)
+
+    def _cell_fn(self, icell):
+        return os.path.join(
+            self.cache_dir, '%s.spit' % '-'.join('%i' % i for i in icell))
+
+    def exact(self, args):
+        '''
+        Compute arrival time by ray tracing.
+
+        :returns: earliest arrival time [s] or ``None`` if the phase is
+            undefined for the given point
+        '''
+
+        args = tuple(float(x) for x in args)
+        if args in self._exact:
+            return self._exact[args]
+
+        tmin = self._trace(args)
+        self.nexact += 1
+
+        if len(self._exact) >= g_dynamic_phase_nexact_cache_max:
+            self._exact.popitem(last=False)
+
+        self._exact[args] = tmin
+
+        if self.key is not None and len(args) == self.xbounds.shape[0] \
+                and self._inside(args):
+
+            icell = tuple(self.cell_index(args))
+            self._cell_nexact[icell] = self._cell_nexact.get(icell, 0) + 1
+
+        return tmin
+
+    def build_cell_table(self, icell):
+        '''
+        Build interpolation table of a cell and write it to the cache.
+
+        :param icell: cell index, tuple of ``int``
+        :returns: :py:class:`pyrocko.spit.SPTree` object
+        '''
+
+        icell = tuple(int(i) for i in icell)
+        lo = self.xbounds[:, 0] + num.array(icell) * self.cell_size
+        hi = num.minimum(lo + self.cell_size, self.xbounds[:, 1])
+
+        logger.debug(
+            'building interpolation table for dynamic phase %s, cell %s' % (
+                ','.join(str(phase) for phase in self.phases), icell))
+
+        table = spit.SPTree(
+            f=self._trace,
+            ftol=self.ftol,
+            xbounds=num.transpose((lo, hi)),
+            xtols=self.xtols)
+
+        fn = self._cell_fn(icell)
+        try:
+            util.ensuredirs(fn)
+            fn_temp = '%s.%i.temp' % (fn, os.getpid())
+            table.dump(fn_temp)
+            os.rename(fn_temp, fn)
+        except (OSError, IOError) as e:
+            logger.warning(
+                'failed to cache travel time table %s: %s' % (fn, e))
+
+        g_dynamic_phase_tables[self.key, icell] = table
+        self._cells_missing.discard(icell)
+        self._cell_nexact.pop(icell, None)
+
+        # memoized points of the cell are not needed anymore
+        for args in list(self._exact.keys()):
+            if len(args) == self.xbounds.shape[0] and self._inside(args) \
+                    and tuple(self.cell_index(args)) == icell:
+                del self._exact[args]
+
+        return table
+
+    def get_cell_table(self, icell):
+        '''
+        Get interpolation table of a cell.
+
+        The table is loaded from the cache or built if enough points of the
+        cell have been traced.
+
+        :param icell: cell index, tuple of ``int``
+        :returns: :py:class:`pyrocko.spit.SPTree` object or ``None``
+        '''
+
+        if self.key is None:
+            return None
+
+        icell = tuple(int(i) for i in icell)
+        table = g_dynamic_phase_tables.get((self.key, icell), None)
+        if table is not None:
+            return table
+
+        if icell not in self._cells_missing:
+            fn = self._cell_fn(icell)
+            if os.path.exists(fn):
+                try:
+                    table = spit.SPTree(filename=fn)
+                    g_dynamic_phase_tables[self.key, icell] = table
+                    return table
+
+                except Exception as e:
+                    logger.warning(
+                        'failed to load cached travel time table %s: %s' % (
+                            fn, e))
+
+            self._cells_missing.add(icell)
+
+        if self._cell_nexact.get(icell, 0) >= g_dynamic_phase_cell_nexact:
+            return self.build_cell_table(icell)
+
+        return None
+
+    def evaluate_many(self, args):
+        '''
+        Vectorized evaluation.
+
+        :param args: indexing args, array of shape ``(n, nargs)``
+        :returns: array of arrival times, NaN where undefined
+        '''
+
+        t = num.empty(args.shape[0], dtype=num.float)
+        t[:] = num.nan
+        if self.key is not None and args.shape[1] == self.xbounds.shape[0]:
+            iinside = num.where(self._inside(args))[0]
+            icells = self.cell_index(args[iinside])
+            for icell in set(map(tuple, icells)):
+                table = self.get_cell_table(icell)
+                if table is not None:
+                    ipoints = iinside[num.all(icells == icell, axis=1)]
+                    t[ipoints] = table.interpolate_many(args[ipoints])
+
+        for i in num.where(num.isnan(t))[0]:
+            ti = self.exact(args[i])
+            if ti is not None:
+                t[i] = ti
+
+        return t
+
+    def __call__(self, args):
+        t = self.evaluate_many(num.array([args], dtype=num.float))[0]
+        if num.isnan(t):
+            return None
+
+        return float(t)
+
+
 class Store(BaseStore):
 
     '''
@@ -1130,7 +1755,7 @@ class Store(BaseStore):
         config = meta.load(filename=config_fn)
 
         BaseStore.create(store_dir, config.deltat, config.nrecords,
-                         force=force)
+                         force=force, compression=config.compression)
 
         for sub_dir in ['decimated']:
             dpath = os.path.join(store_dir, sub_dir)
@@ -1148,6 +1773,7 @@ class Store(BaseStore):
         self._decimated = {}
         self._extra = {}
         self._phases = {}
+        self._dynamic_phases = {}
         for decimate in range(2, 9):
             if os.path.isdir(self._decimated_store_dir(decimate)):
                 self._decimated[decimate] = None
@@ -1354,7 +1980,9 @@ class Store(BaseStore):
         return tr
 
     def make_decimated(self, decimate, config=None, force=False,
-                       show_progress=False):
+                       show_progress=False, nworkers=None, continue_=False,
+                       incremental=False,
+                       nrecords_block=g_decimate_nrecords_block):
         '''
         Create decimated version of GF store.
 
@@ -1370,16 +1998,36 @@ class Store(BaseStore):
         decrease memory footprint at the cost of increased disk space usage,
         when computation are done for lower frequency signals.
 
+        The records are processed in blocks of ``nrecords_block`` records by
+        ``nworkers`` parallel processes. Finished blocks are recorded in the
+        incomplete sub-store, so that an interrupted run can be resumed with
+        ``continue_=True``. For each block, a checksum of the source traces is
+        kept. With ``incremental=True``, an existing decimated sub-store is
+        updated, where only blocks whose source traces have changed are
+        decimated again and all others are copied.
+
         :param decimate: Decimate factor
         :type decimate: integer
         :param config: GF Store config object, defaults to None
         :type config: :py:class:`pyrocko.gf.meta.Config`, optional
         :param force: Force overwrite, defaults to False
         :type force: bool, optional
-        :param show_progress: Show progress, defaults to False
+        :param show_progress: Log progress at info level, defaults to False
         :type show_progress: bool, optional
+        :param nworkers: Number of worker processes, defaults to the number
+            of CPUs
+        :type nworkers: integer, optional
+        :param continue_: Continue interrupted run, defaults to False
+        :type continue_: bool, optional
+        :param incremental: Update existing decimated sub-store,
+            defaults to False
+        :type incremental: bool, optional
+        :param nrecords_block: Number of records per block
+        :type nrecords_block: integer, optional
         '''
 
+        from pyrocko.parimap import parimap
+
         if not self._f_index:
             self.open()
 
@@ -1398,22 +2046,173 @@ class Store(BaseStore):
             del self._decimated[decimate]
 
         store_dir = self._decimated_store_dir(decimate)
+        store_dir_incomplete = store_dir + '-incomplete'
+        status_fn = os.path.join(store_dir_incomplete, '.status')
+
+        old_dir = None
+        digests_old = {}
         if os.path.exists(store_dir):
-            if force:
+            if incremental:
+                old_dir = store_dir
+                old_config = meta.load(
+                    filename=os.path.join(store_dir, 'config'))
+
+                if old_config.dump() == config.dump():
+                    nrecords_block_old, digests_old = _load_block_digests(
+                        os.path.join(store_dir, '.blocks'))
+
+                    if nrecords_block_old != nrecords_block:
+                        digests_old = {}
+
+            elif force:
                 shutil.rmtree(store_dir)
             else:
                 raise CannotCreate('store already exists at %s' % store_dir)
 
-        store_dir_incomplete = store_dir + '-incomplete'
-        Store.create(store_dir_incomplete, config, force=force)
+        digests = {}
+        if continue_ and os.path.exists(status_fn):
+            nrecords_block_status, digests = _load_block_digests(status_fn)
+            if nrecords_block_status != nrecords_block:
+                raise StoreError(
+                    'cannot continue, block size differs from previous run')
+
+        else:
+            Store.create(store_dir_incomplete, config, force=force)
+            with open(status_fn, 'w') as f:
+                f.write('%i\n' % nrecords_block)
+
+        log = logger.info if show_progress else logger.debug
+
+        nrecords = config.nrecords
+        nblocks = (nrecords - 1) // nrecords_block + 1
+        tasks = []
+        for iblock in range(nblocks):
+            if iblock in digests:
+                continue
+
+            tasks.append((
+                self.store_dir, decimate, store_dir_incomplete, old_dir,
+                iblock, iblock*nrecords_block,
+                min((iblock+1)*nrecords_block, nrecords),
+                digests_old.get(iblock, None)))
+
+        nreused = 0
+        for iblock, digest, reused in parimap(
+                _make_decimated_block, tasks, nprocs=nworkers):
+
+            with open(status_fn, 'a') as f:
+                f.write('%i %s\n' % (iblock, digest))
+
+            digests[iblock] = digest
+            nreused += reused
+            log('Done with block %i / %i%s' % (
+                iblock+1, nblocks, ' (unchanged)' if reused else ''))
+
+        if old_dir is not None:
+            log('%i of %i blocks unchanged' % (nreused, len(tasks)))
+
+        shutil.move(status_fn, os.path.join(store_dir_incomplete, '.blocks'))
+
+        if old_dir is not None:
+            shutil.rmtree(old_dir)
+
+        shutil.move(store_dir_incomplete, store_dir)
+
+        self._decimated[decimate] = None
+
+    def _node_nbytes(self):
+        # average uncompressed size of the trace data per node
+        records = self._records
+        nbytes = num.sum(
+            records['nsamples'][records['data_offset'] > 2].astype(num.float)
+        ) * gf_dtype_nbytes_per_sample
+
+        return nbytes * self.config.ncomponents / self._nrecords
+
+    def make_converted(self, dest_dir, compression=None, record_order=None,
+                       tile_shape=None, force=False, show_progress=False):
+        '''
+        Create copy of GF store with different traces file layout.
+
+        The config, extra information and travel time tables are copied to
+        the new store at ``dest_dir``. Decimated sub-stores are not copied.
+
+        The trace data of the records is written to the new traces file in
+        the order given by ``record_order``: ``'index'`` writes them in the
+        order of the record numbers, ``'tiled'`` in tiles over the (source
+        depth, distance) plane (see :py:func:`tiled_irecords`), so that
+        records of nodes neighboring in depth are also stored close to each
+        other. The default tile shape (see :py:func:`default_tile_shape`)
+        reduces the number of pages read by the summation of extended
+        sources on a cold page cache, when the traces of a node are shorter
+        than a memory page. By default, the order of the source store's
+        traces file is kept. The record numbers are not changed.
+
+        :param dest_dir: path of the new GF store
+        :type dest_dir: str
+        :param compression: compression of the new store's traces file
+            (see :py:class:`~pyrocko.gf.meta.StoreCompression`), ``None``
+            for uncompressed
+        :type compression: str, optional
+        :param record_order: ``'index'``, ``'tiled'`` or ``None``
+        :type record_order: str, optional
+        :param tile_shape: number of nodes per tile for ``'tiled'`` order,
+            in the last two dimensions of the index space
+        :type tile_shape: tuple of two int, optional
+        :param force: Force overwrite, defaults to False
+        :type force: bool, optional
+        :param show_progress: Show progress, defaults to False
+        :type show_progress: bool, optional
+        '''
+
+        if not self._f_index:
+            self.open()
+
+        assert self.mode == 'r'
+
+        if record_order is None:
+            irecords = num.argsort(
+                self._records['data_offset'], kind='mergesort')
+        elif record_order == 'index':
+            irecords = num.arange(self._nrecords)
+        elif record_order == 'tiled':
+            if tile_shape is None:
+                tile_shape = default_tile_shape(
+                    self.config, self._node_nbytes())
+
+            irecords = tiled_irecords(self.config, tile_shape)
+        else:
+            raise StoreError('invalid record order: %s' % record_order)
+
+        config = copy.deepcopy(self.config)
+        config.compression = compression
+
+        if os.path.exists(dest_dir):
+            if force:
+                shutil.rmtree(dest_dir)
+            else:
+                raise CannotCreate('store already exists at %s' % dest_dir)
+
+        dest_dir_incomplete = dest_dir + '-incomplete'
+        Store.create(dest_dir_incomplete, config, force=force)
+
+        for key in self.extra_keys():
+            shutil.copy(self.get_extra_path(key),
+                        get_extra_path(dest_dir_incomplete, key))
 
-        decimated = Store(store_dir_incomplete, 'w')
+        phases_dir = os.path.join(self.store_dir, 'phases')
+        if os.path.isdir(phases_dir):
+            shutil.copytree(
+                phases_dir, os.path.join(dest_dir_incomplete, 'phases'))
+
+        dest = Store(dest_dir_incomplete, 'w')
         if show_progress:
-            pbar = util.progressbar('decimating store', self.config.nrecords)
+            pbar = util.progressbar('converting store', self._nrecords)
 
-        for i, args in enumerate(decimated.config.iter_nodes()):
-            tr = self.get(args, decimate=decimate)
-            decimated.put(args, tr)
+        for i, irecord in enumerate(irecords):
+            irecord = int(irecord)
+            if self._records[irecord]['data_offset'] != 0:
+                dest._put(irecord, self._get(irecord, None, None, 1, 'c'))
 
             if show_progress:
                 pbar.update(i+1)
@@ -1421,11 +2220,9 @@ class Store(BaseStore):
         if show_progress:
             pbar.finish()
 
-        decimated.close()
+        dest.close()
 
-        shutil.move(store_dir_incomplete, store_dir)
-
-        self._decimated[decimate] = None
+        shutil.move(dest_dir_incomplete, dest_dir)
 
     def stats(self):
         stats = BaseStore.stats(self)
@@ -1546,39 +2343,79 @@ class Store(BaseStore):
             return evaluate
 
         elif provider in ('cake', 'iaspei'):
-            from pyrocko import cake
-            mod = self.config.earthmodel_1d
-            if provider == 'cake':
-                phases = [cake.PhaseDef(phase_def)]
-            else:
-                phases = cake.PhaseDef.classic(phase_def)
+            return self.get_dynamic_phase(provider, phase_def)
+
+        raise StoreError('unsupported phase provider: %s' % provider)
+
+    def get_dynamic_phase(self, provider, phase_def):
+        '''
+        Get memoizing, interpolating provider for ray traced phases.
+
+        :param provider: ``'cake'`` or ``'iaspei'``
+        :param phase_def: phase definition
+        :returns: :py:class:`DynamicPhase` object
+        '''
+
+        k = (provider, phase_def)
+        if k not in self._dynamic_phases:
+            self._dynamic_phases[k] = DynamicPhase(
+                self.config, provider, phase_def)
+
+        return self._dynamic_phases[k]
+
+    def get_phase_many(self, phase_def):
+        '''
+        Get vectorized phase provider.
+
+        Like :py:meth:`get_phase` but the returned function takes an array of
+        indexing args of shape ``(n, nargs)`` and returns an array of ``n``
+        times, with NaN where the phase is undefined.
+
+        :raises: :py:exc:`pyrocko.spit.OutOfBounds` (when called) if any of
+            the points lies outside of a stored travel time table.
+        '''
+
+        toks = phase_def.split(':', 1)
+        if len(toks) == 2:
+            provider, phase_def_ = toks
+        else:
+            provider, phase_def_ = 'stored', toks[0]
+
+        if provider == 'stored':
+            spt = self.get_stored_phase(phase_def_)
 
             def evaluate(args):
-                if len(args) == 2:
-                    zr, zs, x = (self.config.receiver_depth,) + args
-                elif len(args) == 3:
-                    zr, zs, x = args
-                else:
-                    assert False
+                if args.shape[0] == 0:
+                    return num.empty(0, dtype=num.float)
 
-                t = []
-                if phases:
-                    rays = mod.arrivals(
-                        phases=phases,
-                        distances=[x*cake.m2d],
-                        zstart=zs,
-                        zstop=zr)
+                if not num.all(num.logical_and(
+                        spt.xbounds[:, 0] <= args,
+                        args <= spt.xbounds[:, 1])):
+                    raise spit.OutOfBounds()
 
-                    for ray in rays:
-                        t.append(ray.t)
+                return spt.interpolate_many(args)
 
-                if t:
-                    return min(t)
-                else:
-                    return None
+            return evaluate
+
+        elif provider == 'vel':
+            vel = float(phase_def_) * 1000.
+
+            def evaluate(args):
+                return self.config.get_distances(args) / vel
+
+            return evaluate
+
+        elif provider == 'vel_surface':
+            vel = float(phase_def_) * 1000.
+
+            def evaluate(args):
+                return self.config.get_surface_distances(args) / vel
 
             return evaluate
 
+        elif provider in ('cake', 'iaspei'):
+            return self.get_dynamic_phase(provider, phase_def_).evaluate_many
+
         raise StoreError('unsupported phase provider: %s' % provider)
 
     def t(self, timing, *args):
@@ -1622,6 +2459,41 @@ class Store(BaseStore):
 
         return timing.evaluate(self.get_phase, args)
 
+    def t_many(self, timing, args_array):
+        '''
+        Compute interpolated phase arrivals for many points at once.
+
+        Vectorized version of :py:meth:`t`. Stored travel time tables,
+        ``vel:`` and ``vel_surface:`` phase definitions and the ``first{}``
+        and ``last{}`` selectors are evaluated on whole arrays. Ray traced
+        phases (``cake:``, ``iaspei:``) are interpolated once enough points
+        have been traced, see :py:class:`DynamicPhase`.
+
+        **Example:**
+
+        If ``test_store`` is of :py:class:`pyrocko.gf.meta.ConfigTypeA`::
+
+            test_store.t_many('first{P|p}', [(1000, 10000), (1000, 20000)])
+
+        :param timing: Timing string as described in :py:meth:`t`
+        :type timing: string or :py:class:`pyrocko.gf.meta.Timing`
+        :param args_array: :py:class:`pyrocko.gf.meta.Config` index tuples,
+            e.g. ``(source_depth, distance)`` as in
+            :py:class:`pyrocko.gf.meta.ConfigTypeA`, one per row.
+        :type args_array: array of shape ``(n, nargs)``
+        :returns: Phase arrivals according to ``timing``, NaN where undefined
+        :rtype: :py:class:`numpy.ndarray` of shape ``(n,)``
+        '''
+
+        args_array = num.asarray(args_array, dtype=num.float)
+        if args_array.ndim != 2:
+            raise StoreError('t_many: args_array must be 2-dimensional')
+
+        if not isinstance(timing, meta.Timing):
+            timing = meta.Timing(timing)
+
+        return timing.evaluate_many(self.get_phase_many, args_array)
+
     def make_timing_params(self, begin, end, snap_vred=True, force=False):
 
         '''
@@ -1640,18 +2512,16 @@ class Store(BaseStore):
           as start
         '''
 
-        data = []
-        warned = set()
-        for args in self.config.iter_nodes(level=-1):
-            tmin = self.t(begin, args)
-            tmax = self.t(end, args)
-            if tmin is None:
-                warned.add(str(begin))
-            if tmax is None:
-                warned.add(str(end))
+        nodes = self.config.nodes(level=-1)
+        tmins = self.t_many(begin, nodes)
+        tmaxs = self.t_many(end, nodes)
+        xs = self.config.get_surface_distances(nodes)
 
-            x = self.config.get_surface_distance(args)
-            data.append((x, tmin, tmax))
+        warned = set()
+        if num.any(num.isnan(tmins)):
+            warned.add(str(begin))
+        if num.any(num.isnan(tmaxs)):
+            warned.add(str(end))
 
         if len(warned):
             w = ' | '.join(list(warned))
@@ -1662,8 +2532,6 @@ definitions: %s.\n Travel time table contains holes in probed ranges.''' % w
             else:
                 raise MakeTimingParamsFailed(msg)
 
-        xs, tmins, tmaxs = num.array(data, dtype=num.float).T
-
         tlens = tmaxs - tmins
 
         i = num.nanargmin(tmins)
@@ -1691,7 +2559,7 @@ definitions: %s.\n Travel time table contains holes in probed ranges.''' % w
                 self.config.deltat *
                 math.floor(tmin_vred / self.config.deltat) - xe * sred)
 
-        tlenmax_vred = num.nanmax(tmax - (tmin_vred + sred*x))
+        tlenmax_vred = num.nanmax(tmaxs - (tmin_vred + sred*xs))
         if sred != 0.0:
             vred = 1.0/sred
         else:
@@ -1705,16 +2573,32 @@ definitions: %s.\n Travel time table contains holes in probed ranges.''' % w
             tlenmax_vred=tlenmax_vred,
             vred=vred)
 
-    def make_ttt(self, force=False):
+    def make_ttt(self, force=False, nworkers=None, show_progress=False):
         '''Compute travel time tables.
 
         Travel time tables are computed using the 1D earth model defined in
         :py:attr:`pyrocko.gf.meta.Config.earthmodel_1d` for each defined phase
         in :py:attr:`pyrocko.gf.meta.Config.tabulated_phases`. The accuracy of
         the tablulated times is adjusted to the sampling rate of the store.
+
+        The tables of the different phases are computed by ``nworkers``
+        parallel processes. Along with each table, a checksum of its
+        definition (phase definition, earth model, extent and sampling of the
+        store) is saved. Existing tables are only recomputed if their
+        definition has changed or if ``force`` is set. Tables from older
+        versions, without checksum, are kept unless ``force`` is set.
+
+        :param force: Recompute all tables, defaults to False
+        :type force: bool, optional
+        :param nworkers: Number of worker processes, defaults to the number
+            of CPUs
+        :type nworkers: integer, optional
+        :param show_progress: Log progress at info level, defaults to False
+        :type show_progress: bool, optional
         '''
 
-        from pyrocko import cake
+        from pyrocko.parimap import parimap
+
         config = self.config
 
         if not config.tabulated_phases:
@@ -1728,65 +2612,72 @@ definitions: %s.\n Travel time table contains holes in probed ranges.''' % w
         if not mod:
             raise StoreError('no earth model found')
 
-        for pdef in config.tabulated_phases:
+        log = logger.info if show_progress else logger.debug
 
+        sconfig = config.dump()
+        tasks = []
+        for pdef in config.tabulated_phases:
             phase_id = pdef.id
-            phases = pdef.phases
-            horvels = pdef.horizontal_velocities
-
             fn = os.path.join(self.store_dir, 'phases', '%s.phase' % phase_id)
+            digest = _ttt_digest(config, pdef)
 
             if os.path.exists(fn) and not force:
-                logger.info('file already exists: %s' % fn)
-                continue
-
-            def evaluate(args):
-
-                if len(args) == 2:
-                    zr, zs, x = (config.receiver_depth,) + args
-                elif len(args) == 3:
-                    zr, zs, x = args
-                else:
-                    assert False
+                try:
+                    with open(fn + '.sha1', 'r') as f:
+                        digest_old = f.read().strip()
+                except (IOError, OSError):
+                    digest_old = None
 
-                t = []
-                if phases:
-                    rays = mod.arrivals(
-                        phases=phases,
-                        distances=[x*cake.m2d],
-                        zstart=zs,
-                        zstop=zr)
+                if digest_old is None:
+                    logger.info('file already exists: %s' % fn)
+                    continue
 
-                    for ray in rays:
-                        t.append(ray.t)
+                elif digest_old == digest:
+                    logger.info('travel time table is up to date: %s' % fn)
+                    continue
 
-                for v in horvels:
-                    t.append(x/(v*1000.))
+            tasks.append((sconfig, phase_id, fn, digest))
 
-                if t:
-                    return min(t)
-                else:
-                    return None
+        for i, phase_id in enumerate(parimap(
+                _make_ttt_phase, tasks, nprocs=nworkers)):
 
-            logger.info('making travel time table for phasegroup "%s"' %
-                        phase_id)
+            self._phases.pop(phase_id, None)
+            log('Done with phase "%s" (%i / %i)' % (
+                phase_id, i+1, len(tasks)))
 
-            ip = spit.SPTree(
-                f=evaluate,
-                ftol=config.deltat*0.5,
-                xbounds=num.transpose((config.mins, config.maxs)),
-                xtols=config.deltas)
+    def statics(self, source, multi_location, itsnapshot, components,
+                interpolation='nearest_neighbor', nthreads=0,
+                nbytes_max=g_statics_nbytes_max):
 
-            util.ensuredirs(fn)
-            ip.dump(fn)
+        '''
+        Compute static displacements at the locations of a multi-location.
+
+        The summation weights and record indices of all source elements and
+        target locations are held in memory during the computation. To limit
+        memory usage for large targets (e.g. InSAR scenes with millions of
+        pixels), the target locations are processed in chunks, such that the
+        weight buffers of all chunks in flight fit into ``nbytes_max``
+        bytes. The weight buffers are reused from chunk to chunk. With
+        chunking, chunks are processed in parallel by ``nthreads`` threads,
+        otherwise the summation itself is parallelized.
+
+        :param source: discretized source
+        :param multi_location: :py:class:`~pyrocko.gf.meta.MultiLocation`
+            with the target locations
+        :param itsnapshot: sample index of the snapshot
+        :param components: components to compute
+        :param interpolation: interpolation method
+        :param nthreads: number of threads to use, ``0`` for one per CPU
+        :param nbytes_max: memory budget for the weight buffers
+        :returns: dict with arrays of static displacements, keyed by
+            component
+        '''
 
-    def statics(self, source, multi_location, itsnapshot, components,
-                interpolation='nearest_neighbor', nthreads=0):
         if not self._f_index:
             self.open()
 
-        out = {}
         ntargets = multi_location.ntargets
+        source_coords = source.coords5()
         source_terms = source.get_source_terms(self.config.component_scheme)
         delays = source.times.astype(num.float32)
         scheme_desc = meta.component_scheme_to_description[
@@ -1795,29 +2686,109 @@ definitions: %s.\n Travel time table contains holes in probed ranges.''' % w
         if ntargets == 0:
             raise StoreError('MultiLocation.coords5 is empty')
 
-        try:
-            sum_params = store_ext.make_sum_params(
-                self.cstore,
-                source.coords5(),
-                source_terms,
-                multi_location.coords5,
-                self.config.component_scheme,
-                interpolation,
-                nthreads or 0)
-        except store_ext.StoreExtError:
-            raise meta.OutOfBounds()
+        def sum_params(receiver_coords, nthreads, buffers=None):
+            try:
+                return store_ext.make_sum_params(
+                    self.cstore,
+                    source_coords,
+                    source_terms,
+                    receiver_coords,
+                    self.config.component_scheme,
+                    interpolation,
+                    nthreads,
+                    buffers)
+
+            except store_ext.StoreExtError:
+                raise meta.OutOfBounds()
+
+        icomps = [
+            icomp for (icomp, comp)
+            in enumerate(scheme_desc.provided_components)
+            if comp in components]
+
+        # size of the weight buffers per target location
+        sizes_target = [
+            weights.size for (weights, _) in
+            sum_params(multi_location.get_coords5(0, 1), 1)]
+
+        # weights, record indices and receiver coordinates
+        nbytes_target = sum(sizes_target) * (4 + 8) + 5 * 8
+
+        nthreads = nthreads or multiprocessing.cpu_count()
+        nchunk = max(1, int(nbytes_max // (nthreads * nbytes_target)))
 
-        for icomp, comp in enumerate(scheme_desc.provided_components):
-            if comp not in components:
-                continue
-            weights, irecords = sum_params[icomp]
-            out[comp] = self.sum_statics(
-                irecords,
-                delays,
-                weights,
-                itsnapshot,
-                ntargets,
-                nthreads or 0)
+        out = {}
+        for icomp in icomps:
+            out[scheme_desc.provided_components[icomp]] = num.zeros(
+                ntargets, dtype=gf_dtype)
+
+        if nchunk >= ntargets:
+            nthreads_chunk = 1
+            nchunks = 1
+            nchunk = ntargets
+        else:
+            nchunks = (ntargets - 1) // nchunk + 1
+            nthreads_chunk = min(nthreads, nchunks)
+
+        def work(ichunks):
+            buffers = [
+                (num.empty(size * nchunk, dtype=num.float32),
+                 num.empty(size * nchunk, dtype=num.uint64))
+                for size in sizes_target]
+
+            # OpenMP parallelization within chunks only if not chunking
+            nthreads_sum = nthreads if nchunks == 1 else 1
+
+            for ichunk in ichunks:
+                ia = ichunk * nchunk
+                ib = min(ia + nchunk, ntargets)
+                n = ib - ia
+
+                buffers_chunk = [
+                    (weights[:size*n], irecords[:size*n])
+                    for ((weights, irecords), size)
+                    in zip(buffers, sizes_target)]
+
+                sum_params(
+                    multi_location.get_coords5(ia, ib), nthreads_sum,
+                    buffers_chunk)
+
+                for icomp in icomps:
+                    weights, irecords = buffers_chunk[icomp]
+                    self.sum_statics(
+                        irecords,
+                        delays,
+                        weights,
+                        itsnapshot,
+                        n,
+                        nthreads_sum,
+                        out=out[scheme_desc.provided_components[icomp]][ia:ib])
+
+        if nthreads_chunk == 1:
+            work(range(nchunks))
+        else:
+            errors = []
+
+            def work_catch(ichunks):
+                try:
+                    work(ichunks)
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [
+                threading.Thread(
+                    target=work_catch,
+                    args=(range(ithread, nchunks, nthreads_chunk),))
+                for ithread in range(nthreads_chunk)]
+
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+            if errors:
+                raise errors[0]
 
         return out
 
@@ -1856,6 +2827,52 @@ definitions: %s.\n Travel time table contains holes in probed ranges.''' % w
                    interpolation='nearest_neighbor',
                    optimization='enable', nthreads=1):
 
+        return self.seismograms(
+            source, [receiver], components, deltat=deltat,
+            itmins=[itmin], nsamples=[nsamples],
+            interpolation=interpolation,
+            optimization=optimization,
+            nthreads=nthreads)[0]
+
+    def seismograms(self, source, receivers, components, deltat=None,
+                    itmins=None, nsamples=None,
+                    interpolation='nearest_neighbor',
+                    optimization='enable', nthreads=1):
+
+        '''
+        Calculate base seismograms of one source at many receivers.
+
+        Weights and record indices for all receivers are prepared in a single
+        call to the (threaded) C routine ``make_sum_params``, avoiding per
+        receiver Python overhead for dense receiver arrays.
+
+        :param source: Discretized source
+        :type source: :py:class:`pyrocko.gf.meta.DiscretizedSource`
+        :param receivers: Receivers
+        :type receivers: list of :py:class:`pyrocko.gf.meta.Receiver`
+        :param components: Components to be computed
+        :type components: list of str
+        :param deltat: Sampling interval of the output, defaults to None
+        :type deltat: float, optional
+        :param itmins: Start time index for each receiver, defaults to None
+        :type itmins: list of int, optional
+        :param nsamples: Number of samples for each receiver,
+            defaults to None
+        :type nsamples: list of int, optional
+        :param interpolation: Interpolation method
+            ``['nearest_neighbor', 'multilinear']``, defaults to
+            ``'nearest_neighbor'``
+        :type interpolation: str, optional
+        :param optimization: Optimization mode ``['enable', 'disable']``,
+            defaults to ``'enable'``
+        :type optimization: str, optional
+        :param nthreads: Number of threads, defaults to 1
+        :type nthreads: int, optional
+        :returns: List with one dict of component to
+            :py:class:`pyrocko.gf.store.GFTrace` per receiver.
+        :rtype: list
+        '''
+
         config = self.config
 
         if deltat is None:
@@ -1867,6 +2884,13 @@ definitions: %s.\n Travel time table contains holes in probed ranges.''' % w
                     'unavailable decimation ratio target.deltat / store.deltat'
                     ' = %g / %g' % (deltat, config.deltat))
 
+        nreceivers = len(receivers)
+        if itmins is None:
+            itmins = [None] * nreceivers
+
+        if nsamples is None:
+            nsamples = [None] * nreceivers
+
         store, decimate_ = self._decimated_store(decimate)
 
         if not store._f_index:
@@ -1878,7 +2902,8 @@ definitions: %s.\n Travel time table contains holes in probed ranges.''' % w
 
         source_coords_arr = source.coords5()
         source_terms = source.get_source_terms(scheme)
-        receiver_coords_arr = receiver.coords5[num.newaxis, :].copy()
+        receiver_coords_arr = num.vstack(
+            [receiver.coords5 for receiver in receivers])
 
         try:
             params = store_ext.make_sum_params(
@@ -1894,26 +2919,32 @@ definitions: %s.\n Travel time table contains holes in probed ranges.''' % w
 
         provided_components = scheme_desc.provided_components
 
-        out = {}
+        outs = [{} for _ in range(nreceivers)]
         for icomp, comp in enumerate(provided_components):
             if comp in components:
                 weights, irecords = params[icomp]
 
-                neach = irecords.size // source.times.size
+                # output of make_sum_params is ordered by receiver
+                weights = weights.reshape((nreceivers, -1))
+                irecords = irecords.reshape((nreceivers, -1))
+
+                neach = irecords.shape[1] // source.times.size
                 delays = num.repeat(source.times, neach)
 
-                tr = store._sum(
-                    irecords, delays, weights, itmin, nsamples, decimate_,
-                    'c', optimization)
+                for ireceiver in range(nreceivers):
+                    tr = store._sum(
+                        irecords[ireceiver], delays, weights[ireceiver],
+                        itmins[ireceiver], nsamples[ireceiver], decimate_,
+                        'c', optimization)
 
-                # to prevent problems with rounding errors (BaseStore saves
-                # deltat as a 4-byte floating point value, value from YAML
-                # config is more accurate)
-                tr.deltat = config.deltat * decimate
+                    # to prevent problems with rounding errors (BaseStore
+                    # saves deltat as a 4-byte floating point value, value
+                    # from YAML config is more accurate)
+                    tr.deltat = config.deltat * decimate
 
-                out[comp] = tr
+                    outs[ireceiver][comp] = tr
 
-        return out
+        return outs
 
 
 __all__ = '''
@@ -232,7 +232,7 @@ class StaticTarget(meta.MultiLocation):
 
     def base_key(self):
         return (self.store_id,
-                self.coords5.shape,
+                (self.ncoords, 5),
                 self.quantity,
                 self.tsnapshot,
                 self.interpolation)
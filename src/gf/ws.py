@@ -6,6 +6,7 @@ from future import standard_library
 standard_library.install_aliases()  # noqa
 
 import time
+import zlib
 import requests
 
 import logging
@@ -50,7 +51,7 @@ class InvalidRequest(Exception):
     pass
 
 
-def _request(url, post=False, **kwargs):
+def _request(url, post=False, session=None, headers=None, **kwargs):
     logger.debug('Accessing URL %s' % url)
 
     if post:
@@ -59,14 +60,16 @@ def _request(url, post=False, **kwargs):
             'POST',
             url=url,
             params=kwargs,
-            data=post)
+            data=post,
+            headers=headers)
     else:
         req = requests.Request(
             'GET',
             url=url,
-            params=kwargs)
+            params=kwargs,
+            headers=headers)
 
-    ses = requests.Session()
+    ses = session or requests.Session()
 
     prep = ses.prepare_request(req)
     prep.headers['Accept'] = '*/*'
@@ -174,3 +177,43 @@ def seismosizer(url=g_url, site=g_default_site, majorversion=1,
     from pyrocko.gf import meta
 
     return meta.load(stream=_request(url, post={'request': request.dump()}))
+
+
+def seismosizer_stream(url=g_url, site=g_default_site, majorversion=1,
+                       request=None, format='yaml', session=None):
+    '''
+    Process request on server, yielding results as they arrive.
+
+    With ``format='binary'``, the request is uploaded compressed and the
+    results are transferred in binary representation, which is much more
+    compact than YAML.
+
+    :param session: :py:class:`requests.Session` object to be used, e.g. to
+        reuse connections
+
+    Yields :py:class:`~pyrocko.gf.seismosizer.ResponseChunk` objects.
+    '''
+
+    url = fillurl(url, site, 'seismosizer', majorversion, method='stream')
+
+    if format == 'binary':
+        from pyrocko.gf.seismosizer import ResponseChunk
+
+        stream = _request(
+            url,
+            post=zlib.compress(request.dump().encode('utf-8')),
+            session=session,
+            headers={
+                'Content-Type': 'application/x-pyrocko-gf-request+zlib'},
+            format='binary')
+
+        for chunk in ResponseChunk.iload_binary(stream):
+            yield chunk
+
+    else:
+        from pyrocko import guts
+
+        for chunk in guts.iload_all(stream=_request(
+                url, post={'request': request.dump()}, session=session)):
+
+            yield chunk
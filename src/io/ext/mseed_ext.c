@@ -27,48 +27,18 @@ static struct module_state _state;
 
 
 static PyObject*
-mseed_get_traces (PyObject *m, PyObject *args)
+mstg_to_list (MSTraceGroup *mstg, int unpackdata, struct module_state *st)
 {
-    char          *filename;
-    MSTraceGroup  *mstg = NULL;
     MSTrace       *mst = NULL;
-    int           retcode;
     npy_intp      array_dims[1] = {0};
     PyObject      *array = NULL;
     PyObject      *out_traces = NULL;
     PyObject      *out_trace = NULL;
     int           numpytype;
     char          strbuf[BUFSIZE];
-    PyObject      *unpackdata = NULL;
-
-    struct module_state *st = GETSTATE(m);
-
-    if (!PyArg_ParseTuple(args, "sO", &filename, &unpackdata)) {
-        PyErr_SetString(st->error, "usage get_traces(filename, dataflag)" );
-        return NULL;
-    }
-
-    if (!PyBool_Check(unpackdata)) {
-        PyErr_SetString(st->error, "Second argument must be a boolean" );
-        return NULL;
-    }
-  
-    /* get data from mseed file */
-    retcode = ms_readtraces (&mstg, filename, 0, -1.0, -1.0, 0, 1, (unpackdata == Py_True), 0);
-    if ( retcode < 0 ) {
-        snprintf (strbuf, BUFSIZE, "Cannot read file '%s': %s", filename, ms_errorstr(retcode));
-        PyErr_SetString(st->error, strbuf);
-        return NULL;
-    }
-
-    if ( ! mstg ) {
-        snprintf (strbuf, BUFSIZE, "Error reading file");
-        PyErr_SetString(st->error, strbuf);
-        return NULL;
-    }
 
     /* check that there is data in the traces */
-    if (unpackdata == Py_True) {
+    if (unpackdata) {
         mst = mstg->traces;
         while (mst) {
             if (mst->datasamples == NULL) {
@@ -88,7 +58,7 @@ mseed_get_traces (PyObject *m, PyObject *args)
 
     while (mst) {
         
-        if (unpackdata == Py_True) {
+        if (unpackdata) {
             array_dims[0] = mst->numsamples;
             switch (mst->sampletype) {
                 case 'i':
@@ -137,6 +107,236 @@ mseed_get_traces (PyObject *m, PyObject *args)
         mst = mst->next;
     }
 
+    return out_traces;
+}
+
+
+static PyObject*
+mseed_get_traces (PyObject *m, PyObject *args)
+{
+    char          *filename;
+    MSTraceGroup  *mstg = NULL;
+    int           retcode;
+    PyObject      *out_traces = NULL;
+    char          strbuf[BUFSIZE];
+    PyObject      *unpackdata = NULL;
+
+    struct module_state *st = GETSTATE(m);
+
+    if (!PyArg_ParseTuple(args, "sO", &filename, &unpackdata)) {
+        PyErr_SetString(st->error, "usage get_traces(filename, dataflag)" );
+        return NULL;
+    }
+
+    if (!PyBool_Check(unpackdata)) {
+        PyErr_SetString(st->error, "Second argument must be a boolean" );
+        return NULL;
+    }
+  
+    /* get data from mseed file */
+    Py_BEGIN_ALLOW_THREADS
+    retcode = ms_readtraces (&mstg, filename, 0, -1.0, -1.0, 0, 1, (unpackdata == Py_True), 0);
+    Py_END_ALLOW_THREADS
+    if ( retcode < 0 ) {
+        snprintf (strbuf, BUFSIZE, "Cannot read file '%s': %s", filename, ms_errorstr(retcode));
+        PyErr_SetString(st->error, strbuf);
+        return NULL;
+    }
+
+    if ( ! mstg ) {
+        snprintf (strbuf, BUFSIZE, "Error reading file");
+        PyErr_SetString(st->error, strbuf);
+        return NULL;
+    }
+
+    out_traces = mstg_to_list(mstg, (unpackdata == Py_True), st);
+
+    mst_freegroup (&mstg);
+
+    return out_traces;
+}
+
+
+static PyObject*
+mseed_get_record_index (PyObject *m, PyObject *args)
+{
+    char          *filename;
+    MSFileParam   *msfp = NULL;
+    MSRecord      *msr = NULL;
+    MSTraceGroup  *mstg = NULL;
+    off_t         fpos = 0;
+    int           retcode;
+    PyObject      *out_traces = NULL;
+    PyObject      *out_records = NULL;
+    PyObject      *out_record = NULL;
+    char          strbuf[BUFSIZE];
+
+    struct module_state *st = GETSTATE(m);
+
+    if (!PyArg_ParseTuple(args, "s", &filename)) {
+        PyErr_SetString(st->error, "usage get_record_index(filename)" );
+        return NULL;
+    }
+
+    mstg = mst_initgroup(NULL);
+    out_records = Py_BuildValue("[]");
+
+    /* same grouping of records into traces as in ms_readtraces */
+    while ((retcode = ms_readmsr_r (&msfp, &msr, filename, 0, &fpos, NULL, 1, 0, 0)) == MS_NOERROR) {
+        mst_addmsrtogroup (mstg, msr, 0, -1.0, -1.0);
+
+        out_record = Py_BuildValue( "(L,i,s,s,s,s,L,L,d)",
+                                    (long long)fpos,
+                                    msr->reclen,
+                                    msr->network,
+                                    msr->station,
+                                    msr->location,
+                                    msr->channel,
+                                    msr->starttime,
+                                    msr_endtime(msr),
+                                    msr->samprate);
+
+        PyList_Append(out_records, out_record);
+        Py_DECREF(out_record);
+    }
+
+    ms_readmsr_r (&msfp, &msr, NULL, 0, NULL, NULL, 0, 0, 0);
+
+    if ( retcode != MS_ENDOFFILE ) {
+        snprintf (strbuf, BUFSIZE, "Cannot read file '%s': %s", filename, ms_errorstr(retcode));
+        PyErr_SetString(st->error, strbuf);
+        Py_DECREF(out_records);
+        mst_freegroup (&mstg);
+        return NULL;
+    }
+
+    out_traces = mstg_to_list(mstg, 0, st);
+    mst_freegroup (&mstg);
+    if (out_traces == NULL) {
+        Py_DECREF(out_records);
+        return NULL;
+    }
+
+    return Py_BuildValue("(N,N)", out_traces, out_records);
+}
+
+
+static PyObject*
+mseed_get_traces_from_blocks (PyObject *m, PyObject *args)
+{
+    char          *filename;
+    PyObject      *in_blocks = NULL;
+    PyObject      *in_block = NULL;
+    MSRecord      *msr = NULL;
+    MSTraceGroup  *mstg = NULL;
+    PyObject      *out_traces = NULL;
+    FILE          *f = NULL;
+    char          *buf = NULL;
+    char          *newbuf = NULL;
+    long long     *offsets = NULL;
+    int           *nbytess = NULL;
+    int           *reclens = NULL;
+    int           iblock, nblocks, irec;
+    int           retcode = MS_NOERROR;
+    char          *errmsg = NULL;
+    char          strbuf[BUFSIZE];
+
+    struct module_state *st = GETSTATE(m);
+
+    if (!PyArg_ParseTuple(args, "sO", &filename, &in_blocks)) {
+        PyErr_SetString(st->error, "usage get_traces_from_blocks(filename, blocks)" );
+        return NULL;
+    }
+
+    if (!PySequence_Check(in_blocks)) {
+        PyErr_SetString(st->error, "Blocks must be given as a sequence of (offset, nbytes, reclen) tuples");
+        return NULL;
+    }
+
+    nblocks = PySequence_Length(in_blocks);
+    offsets = (long long*)malloc(sizeof(long long) * (nblocks + 1));
+    nbytess = (int*)malloc(sizeof(int) * (nblocks + 1));
+    reclens = (int*)malloc(sizeof(int) * (nblocks + 1));
+    if (offsets == NULL || nbytess == NULL || reclens == NULL) {
+        free(offsets);
+        free(nbytess);
+        free(reclens);
+        PyErr_SetString(st->error, "Cannot allocate memory");
+        return NULL;
+    }
+
+    for (iblock=0; iblock<nblocks; iblock++) {
+        in_block = PySequence_GetItem(in_blocks, iblock);
+        if (in_block == NULL || !PyArg_ParseTuple(in_block, "Lii", &offsets[iblock], &nbytess[iblock], &reclens[iblock])) {
+            Py_XDECREF(in_block);
+            free(offsets);
+            free(nbytess);
+            free(reclens);
+            PyErr_SetString(st->error, "Blocks must be given as a sequence of (offset, nbytes, reclen) tuples");
+            return NULL;
+        }
+        Py_DECREF(in_block);
+
+        if (reclens[iblock] < MINRECLEN || reclens[iblock] > MAXRECLEN || nbytess[iblock] % reclens[iblock] != 0) {
+            free(offsets);
+            free(nbytess);
+            free(reclens);
+            PyErr_SetString(st->error, "Invalid record length in block");
+            return NULL;
+        }
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+
+    mstg = mst_initgroup(NULL);
+
+    f = fopen(filename, "rb");
+    if (f == NULL) {
+        errmsg = "Cannot open file";
+    }
+
+    for (iblock=0; iblock<nblocks && errmsg == NULL; iblock++) {
+        newbuf = realloc(buf, nbytess[iblock]);
+        if (newbuf == NULL) {
+            errmsg = "Cannot allocate memory";
+            break;
+        }
+        buf = newbuf;
+
+        if (fseeko(f, (off_t)offsets[iblock], SEEK_SET) != 0 || fread(buf, nbytess[iblock], 1, f) != 1) {
+            errmsg = "Cannot read block";
+            break;
+        }
+
+        for (irec=0; irec<nbytess[iblock]/reclens[iblock]; irec++) {
+            retcode = msr_unpack(buf + irec*reclens[iblock], reclens[iblock], &msr, 1, 0);
+            if (retcode != MS_NOERROR) {
+                errmsg = (char*)ms_errorstr(retcode);
+                break;
+            }
+            mst_addmsrtogroup (mstg, msr, 0, -1.0, -1.0);
+        }
+    }
+
+    if (f != NULL) {
+        fclose(f);
+    }
+    free(buf);
+    msr_free(&msr);
+
+    Py_END_ALLOW_THREADS
+
+    free(offsets);
+    free(nbytess);
+    free(reclens);
+
+    if (errmsg != NULL) {
+        snprintf (strbuf, BUFSIZE, "Cannot read file '%s': %s", filename, errmsg);
+        PyErr_SetString(st->error, strbuf);
+    } else {
+        out_traces = mstg_to_list(mstg, 1, st);
+    }
+
     mst_freegroup (&mstg);
 
     return out_traces;
@@ -294,6 +494,23 @@ static PyMethodDef mseed_ext_methods[] = {
     "in libmseed. If dataflag is True, `data` is a numpy array containing the\n"
     "data. If dataflag is False, the data is not unpacked and `data` is None.\n" },
 
+    {"get_record_index",  mseed_get_record_index, METH_VARARGS,
+    "get_record_index(filename)\n"
+    "Get traces and record index of an mseed file.\n\n"
+    "Returns a tuple (traces, records). `traces` is as returned by\n"
+    "get_traces(filename, False). `records` is a list of tuples, one for each\n"
+    "data record in the file:\n\n"
+    "  (offset, reclen, network, station, location, channel,\n"
+    "    starttime, endtime, samprate)\n\n"
+    "where `endtime` is the time of the last sample in the record.\n" },
+
+    {"get_traces_from_blocks",  mseed_get_traces_from_blocks, METH_VARARGS,
+    "get_traces_from_blocks(filename, blocks)\n"
+    "Get traces from selected records of an mseed file.\n\n"
+    "`blocks` is a sequence of tuples (offset, nbytes, reclen), each giving a\n"
+    "contiguous range of records of equal length. Returns traces with data\n"
+    "as get_traces(filename, True), but built from the given records only.\n" },
+
     {"store_traces",  mseed_store_traces, METH_VARARGS, 
     "store_traces(traces, filename)\n" },
 
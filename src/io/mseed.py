@@ -10,6 +10,8 @@ import os
 import re
 import logging
 
+import numpy as num
+
 from pyrocko import trace
 from pyrocko.util import reuse, ensuredirs
 from .io_common import FileLoadError, FileSaveError
@@ -21,39 +23,196 @@ class CodeTooLong(FileSaveError):
     pass
 
 
-def iload(filename, load_data=True):
+def _make_traces(trtups, filename):
     from pyrocko import mseed_ext
 
     have_zero_rate_traces = False
-    try:
-        traces = []
-        for tr in mseed_ext.get_traces(filename, load_data):
-            network, station, location, channel = tr[1:5]
-            tmin = float(tr[5])/float(mseed_ext.HPTMODULUS)
-            tmax = float(tr[6])/float(mseed_ext.HPTMODULUS)
-            try:
-                deltat = reuse(1.0/float(tr[7]))
-            except ZeroDivisionError as e:
-                have_zero_rate_traces = True
-                continue
-
-            ydata = tr[8]
-
-            traces.append(trace.Trace(
-                network, station, location, channel, tmin, tmax,
-                deltat, ydata))
-
-        for tr in traces:
-            yield tr
+    traces = []
+    for tr in trtups:
+        network, station, location, channel = tr[1:5]
+        tmin = float(tr[5])/float(mseed_ext.HPTMODULUS)
+        tmax = float(tr[6])/float(mseed_ext.HPTMODULUS)
+        try:
+            deltat = reuse(1.0/float(tr[7]))
+        except ZeroDivisionError:
+            have_zero_rate_traces = True
+            continue
 
-    except (OSError, mseed_ext.MSeedError) as e:
-        raise FileLoadError(str(e)+' (file: %s)' % filename)
+        ydata = tr[8]
+
+        traces.append(trace.Trace(
+            network, station, location, channel, tmin, tmax,
+            deltat, ydata))
 
     if have_zero_rate_traces:
         logger.warning(
             'Ignoring traces with sampling rate of zero in file %s '
             '(maybe LOG traces)' % filename)
 
+    return traces
+
+
+def iload(filename, load_data=True):
+    from pyrocko import mseed_ext
+
+    try:
+        traces = _make_traces(
+            mseed_ext.get_traces(filename, load_data), filename)
+
+    except (OSError, mseed_ext.MSeedError) as e:
+        raise FileLoadError(str(e)+' (file: %s)' % filename)
+
+    for tr in traces:
+        yield tr
+
+
+record_index_dtype = num.dtype([
+    ('offset', num.int64),
+    ('nbytes', num.int32),
+    ('reclen', num.int32),
+    ('tmin', num.float64),
+    ('tmax', num.float64),
+    ('deltat', num.float64),
+    ('network', 'S2'),
+    ('station', 'S5'),
+    ('location', 'S2'),
+    ('channel', 'S3')])
+
+g_nbytes_block_max = 64*1024
+
+
+def load_record_index(filename, nbytes_block_max=g_nbytes_block_max):
+    '''Read trace headers and record index of a miniSEED file.
+
+    Consecutive records of equal length, belonging to the same channel, are
+    joined into blocks of at most ``nbytes_block_max`` bytes. The index holds
+    one entry per block, see :py:data:`record_index_dtype`. Entry ``tmin`` is
+    the time of the first sample in the block, ``tmax`` the time of the last
+    sample.
+
+    :returns: tuple ``(traces, index)`` with the traces as returned by
+        :py:func:`iload` with ``load_data=False`` and the record index as
+        NumPy structured array.
+    '''
+
+    from pyrocko import mseed_ext
+
+    try:
+        trtups, records = mseed_ext.get_record_index(filename)
+    except (OSError, mseed_ext.MSeedError) as e:
+        raise FileLoadError(str(e)+' (file: %s)' % filename)
+
+    traces = _make_traces(trtups, filename)
+
+    nrecords = len(records)
+    if nrecords == 0:
+        return traces, num.zeros(0, dtype=record_index_dtype)
+
+    recs = num.array(
+        records, dtype=[
+            ('offset', num.int64),
+            ('reclen', num.int32),
+            ('network', 'S2'),
+            ('station', 'S5'),
+            ('location', 'S2'),
+            ('channel', 'S3'),
+            ('starttime', num.int64),
+            ('endtime', num.int64),
+            ('samprate', num.float64)])
+
+    codes = recs[['network', 'station', 'location', 'channel']]
+
+    # start new block on change of channel or record length, at gaps in the
+    # file and when the block would become too large
+    brk = num.ones(nrecords, dtype=bool)
+    brk[1:] = num.logical_or.reduce([
+        codes[1:] != codes[:-1],
+        recs['reclen'][1:] != recs['reclen'][:-1],
+        recs['samprate'][1:] != recs['samprate'][:-1],
+        recs['offset'][1:] != recs['offset'][:-1] + recs['reclen'][:-1]])
+
+    irun = num.cumsum(brk) - 1
+    run_offset = recs['offset'][brk][irun]
+    ichunk = (recs['offset'] - run_offset) // nbytes_block_max
+    brk[1:] |= ichunk[1:] != ichunk[:-1]
+
+    ifirst = num.nonzero(brk)[0]
+
+    index = num.zeros(ifirst.size, dtype=record_index_dtype)
+    index['offset'] = recs['offset'][ifirst]
+    index['nbytes'] = num.add.reduceat(recs['reclen'], ifirst)
+    index['reclen'] = recs['reclen'][ifirst]
+    index['tmin'] = num.minimum.reduceat(recs['starttime'], ifirst) \
+        / float(mseed_ext.HPTMODULUS)
+    index['tmax'] = num.maximum.reduceat(recs['endtime'], ifirst) \
+        / float(mseed_ext.HPTMODULUS)
+
+    samprate = recs['samprate'][ifirst]
+    index['deltat'] = num.where(
+        samprate > 0., 1.0 / num.where(samprate > 0., samprate, 1.0), 0.0)
+
+    for k in ('network', 'station', 'location', 'channel'):
+        index[k] = recs[k][ifirst]
+
+    return traces, index
+
+
+def select_blocks(index, tmin, tmax, nslc_ids=None):
+    '''Get entries of a record index overlapping a time span.
+
+    Blocks are selected if they contain samples within one sampling interval
+    of the time span, so that edge samples needed when chopping are
+    included.
+
+    :param index: record index, see :py:func:`load_record_index`
+    :param nslc_ids: if given, set of ``(network, station, location,
+        channel)`` tuples to restrict the selection to
+    '''
+
+    mask = num.logical_and(
+        index['tmin'] - index['deltat'] <= tmax,
+        index['tmax'] + index['deltat'] >= tmin)
+
+    if nslc_ids is not None:
+        nslc_ids = set(nslc_ids)
+        for i in num.nonzero(mask)[0]:
+            entry = index[i]
+            nslc = tuple(
+                entry[k].decode('ascii')
+                for k in ('network', 'station', 'location', 'channel'))
+
+            if nslc not in nslc_ids:
+                mask[i] = False
+
+    return index[mask]
+
+
+def iload_blocks(filename, blocks):
+    '''Load traces from selected records of a miniSEED file.
+
+    Only the records within the given blocks of the record index are read
+    and decoded.
+
+    :param blocks: entries of a record index, see :py:func:`load_record_index`
+        and :py:func:`select_blocks`
+    '''
+
+    from pyrocko import mseed_ext
+
+    try:
+        traces = _make_traces(
+            mseed_ext.get_traces_from_blocks(
+                filename,
+                [(int(block['offset']), int(block['nbytes']),
+                  int(block['reclen'])) for block in blocks]),
+            filename)
+
+    except (OSError, mseed_ext.MSeedError) as e:
+        raise FileLoadError(str(e)+' (file: %s)' % filename)
+
+    for tr in traces:
+        yield tr
+
 
 def as_tuple(tr):
     from pyrocko import mseed_ext
@@ -75,74 +75,84 @@ def parimap(function, *iterables, **kwargs):
     all_written = False
     error_ahead = False
     iterables = list(map(iter, iterables))
-    while True:
-        if nrun < nprocs and not all_written and not error_ahead:
-            args = []
-            for it in iterables:
-                try:
-                    args.append(next(it))
-                except StopIteration:
-                    pass
-
-            if len(args) == len(iterables):
-                if len(procs) < nrun + 1:
-                    p = multiprocessing.Process(
-                        target=worker,
-                        args=(q_in, q_out, function, eprintignore, pshared))
-                    p.daemon = True
-                    p.start()
-                    procs.append(p)
-
-                q_in.put((nwritten, args))
-                nwritten += 1
-                nrun += 1
-            else:
-                all_written = True
-                [q_in.put((None, None)) for p in procs]
-                q_in.close()
-
-        try:
-            while nrun > 0:
-                if nrun < nprocs and not all_written and not error_ahead:
-                    results.append(q_out.get_nowait())
+    try:
+        while True:
+            if nrun < nprocs and not all_written and not error_ahead:
+                args = []
+                for it in iterables:
+                    try:
+                        args.append(next(it))
+                    except StopIteration:
+                        pass
+
+                if len(args) == len(iterables):
+                    if len(procs) < nrun + 1:
+                        p = multiprocessing.Process(
+                            target=worker,
+                            args=(q_in, q_out, function, eprintignore,
+                                  pshared))
+                        p.daemon = True
+                        p.start()
+                        procs.append(p)
+
+                    q_in.put((nwritten, args))
+                    nwritten += 1
+                    nrun += 1
                 else:
-                    while True:
-                        try:
-                            results.append(q_out.get())
-                            break
-                        except IOError as e:
-                            if e.errno != errno.EINTR:
-                                raise
-
-                nrun -= 1
-
-        except queue.Empty:
-            pass
-
-        if results:
-            results.sort()
-            # check for error ahead to prevent further enqueuing
-            if any(exc for (_, _, exc) in results):
-                error_ahead = True
-
-            while results:
-                (i, r, exc) = results[0]
-                if i == iout:
-                    results.pop(0)
-                    if exc is not None:
-                        if not all_written:
-                            [q_in.put((None, None)) for p in procs]
-                            q_in.close()
-                        raise exc
+                    all_written = True
+                    [q_in.put((None, None)) for p in procs]
+                    q_in.close()
+
+            try:
+                while nrun > 0:
+                    if nrun < nprocs and not all_written and not error_ahead:
+                        results.append(q_out.get_nowait())
+                    else:
+                        while True:
+                            try:
+                                results.append(q_out.get())
+                                break
+                            except IOError as e:
+                                if e.errno != errno.EINTR:
+                                    raise
+
+                    nrun -= 1
+
+            except queue.Empty:
+                pass
+
+            if results:
+                results.sort()
+                # check for error ahead to prevent further enqueuing
+                if any(exc for (_, _, exc) in results):
+                    error_ahead = True
+
+                while results:
+                    (i, r, exc) = results[0]
+                    if i == iout:
+                        results.pop(0)
+                        if exc is not None:
+                            if not all_written:
+                                [q_in.put((None, None)) for p in procs]
+                                q_in.close()
+                            raise exc
+                        else:
+                            yield r
+
+                        iout += 1
                     else:
-                        yield r
+                        break
 
-                    iout += 1
-                else:
-                    break
+            if all_written and nrun == 0:
+                break
 
-        if all_written and nrun == 0:
-            break
+    except GeneratorExit:
+        # consumer stopped early, let the workers terminate
+        if not all_written:
+            [q_in.put((None, None)) for p in procs]
+            q_in.close()
+
+        raise
 
     [p.join() for p in procs]
     return
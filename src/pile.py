@@ -19,15 +19,22 @@ import sys
 import operator
 import math
 import hashlib
+import sqlite3
+import threading
+import collections
+import queue
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
 
+import numpy as num
 
 from . import avl
 from . import trace, io, util
 from . import config
+from .io import mseed
+from .parimap import parimap
 from .trace import degapper
 
 
@@ -176,6 +183,9 @@ class TracesFileCache(object):
     For each directory with files containing traces, one cache file is
     maintained to hold the trace metainformation of all files which are
     contained in the directory.
+
+    Superseded by :py:class:`TracesFileIndex`, which is used by
+    :py:func:`get_cache`.
     '''
 
     caches = {}
@@ -281,6 +291,7 @@ class TracesFileCache(object):
 
             v.data_use_count = 0
             v.data_loaded = False
+            v.data_cache = None
             v.fix_unicode_codes()
 
         return cache
@@ -303,6 +314,7 @@ class TracesFileCache(object):
             trf.by_mtime = None
             trf.data_use_count = 0
             trf.data_loaded = False
+            trf.data_cache = None
             traces = []
             for tr in trf.traces:
                 tr = tr.copy(data=False)
@@ -322,17 +334,468 @@ class TracesFileCache(object):
         os.rename(tmpfn, cachefilename)
 
 
+class TracesFileIndex(object):
+    '''Manages trace metainformation cache in an SQLite database.
+
+    Drop-in replacement for :py:class:`TracesFileCache`. Instead of one
+    pickled cache file per directory, all metainformation is kept in a single
+    indexed database file in the cache directory. Per file, the modification
+    time and format are stored, per trace the codes, time span and sampling
+    interval. For miniSEED files, the record index is stored as well (see
+    :py:meth:`TracesFile.get_record_index`). Entries are read on demand, so
+    the index never has to be loaded into memory as a whole.
+
+    Modifications are collected with :py:meth:`put` and written in a single
+    transaction by :py:meth:`dump_modified`. Several processes may read and
+    update the same index concurrently; write transactions are serialized by
+    SQLite's file locking.
+    '''
+
+    caches = {}
+
+    db_filename = 'traces-index-v1.sqlite'
+    timeout = 60.
+
+    _schema = '''
+        CREATE TABLE IF NOT EXISTS files (
+            file_id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL,
+            format TEXT NOT NULL,
+            mtime REAL);
+
+        CREATE TABLE IF NOT EXISTS traces (
+            file_id INTEGER NOT NULL
+                REFERENCES files(file_id) ON DELETE CASCADE,
+            network TEXT NOT NULL,
+            station TEXT NOT NULL,
+            location TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            tmin REAL NOT NULL,
+            tmin_offset REAL NOT NULL,
+            tmax REAL NOT NULL,
+            deltat REAL NOT NULL,
+            mtime REAL);
+
+        CREATE TABLE IF NOT EXISTS record_indices (
+            file_id INTEGER PRIMARY KEY
+                REFERENCES files(file_id) ON DELETE CASCADE,
+            data BLOB NOT NULL);
+
+        CREATE INDEX IF NOT EXISTS traces_file_id ON traces (file_id);
+        CREATE INDEX IF NOT EXISTS traces_tmin ON traces (tmin);
+        CREATE INDEX IF NOT EXISTS traces_tmax ON traces (tmax);
+        CREATE INDEX IF NOT EXISTS traces_codes
+            ON traces (network, station, location, channel);
+    '''
+
+    def __init__(self, cachedir):
+        '''Create new cache or open existing one.
+
+        :param cachedir: directory to hold the database file.
+
+        '''
+
+        self.cachedir = cachedir
+        self.path = pjoin(cachedir, self.db_filename)
+        self.modified = {}
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        util.ensuredir(self.cachedir)
+
+    def _get_conn(self):
+        # connections must not be shared with forked processes
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False)
+
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('PRAGMA foreign_keys = ON')
+            conn.executescript(self._schema)
+
+            self._conn = conn
+            self._pid = os.getpid()
+
+        return self._conn
+
+    def close(self):
+        '''Write pending modifications and close the database connection.'''
+
+        self.dump_modified()
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+
+            self._conn = None
+
+    def get(self, abspath):
+        '''Try to get an item from the cache.
+
+        :param abspath: absolute path of the object to retrieve
+
+        :returns: a :py:class:`TracesFile` object is returned or None if
+            nothing could be found.
+
+        '''
+
+        record_index = None
+        record_index_source = None
+        with self._lock:
+            if abspath in self.modified:
+                row_file, rows_traces, record_index = self.modified[abspath]
+            else:
+                conn = self._get_conn()
+                row_file = conn.execute(
+                    '''
+                        SELECT file_id, format, mtime FROM files
+                        WHERE path = ?
+                    ''', (abspath,)).fetchone()
+
+                if row_file is None:
+                    return None
+
+                rows_traces = conn.execute(
+                    '''
+                        SELECT network, station, location, channel,
+                            tmin, tmin_offset, tmax, deltat, mtime
+                        FROM traces WHERE file_id = ?
+                    ''', (row_file[0],)).fetchall()
+
+                row_file = row_file[1:]
+                record_index_source = self
+
+        fileformat, mtime = row_file
+        traces = []
+        for (net, sta, loc, cha, tmin, tmin_offset, tmax, deltat,
+                tr_mtime) in rows_traces:
+
+            if tmin_offset != 0.0:
+                tmin = util.hpfloat(tmin) + tmin_offset
+
+            traces.append(trace.Trace(
+                str(net), str(sta), str(loc), str(cha),
+                tmin=tmin, tmax=tmax, deltat=deltat, mtime=tr_mtime))
+
+        return TracesFile(
+            None, abspath, str(fileformat), mtime=mtime, traces=traces,
+            record_index=record_index,
+            record_index_source=record_index_source)
+
+    def get_record_index(self, abspath):
+        '''Get record index of a file from the cache.
+
+        :param abspath: absolute path of the file
+        :returns: record index (see
+            :py:func:`pyrocko.io.mseed.load_record_index`) or ``None``
+        '''
+
+        with self._lock:
+            if abspath in self.modified:
+                return self.modified[abspath][2]
+
+            row = self._get_conn().execute(
+                '''
+                    SELECT record_indices.data
+                    FROM record_indices JOIN files
+                        ON record_indices.file_id = files.file_id
+                    WHERE files.path = ?
+                ''', (abspath,)).fetchone()
+
+        if row is None:
+            return None
+
+        return num.frombuffer(row[0], dtype=mseed.record_index_dtype)
+
+    def put(self, abspath, tfile):
+        '''Put an item into the cache.
+
+        The item is written to the database on the next call to
+        :py:meth:`dump_modified`.
+
+        :param abspath: absolute path of the object to be stored
+        :param tfile: :py:class:`TracesFile` object to be stored
+        '''
+
+        rows_traces = []
+        for tr in tfile.traces:
+            tmin = float(tr.tmin)
+            rows_traces.append((
+                tr.network, tr.station, tr.location, tr.channel,
+                tmin, float(tr.tmin - tmin), float(tr.tmax),
+                float(tr.deltat), tr.mtime))
+
+        with self._lock:
+            self.modified[abspath] = (
+                (tfile.format, tfile.mtime), rows_traces, tfile.record_index)
+
+    def dump_modified(self):
+        '''Save any modifications to disk.'''
+
+        with self._lock:
+            if not self.modified:
+                return
+
+            conn = self._get_conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for abspath, (row_file, rows_traces, record_index) in \
+                        self.modified.items():
+
+                    conn.execute(
+                        'DELETE FROM files WHERE path = ?', (abspath,))
+
+                    file_id = conn.execute(
+                        '''
+                            INSERT INTO files (path, format, mtime)
+                            VALUES (?, ?, ?)
+                        ''', (abspath,) + row_file).lastrowid
+
+                    conn.executemany(
+                        '''
+                            INSERT INTO traces VALUES
+                            (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', [(file_id,) + row for row in rows_traces])
+
+                    if record_index is not None:
+                        conn.execute(
+                            '''
+                                INSERT INTO record_indices VALUES (?, ?)
+                            ''', (file_id, sqlite3.Binary(
+                                record_index.tobytes())))
+
+                conn.execute('COMMIT')
+
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+            self.modified = {}
+
+    def clean(self):
+        '''Weed out missing files from the database.'''
+
+        self.dump_modified()
+
+        with self._lock:
+            conn = self._get_conn()
+            missing = [
+                (file_id,) for (file_id, path) in conn.execute(
+                    'SELECT file_id, path FROM files')
+                if not os.path.isfile(path)]
+
+            if missing:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.executemany(
+                        'DELETE FROM files WHERE file_id = ?', missing)
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+
+    def _where(self, tmin, tmax, codes):
+        conditions = []
+        args = []
+        if tmin is not None:
+            conditions.append('traces.tmax >= ?')
+            args.append(float(tmin))
+
+        if tmax is not None:
+            conditions.append('traces.tmin <= ?')
+            args.append(float(tmax))
+
+        if codes is not None:
+            for k, pattern in zip(
+                    ('network', 'station', 'location', 'channel'), codes):
+
+                if pattern is not None and pattern != '*':
+                    conditions.append('traces.%s GLOB ?' % k)
+                    args.append(pattern)
+
+        if conditions:
+            return 'WHERE ' + ' AND '.join(conditions), args
+        else:
+            return '', args
+
+    def iter_traces(self, tmin=None, tmax=None, codes=None):
+        '''Query trace metainformation by time span and codes.
+
+        Only the matching entries are read from the database. Pending
+        modifications are written before the query.
+
+        :param tmin: start time of the time span or ``None``
+        :param tmax: end time of the time span or ``None``
+        :param codes: tuple of patterns ``(network, station, location,
+            channel)``, matched with shell-style wildcards (``*``, ``?``).
+            Entries may be ``None`` to match anything.
+
+        :yields: tuples ``(abspath, nslc_id, tmin, tmax, deltat)`` of traces
+            overlapping the time span
+        '''
+
+        self.dump_modified()
+
+        where, args = self._where(tmin, tmax, codes)
+        with self._lock:
+            rows = self._get_conn().execute(
+                '''
+                    SELECT files.path, traces.network, traces.station,
+                        traces.location, traces.channel, traces.tmin,
+                        traces.tmax, traces.deltat
+                    FROM traces JOIN files
+                        ON traces.file_id = files.file_id
+                ''' + where, args).fetchall()
+
+        for (path, net, sta, loc, cha, tmin_, tmax_, deltat) in rows:
+            yield path, (net, sta, loc, cha), tmin_, tmax_, deltat
+
+    def iter_paths(self, tmin=None, tmax=None, codes=None):
+        '''Query files containing traces matching time span and codes.
+
+        Arguments as in :py:meth:`iter_traces`.
+
+        :yields: absolute paths of the matching files
+        '''
+
+        self.dump_modified()
+
+        where, args = self._where(tmin, tmax, codes)
+        with self._lock:
+            rows = self._get_conn().execute(
+                '''
+                    SELECT DISTINCT files.path
+                    FROM traces JOIN files
+                        ON traces.file_id = files.file_id
+                ''' + where + '''
+                    ORDER BY files.path
+                ''', args).fetchall()
+
+        for (path,) in rows:
+            yield path
+
+    def get_nfiles(self):
+        '''Get number of files in the database.'''
+
+        self.dump_modified()
+        with self._lock:
+            return self._get_conn().execute(
+                'SELECT COUNT(*) FROM files').fetchone()[0]
+
+
 def get_cache(cachedir):
-    '''Get global TracesFileCache object for given directory.'''
-    if cachedir not in TracesFileCache.caches:
-        TracesFileCache.caches[cachedir] = TracesFileCache(cachedir)
+    '''Get global TracesFileIndex object for given directory.'''
+    if cachedir not in TracesFileIndex.caches:
+        TracesFileIndex.caches[cachedir] = TracesFileIndex(cachedir)
+
+    return TracesFileIndex.caches[cachedir]
+
+
+def scan_headers(abspath, fileformat, substitutions=None):
+    '''Read trace headers from file.
+
+    Duplicate snippets, e.g. from corrupt mseed files, are removed.
+
+    For miniSEED files without code substitutions, a record index is built
+    in the same pass (see :py:func:`pyrocko.io.mseed.load_record_index`).
+
+    :returns: tuple ``(traces, record_index)`` with a list of
+        :py:class:`pyrocko.trace.Trace` objects without data and the record
+        index or ``None``
+    '''
+
+    def kgen(tr):
+        return (tr.mtime, tr.tmin, tr.tmax) + tr.nslc_id
+
+    record_index = None
+    if fileformat == 'mseed' and not substitutions:
+        mtime = os.stat(abspath)[8]
+        traces_loaded, record_index = mseed.load_record_index(abspath)
+        for tr in traces_loaded:
+            tr.set_mtime(mtime)
+
+    else:
+        traces_loaded = io.load(
+            abspath,
+            format=fileformat,
+            getdata=False,
+            substitutions=substitutions)
+
+    ks = set()
+    traces = []
+    for tr in traces_loaded:
+
+        k = kgen(tr)
+        if k not in ks:
+            ks.add(k)
+            traces.append(tr)
 
-    return TracesFileCache.caches[cachedir]
+    return traces, record_index
+
+
+def scan_headers_chunk(chunk, fileformat):
+    '''Read trace headers from several files in a worker process.
+
+    To be used with :py:func:`pyrocko.parimap.parimap`.
+
+    :param chunk: list of tuples ``(abspath, substitutions)``
+    :returns: list of tuples ``(traces, record_index, error)``, one for each
+        file, where either ``traces`` and ``record_index`` are as returned by
+        :py:func:`scan_headers` or ``error`` is the exception which occurred
+        while reading the file.
+    '''
+
+    results = []
+    for abspath, substitutions in chunk:
+        try:
+            results.append(
+                scan_headers(abspath, fileformat, substitutions) + (None,))
+
+        except (io.FileLoadError, OSError) as e:
+            results.append((None, None, e))
+
+    return results
+
+
+def iter_scan_headers_parallel(items, fileformat, nprocs, chunksize):
+    '''Read trace headers from many files in a pool of worker processes.
+
+    :param items: list of tuples ``(abspath, substitutions)``
+    :yields: tuples ``(traces, record_index, error)`` in the order of
+        ``items`` (see
+        :py:func:`scan_headers_chunk`)
+
+    At most ``nprocs`` chunks of ``chunksize`` files are in flight; further
+    chunks are only handed out as results are consumed.
+    '''
+
+    chunks = [items[i:i+chunksize] for i in range(0, len(items), chunksize)]
+    for results in parimap(
+            scan_headers_chunk, chunks, [fileformat] * len(chunks),
+            nprocs=nprocs):
+
+        for result in results:
+            yield result
 
 
 def loader(
         filenames, fileformat, cache, filename_attributes,
-        show_progress=True, update_progress=None):
+        show_progress=True, update_progress=None, nprocs=None,
+        chunksize=32):
+
+    '''Generate :py:class:`TracesFile` objects for files.
+
+    Metainformation of unchanged files is taken from ``cache``. Headers of
+    new and modified files are read sequentially or, if ``nprocs`` is larger
+    than one, in a pool of ``nprocs`` worker processes, handing out chunks of
+    ``chunksize`` files. The cache is updated only from the calling process.
+
+    ``update_progress`` is called as ``update_progress(label, i, n)`` and
+    may return ``True`` to abort loading.
+    '''
 
     if show_progress_force_off:
         show_progress = False
@@ -418,22 +881,40 @@ def loader(
     to_load.sort(key=lambda x: x[2])
 
     nload = len([1 for x in to_load if x[0]])
+    nscan = nload
     iload = 0
 
+    scanned = None
+    if nprocs is not None and nprocs > 1 and nload > 1:
+        scanned = iter_scan_headers_parallel(
+            [(abspath, substitutions)
+             for (mustload, _, abspath, substitutions, _) in to_load
+             if mustload],
+            fileformat, nprocs, chunksize)
+
     count_all = False
     if nload < 0.01*len(to_load):
         nload = len(to_load)
         count_all = True
 
+    t0 = time.time()
     if to_load:
         progress = Progress('Scanning files', nload)
 
         for (mustload, mtime, abspath, substitutions, tfile) in to_load:
             try:
                 if mustload:
+                    traces = None
+                    record_index = None
+                    if scanned is not None:
+                        traces, record_index, error = next(scanned)
+                        if error is not None:
+                            raise error
+
                     tfile = TracesFile(
                         None, abspath, fileformat,
-                        substitutions=substitutions, mtime=mtime)
+                        substitutions=substitutions, mtime=mtime,
+                        traces=traces, record_index=record_index)
 
                     if cache and not substitutions:
                         cache.put(abspath, tfile)
@@ -452,10 +933,20 @@ def loader(
 
             abort = progress.update(iload+1)
             if abort:
+                if scanned is not None:
+                    scanned.close()
+
                 break
 
         progress.update(nload)
 
+    tscan = time.time() - t0
+    if nscan > 0 and tscan > 0.0:
+        logger.info(
+            'Scanned headers of %i file%s in %.1f s (%.0f files/s%s)' % (
+                nscan, util.plural_s(nscan), tscan, nscan / tscan,
+                ', %i processes' % nprocs if scanned is not None else ''))
+
     if failures:
         logger.warning(
             'The following file%s caused problems and will be ignored:\n' %
@@ -734,7 +1225,8 @@ class MemTracesFile(TracesGroup):
 class TracesFile(TracesGroup):
     def __init__(
             self, parent, abspath, format,
-            substitutions=None, mtime=None):
+            substitutions=None, mtime=None, traces=None, record_index=None,
+            record_index_source=None):
 
         TracesGroup.__init__(self, parent)
         self.abspath = abspath
@@ -742,8 +1234,20 @@ class TracesFile(TracesGroup):
         self.traces = []
         self.data_loaded = False
         self.data_use_count = 0
+        self.data_cache = None
         self.substitutions = substitutions
-        self.load_headers(mtime=mtime)
+        self.record_index = record_index
+        self._record_index_source = record_index_source
+        if traces is None:
+            self.load_headers(mtime=mtime)
+        else:
+            # header information known, e.g. from a TracesFileIndex
+            for tr in traces:
+                tr.file = self
+
+            self.traces = list(traces)
+            self.add(self.traces)
+
         self.mtime = mtime
 
     def load_headers(self, mtime=None):
@@ -751,46 +1255,69 @@ class TracesFile(TracesGroup):
         if mtime is None:
             self.mtime = os.stat(self.abspath)[8]
 
-        def kgen(tr):
-            return (tr.mtime, tr.tmin, tr.tmax) + tr.nslc_id
-
         self.remove(self.traces)
-        ks = set()
-        for tr in io.load(self.abspath,
-                          format=self.format,
-                          getdata=False,
-                          substitutions=self.substitutions):
+        self.traces, self.record_index = scan_headers(
+            self.abspath, self.format, self.substitutions)
+        self._record_index_source = None
 
-            k = kgen(tr)
-            if k not in ks:
-                ks.add(k)
-                self.traces.append(tr)
-                tr.file = self
+        for tr in self.traces:
+            tr.file = self
 
         self.add(self.traces)
 
         self.data_loaded = False
         self.data_use_count = 0
 
-    def load_data(self, force=False):
+    def read_data(self):
+        '''Read traces with data from the file.
+
+        Does not modify the file object, so that it can be used to load data
+        in a background thread. Use :py:meth:`load_data` to attach the data.
+
+        :returns: list of :py:class:`pyrocko.trace.Trace` objects
+        '''
+
+        logger.debug('loading data from file: %s' % self.abspath)
+
+        def kgen(tr):
+            return (tr.mtime, tr.tmin, tr.tmax) + tr.nslc_id
+
+        traces_ = io.load(self.abspath, format=self.format, getdata=True,
+                          substitutions=self.substitutions)
+
+        # prevent adding duplicate snippets from corrupt mseed files
+        k_loaded = set()
+        traces = []
+        for tr in traces_:
+            k = kgen(tr)
+            if k not in k_loaded:
+                k_loaded.add(k)
+                traces.append(tr)
+
+        return traces
+
+    def load_data(self, force=False, traces=None):
+        '''Load data from the file and attach it to the file's traces.
+
+        :param force: reload even if data is already loaded
+        :param traces: traces as returned by :py:meth:`read_data`, if
+            already read
+        :returns: ``True`` if the contents of the file have changed
+        '''
+
         file_changed = False
-        if not self.data_loaded or force:
-            logger.debug('loading data from file: %s' % self.abspath)
+        if self.data_loaded and not force:
+            if self.data_cache is not None:
+                self.data_cache.hit(self)
+
+        else:
+            if traces is None:
+                traces = self.read_data()
 
             def kgen(tr):
                 return (tr.mtime, tr.tmin, tr.tmax) + tr.nslc_id
 
-            traces_ = io.load(self.abspath, format=self.format, getdata=True,
-                              substitutions=self.substitutions)
-
-            # prevent adding duplicate snippets from corrupt mseed files
-            k_loaded = set()
-            traces = []
-            for tr in traces_:
-                k = kgen(tr)
-                if k not in k_loaded:
-                    k_loaded.add(k)
-                    traces.append(tr)
+            k_loaded = set(kgen(tr) for tr in traces)
 
             k_current_d = dict((kgen(tr), tr) for tr in self.traces)
             k_current = set(k_current_d)
@@ -818,12 +1345,70 @@ class TracesFile(TracesGroup):
                     ctr.ydata = tr.ydata
 
             self.data_loaded = True
+            if self.data_cache is not None:
+                self.data_cache.miss(self)
 
         if file_changed:
             logger.debug('reloaded (file may have changed): %s' % self.abspath)
 
         return file_changed
 
+    def get_record_index(self):
+        '''Get record index of the file, if available.
+
+        The index is fetched from the metainformation cache on first use.
+
+        :returns: record index (see
+            :py:func:`pyrocko.io.mseed.load_record_index`) or ``None``
+        '''
+
+        if self.record_index is None and self._record_index_source is not None:
+            self.record_index = self._record_index_source.get_record_index(
+                self.abspath)
+            self._record_index_source = None
+
+        return self.record_index
+
+    def load_data_window(self, tmin, tmax, nslc_ids=None):
+        '''Load data of a time window, reading only the needed records.
+
+        The traces returned are not attached to the file and hold at least
+        the samples within the time window, plus possibly some more from the
+        records touching the window.
+
+        :param nslc_ids: if given, restrict loading to these channels
+        :returns: list of :py:class:`pyrocko.trace.Trace` objects or ``None``
+            if no record index is available or the file has been modified
+        '''
+
+        record_index = self.get_record_index()
+        if record_index is None:
+            return None
+
+        mtime = os.stat(self.abspath)[8]
+        if mtime != self.mtime:
+            return None
+
+        blocks = mseed.select_blocks(record_index, tmin, tmax, nslc_ids)
+
+        logger.debug(
+            'loading %i of %i record blocks from file: %s' % (
+                blocks.size, record_index.size, self.abspath))
+
+        def kgen(tr):
+            return (tr.tmin, tr.tmax) + tr.nslc_id
+
+        k_loaded = set()
+        traces = []
+        for tr in mseed.iload_blocks(self.abspath, blocks):
+            k = kgen(tr)
+            if k not in k_loaded:
+                k_loaded.add(k)
+                tr.set_mtime(mtime)
+                traces.append(tr)
+
+        return traces
+
     def use_data(self):
         if not self.data_loaded:
             raise Exception('Data not loaded')
@@ -832,16 +1417,29 @@ class TracesFile(TracesGroup):
     def drop_data(self):
         if self.data_loaded:
             if self.data_use_count == 1:
-                logger.debug('forgetting data of file: %s' % self.abspath)
-                for tr in self.traces:
-                    tr.drop_data()
-
-                self.data_loaded = False
+                if self.data_cache is None:
+                    self.forget_data()
+                else:
+                    # kept until evicted from the pile's data cache
+                    self.data_use_count -= 1
+                    self.data_cache.release(self)
+                    return
 
             self.data_use_count -= 1
         else:
             self.data_use_count = 0
 
+    def forget_data(self):
+        '''Release the loaded data, regardless of its use count.'''
+
+        logger.debug('forgetting data of file: %s' % self.abspath)
+        for tr in self.traces:
+            tr.drop_data()
+
+        self.data_loaded = False
+        if self.data_cache is not None:
+            self.data_cache.remove(self)
+
     def reload_if_modified(self):
         mtime = os.stat(self.abspath)[8]
         if mtime != self.mtime:
@@ -849,6 +1447,8 @@ class TracesFile(TracesGroup):
                 'mtime=%i, reloading file: %s' % (mtime, self.abspath))
 
             self.mtime = mtime
+            self.record_index = None
+            self._record_index_source = None
             if self.data_loaded:
                 self.load_data(force=True)
             else:
@@ -972,15 +1572,233 @@ class SubPile(TracesGroup):
         return s
 
 
-class Pile(TracesGroup):
-    '''Waveform archive lookup, data loading and caching infrastructure.'''
+class TracesDataCache(object):
+    '''
+    Pile-wide LRU cache of loaded trace data with a memory budget.
+
+    Keeps track of the :py:class:`TracesFile` objects with loaded data, in
+    order of last access. Data of files no longer in use by any accessor is
+    kept in memory until the total size of the loaded data exceeds
+    ``nbytes_max``, when it is forgotten, least recently used first. Data of
+    files in use is never evicted, so the budget is exceeded when the data
+    currently in use is larger than the budget.
+
+    With a budget of zero, only data released by its last user (see
+    :py:meth:`TracesFile.drop_data`) is forgotten, immediately. Data loaded
+    by :py:meth:`Pile.chop` without being marked in use is then kept, as
+    the caller is responsible for releasing it.
+
+    :param nbytes_max: memory budget in bytes, ``None`` for no limit
+    '''
+
+    def __init__(self, nbytes_max=0):
+        self.nbytes_max = nbytes_max
+        self.nbytes = 0
+        self.nhits = 0
+        self.nmisses = 0
+        self.nevictions = 0
+        self._files = collections.OrderedDict()
+        self._released = set()
+
+    def hit(self, file):
+        '''Register access to a file with data already loaded.'''
+
+        self.nhits += 1
+        self._released.discard(file)
+        if file in self._files:
+            self._files[file] = self._files.pop(file)
+
+    def miss(self, file):
+        '''Register a file whose data has just been (re)loaded.'''
+
+        self.nmisses += 1
+        self.add(file)
+
+    def add(self, file):
+        '''Start or update tracking of a file with loaded data.'''
+
+        self.remove(file)
+        nbytes = sum(
+            tr.ydata.nbytes for tr in file.traces if tr.ydata is not None)
+
+        self._files[file] = nbytes
+        self.nbytes += nbytes
+
+    def remove(self, file):
+        '''Stop tracking a file, e.g. when its data has been forgotten.'''
+
+        nbytes = self._files.pop(file, None)
+        if nbytes is not None:
+            self.nbytes -= nbytes
+
+        self._released.discard(file)
+
+    def release(self, file):
+        '''Register that a file's data is no longer used by anyone.'''
+
+        if file in self._files:
+            self._released.add(file)
+
+        self.shrink()
+
+    def shrink(self):
+        '''Evict data of unused files until the budget is met.'''
+
+        if self.nbytes_max is None:
+            return
+
+        for file in list(self._files.keys()):
+            if self.nbytes <= self.nbytes_max:
+                break
+
+            if file.data_use_count <= 0 and (
+                    self.nbytes_max > 0 or file in self._released):
+
+                file.forget_data()
+                self.nevictions += 1
+
+    def get_stats(self):
+        '''
+        Get cache statistics.
+
+        :returns: dict with entries ``nhits``, ``nmisses``, ``nevictions``
+            (counts of full file data accesses and evictions), ``nfiles``,
+            ``nbytes`` (files and bytes currently loaded) and ``nbytes_max``
+        '''
+
+        return dict(
+            nhits=self.nhits,
+            nmisses=self.nmisses,
+            nevictions=self.nevictions,
+            nfiles=len(self._files),
+            nbytes=self.nbytes,
+            nbytes_max=self.nbytes_max)
+
+
+class PrefetchTask(object):
+    '''Function call to be executed by a :py:class:`Prefetcher`.'''
+
+    def __init__(self, func, args):
+        self._func = func
+        self._args = args
+        self._result = None
+        self._exception = None
+        self._done = threading.Event()
+
+    def run(self):
+        try:
+            self._result = self._func(*self._args)
+        except Exception as e:
+            self._exception = e
+
+        self._done.set()
+
+    def cancel(self):
+        self._exception = PrefetchCancelled()
+        self._done.set()
+
+    def get(self):
+        '''Wait for the task to finish and get its result.
+
+        Exceptions raised by the function are re-raised.
+        '''
+
+        self._done.wait()
+        if self._exception is not None:
+            raise self._exception
+
+        return self._result
+
+
+class PrefetchCancelled(Exception):
+    pass
+
+
+class Prefetcher(object):
+    '''Executes function calls in a background thread, in order.
+
+    Used by :py:meth:`Pile.chopper` to read and decode data ahead of time.
+    '''
 
     def __init__(self):
+        self._queue = queue.Queue()
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, func, *args):
+        '''Schedule ``func(*args)`` for execution.
+
+        :returns: :py:class:`PrefetchTask` object
+        '''
+
+        task = PrefetchTask(func, args)
+        self._queue.put(task)
+        return task
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+
+            if self._cancelled:
+                task.cancel()
+            else:
+                task.run()
+
+    def close(self):
+        '''Cancel pending tasks and stop the background thread.'''
+
+        self._cancelled = True
+        self._queue.put(None)
+        self._thread.join()
+
+
+class Pile(TracesGroup):
+    '''Waveform archive lookup, data loading and caching infrastructure.
+
+    When a time window extracted with :py:meth:`chop` or :py:meth:`chopper`
+    covers less than :py:attr:`partial_load_fraction` of the time span of a
+    miniSEED file, only the records overlapping the window are read from the
+    file, using the file's record index (see
+    :py:meth:`TracesFile.load_data_window`). Set it to zero to always load
+    complete files.
+
+    Loaded data is managed by a pile-wide :py:class:`TracesDataCache`. Data
+    of files no longer used by any accessor is kept in memory, until the
+    total size of the loaded data exceeds ``data_cache_nbytes``. The default
+    of zero forgets the data as soon as it is no longer used.
+
+    :param data_cache_nbytes: memory budget in bytes for loaded trace data,
+        ``None`` for no limit
+    '''
+
+    partial_load_fraction = 0.1
+
+    def __init__(self, data_cache_nbytes=0):
         TracesGroup.__init__(self, None)
         self.subpiles = {}
         self.open_files = {}
         self.listeners = []
         self.abspaths = set()
+        self.data_cache = TracesDataCache(data_cache_nbytes)
+
+    def set_data_cache_nbytes(self, nbytes):
+        '''Set memory budget of the data cache, ``None`` for no limit.'''
+
+        self.data_cache.nbytes_max = nbytes
+        self.data_cache.shrink()
+
+    def get_data_cache_stats(self):
+        '''
+        Get hit, miss and eviction counters and memory use of the data cache.
+
+        See :py:meth:`TracesDataCache.get_stats`.
+        '''
+
+        return self.data_cache.get_stats()
 
     def add_listener(self, obj):
         self.listeners.append(weakref.ref(obj))
@@ -997,12 +1815,20 @@ class Pile(TracesGroup):
             fileformat='mseed',
             cache=None,
             show_progress=True,
-            update_progress=None):
+            update_progress=None,
+            nprocs=None):
+
+        '''Add files to the pile.
+
+        See :py:func:`loader` for the parallel header scanning enabled by
+        ``nprocs``.
+        '''
 
         load = loader(
             filenames, fileformat, cache, filename_attributes,
             show_progress=show_progress,
-            update_progress=update_progress)
+            update_progress=update_progress,
+            nprocs=nprocs)
 
         self.add_files(load)
 
@@ -1025,6 +1851,16 @@ class Pile(TracesGroup):
         if file.abspath is not None:
             self.abspaths.add(file.abspath)
 
+        if isinstance(file, TracesFile):
+            file.data_cache = self.data_cache
+            if file.data_loaded:
+                self.data_cache.add(file)
+
+    def _detach_data_cache(self, file):
+        if isinstance(file, TracesFile) and file.data_cache is self.data_cache:
+            self.data_cache.remove(file)
+            file.data_cache = None
+
     def remove_file(self, file):
         subpile = file.get_parent()
         if subpile is not None:
@@ -1032,6 +1868,8 @@ class Pile(TracesGroup):
         if file.abspath is not None:
             self.abspaths.remove(file.abspath)
 
+        self._detach_data_cache(file)
+
     def remove_files(self, files):
         subpile_files = {}
         for file in files:
@@ -1047,6 +1885,8 @@ class Pile(TracesGroup):
                 if file.abspath is not None:
                     self.abspaths.remove(file.abspath)
 
+                self._detach_data_cache(file)
+
     def dispatch_key(self, file):
         dt = int(math.floor(math.log(file.deltatmin)))
         return dt
@@ -1069,15 +1909,42 @@ class Pile(TracesGroup):
             include_last=False,
             load_data=True):
 
+        return self._chop(
+            tmin, tmax, group_selector, trace_selector, snap, include_last,
+            load_data)
+
+    def _chop(
+            self, tmin, tmax, group_selector, trace_selector, snap,
+            include_last, load_data, prefetched=None):
+
         chopped = []
         used_files = set()
+        partial_files = {}
+        prefetched_full, prefetched_partial = prefetched or ({}, {})
 
         traces = self.relevant(tmin, tmax, group_selector, trace_selector)
         if load_data:
+            # make room for this window, evicting data of files loaded
+            # previously but not in use
+            self.data_cache.shrink()
+
             files_changed = False
             for tr in traces:
-                if tr.file and tr.file not in used_files:
-                    if tr.file.load_data():
+                if tr.file and tr.file not in used_files \
+                        and tr.file not in partial_files:
+
+                    if self._use_partial_load(tr.file, tmin, tmax):
+                        partial_files[tr.file] = prefetched_partial.get(
+                            tr.file, None)
+                        continue
+
+                    if tr.file in prefetched_full:
+                        file_changed = tr.file.load_data(
+                            traces=prefetched_full[tr.file].get())
+                    else:
+                        file_changed = tr.file.load_data()
+
+                    if file_changed:
                         files_changed = True
 
                     if tr.file is not None:
@@ -1087,6 +1954,10 @@ class Pile(TracesGroup):
                 traces = self.relevant(
                     tmin, tmax, group_selector, trace_selector)
 
+            if partial_files:
+                traces = self._load_partial(
+                    traces, partial_files, tmin, tmax, used_files)
+
         for tr in traces:
             if not load_data and tr.ydata is not None:
                 tr = tr.copy(data=False)
@@ -1104,6 +1975,84 @@ class Pile(TracesGroup):
 
         return chopped, used_files
 
+    def _use_partial_load(self, file, tmin, tmax):
+        if not isinstance(file, TracesFile) or file.data_loaded \
+                or file.format != 'mseed' or file.tmin is None:
+            return False
+
+        return (tmax - tmin) < self.partial_load_fraction \
+            * (file.tmax - file.tmin) and file.get_record_index() is not None
+
+    def _load_partial(self, traces, partial_files, tmin, tmax, used_files):
+        '''
+        Replace traces of files in ``partial_files`` by partially loaded ones.
+        '''
+
+        nslc_ids = dict((file, set()) for file in partial_files)
+        traces_keep = []
+        for tr in traces:
+            if tr.file in partial_files:
+                nslc_ids[tr.file].add(tr.nslc_id)
+            else:
+                traces_keep.append(tr)
+
+        for file, task in partial_files.items():
+            if task is not None:
+                traces_loaded = task.get()
+            else:
+                traces_loaded = file.load_data_window(
+                    tmin, tmax, nslc_ids[file])
+
+            if traces_loaded is None:
+                # index not usable, fall back to loading the complete file
+                file.load_data()
+                used_files.add(file)
+                traces_keep.extend(
+                    tr for tr in file.traces
+                    if tr.nslc_id in nslc_ids[file]
+                    and tr.tmin <= tmax and tmin <= tr.tmax)
+
+            else:
+                traces_keep.extend(traces_loaded)
+
+        return traces_keep
+
+    def _prefetch(
+            self, prefetcher, tmin, tmax, group_selector, trace_selector,
+            scheduled_full):
+
+        '''
+        Submit background loading of the data needed for a time window.
+
+        Files needing to be loaded completely are read with
+        :py:meth:`TracesFile.read_data`, unless already loaded or scheduled
+        (``scheduled_full``). Windows of files qualifying for partial loading
+        are read with :py:meth:`TracesFile.load_data_window`. The data is
+        attached to the files only when the window is processed in
+        :py:meth:`_chop`.
+        '''
+
+        full = {}
+        nslc_ids = {}
+        for tr in self.relevant(tmin, tmax, group_selector, trace_selector):
+            file = tr.file
+            if not isinstance(file, TracesFile):
+                continue
+
+            if self._use_partial_load(file, tmin, tmax):
+                nslc_ids.setdefault(file, set()).add(tr.nslc_id)
+
+            elif not file.data_loaded and file not in scheduled_full:
+                scheduled_full.add(file)
+                full[file] = prefetcher.submit(file.read_data)
+
+        partial = dict(
+            (file, prefetcher.submit(
+                file.load_data_window, tmin, tmax, nslc_ids[file]))
+            for file in nslc_ids)
+
+        return full, partial
+
     def _process_chopped(
             self, chopped, degap, maxgap, maxlap, want_incomplete, wmax, wmin,
             tpad):
@@ -1145,7 +2094,8 @@ class Pile(TracesGroup):
             group_selector=None, trace_selector=None,
             want_incomplete=True, degap=True, maxgap=5, maxlap=None,
             keep_current_files_open=False, accessor_id=None,
-            snap=(round, round), include_last=False, load_data=True):
+            snap=(round, round), include_last=False, load_data=True,
+            prefetch=0):
 
         '''
         Get iterator for shifting window wise data extraction from waveform
@@ -1181,6 +2131,10 @@ class Pile(TracesGroup):
         :param load_data: whether to load the waveform data. If set to
             ``False``, traces with no data samples, but with correct
             meta-information are returned
+        :param prefetch: number of windows for which the data is read and
+            decoded ahead in a background thread, while the caller processes
+            the current window. The data of at most this many windows is
+            held in addition to the current one.
         :returns: itererator yielding a list of :py:class:`pyrocko.trace.Trace`
             objects for every extracted time window
         '''
@@ -1207,23 +2161,82 @@ class Pile(TracesGroup):
 
         open_files = self.open_files[accessor_id]
 
-        iwin = 0
-        while True:
-            chopped = []
-            wmin, wmax = tmin+iwin*tinc, min(tmin+(iwin+1)*tinc, tmax)
-            eps = tinc*1e-6
-            if wmin >= tmax-eps:
-                break
+        def iter_windows():
+            iwin = 0
+            while True:
+                wmin, wmax = tmin+iwin*tinc, min(tmin+(iwin+1)*tinc, tmax)
+                eps = tinc*1e-6
+                if wmin >= tmax-eps:
+                    break
+
+                yield wmin, wmax
+                iwin += 1
+
+        windows = iter_windows()
+        prefetcher = None
+        if load_data and prefetch > 0:
+            prefetcher = Prefetcher()
+            scheduled_full = set()
+            ahead = collections.deque()
+
+            def schedule():
+                for wmin, wmax in windows:
+                    ahead.append((wmin, wmax, self._prefetch(
+                        prefetcher, wmin-tpad, wmax+tpad, group_selector,
+                        trace_selector, scheduled_full)))
+
+                    if len(ahead) > prefetch:
+                        break
+
+            def iter_prefetched():
+                schedule()
+                while ahead:
+                    wmin, wmax, prefetched = ahead.popleft()
+                    yield wmin, wmax, prefetched
+                    for file in prefetched[0]:
+                        scheduled_full.discard(file)
+
+                    schedule()
+
+            windows_prefetched = iter_prefetched()
+
+        else:
+            windows_prefetched = (
+                (wmin, wmax, None) for (wmin, wmax) in windows)
+
+        try:
+            for x in self._chopper_windows(
+                    windows_prefetched, open_files, tpad, group_selector,
+                    trace_selector, want_incomplete, degap, maxgap, maxlap,
+                    snap, include_last, load_data):
+
+                yield x
+
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+
+        if not keep_current_files_open:
+            while open_files:
+                file = open_files.pop()
+                file.drop_data()
 
-            chopped, used_files = self.chop(
+    def _chopper_windows(
+            self, windows, open_files, tpad, group_selector, trace_selector,
+            want_incomplete, degap, maxgap, maxlap, snap, include_last,
+            load_data):
+
+        for wmin, wmax, prefetched in windows:
+            chopped, used_files = self._chop(
                 wmin-tpad, wmax+tpad, group_selector, trace_selector, snap,
-                include_last, load_data)
+                include_last, load_data, prefetched)
 
             for file in used_files - open_files:
                 # increment datause counter on newly opened files
                 file.use_data()
 
             open_files.update(used_files)
+            self.data_cache.shrink()
 
             processed = self._process_chopped(
                 chopped, degap, maxgap, maxlap, want_incomplete, wmax, wmin,
@@ -1238,13 +2251,6 @@ class Pile(TracesGroup):
                 file.drop_data()
                 open_files.remove(file)
 
-            iwin += 1
-
-        if not keep_current_files_open:
-            while open_files:
-                file = open_files.pop()
-                file.drop_data()
-
     def all(self, *args, **kwargs):
         '''
         Shortcut to aggregate :py:meth:`chopper` output into a single list.
@@ -1412,7 +2418,8 @@ class Pile(TracesGroup):
 def make_pile(
         paths=None, selector=None, regex=None,
         fileformat='mseed',
-        cachedirname=None, show_progress=True):
+        cachedirname=None, show_progress=True, nprocs=None,
+        data_cache_nbytes=0):
 
     '''Create pile from given file and directory names.
 
@@ -1427,6 +2434,9 @@ def make_pile(
     :param cachedirname: loader cache is stored under this directory. It is
         created as neccessary.
     :param show_progress: show progress bar and other progress information
+    :param nprocs: number of processes to read trace headers in parallel
+    :param data_cache_nbytes: memory budget for loaded trace data, see
+        :py:class:`Pile`
     '''
 
     if show_progress_force_off:
@@ -1445,12 +2455,13 @@ def make_pile(
         paths, selector, regex, show_progress=show_progress)
 
     cache = get_cache(cachedirname)
-    p = Pile()
+    p = Pile(data_cache_nbytes=data_cache_nbytes)
     p.load_files(
         sorted(fns),
         cache=cache,
         fileformat=fileformat,
-        show_progress=show_progress)
+        show_progress=show_progress,
+        nprocs=nprocs)
 
     return p
 
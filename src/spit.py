@@ -8,6 +8,8 @@ import struct
 import logging
 import numpy as num
 
+from . import spit_ext
+
 logger = logging.getLogger('pyrocko.spit')
 
 or_ = num.logical_or
@@ -17,6 +19,9 @@ all_ = num.all
 any_ = num.any
 
 
+spit_ext_ndim_max = 10
+
+
 class OutOfBounds(Exception):
     pass
 
@@ -221,6 +226,8 @@ class SPTree(object):
         :param addargs: additional arguments to pass to f
         '''
 
+        self._flat = None
+
         if filename is None:
             assert all(v is not None for v in (f, ftol, xbounds, xtols))
 
@@ -353,8 +360,55 @@ class SPTree(object):
     def __call__(self, x):
         return self.interpolate(x)
 
-    def interpolate_many(self, x):
-        return self.root.interpolate_many(x)
+    def interpolate_many(self, x, nthreads=0):
+        '''
+        Interpolate at many points.
+
+        Uses the C implementation on a flattened copy of the tree.
+
+        :param x: points, array of shape ``(npoints, ndim)``
+        :param nthreads: number of threads to use, ``0`` to use all available
+        :returns: interpolated values, NaN where undefined
+        '''
+
+        x = num.ascontiguousarray(x, dtype=num.float)
+        if self.ndim > spit_ext_ndim_max:
+            return self.root.interpolate_many(x)
+
+        xbounds, a, b, f, ok, ichild_first, nchildren = self._get_flat()
+        return spit_ext.interpolate_many(
+            xbounds, a, b, f, ok, ichild_first, nchildren, x, nthreads)
+
+    def _get_flat(self):
+        if self._flat is None:
+            cells = [self.root]
+            ichild_first = []
+            nchildren = []
+            icell = 0
+            while icell < len(cells):
+                cell = cells[icell]
+                ichild_first.append(len(cells))
+                nchildren.append(len(cell.children))
+                cells.extend(cell.children)
+                icell += 1
+
+            def stack(attribute):
+                return num.ascontiguousarray(
+                    [getattr(cell, attribute) for cell in cells],
+                    dtype=num.float)
+
+            self._flat = (
+                stack('xbounds'),
+                stack('a'),
+                stack('b'),
+                stack('f').reshape((len(cells), 2**self.ndim)),
+                num.array(
+                    [all_(num.isfinite(cell.f)) for cell in cells],
+                    dtype=num.int8),
+                num.array(ichild_first, dtype=num.int32),
+                num.array(nchildren, dtype=num.int32))
+
+        return self._flat
 
     def _continue_fill(self):
         cells_to_continue, self.cells_to_continue = self.cells_to_continue, []
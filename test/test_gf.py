@@ -1,6 +1,7 @@
 from __future__ import division, print_function, absolute_import
 from builtins import range, next
 
+import os
 import time
 import sys
 import random
@@ -9,11 +10,13 @@ import unittest
 import logging
 import numpy as num
 import shutil
+from itertools import product
 from tempfile import mkdtemp
 
 from pyrocko import guts
 from pyrocko import gf, util, cake, ahfullgreen, trace
 from pyrocko.fomosto import ahfullgreen as fomosto_ahfullgreen
+from pyrocko.fomosto import dummy as fomosto_dummy
 
 from .common import Benchmark
 
@@ -235,6 +238,34 @@ class GFTestCase(unittest.TestCase):
         store.close()
         return store_dir
 
+    def _create_regional_ttt_store_type_b(self):
+
+        conf = gf.ConfigTypeB(
+            id='empty_regional_b',
+            receiver_depth_min=0.,
+            receiver_depth_max=2*km,
+            receiver_depth_delta=1*km,
+            source_depth_min=0.,
+            source_depth_max=20*km,
+            source_depth_delta=10*km,
+            distance_min=1000*km,
+            distance_max=1100*km,
+            distance_delta=20*km,
+            sample_rate=2.0,
+            ncomponents=10,
+            earthmodel_1d=cake.load_model(),
+            tabulated_phases=[gf.TPDef(id='P', definition='P')])
+
+        store_dir = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(store_dir)
+
+        gf.Store.create(store_dir, config=conf)
+        store = gf.Store(store_dir)
+        store.make_ttt()
+
+        store.close()
+        return store_dir
+
     def _create_pulse_store(self):
 
         conf = gf.ConfigTypeB(
@@ -450,6 +481,151 @@ class GFTestCase(unittest.TestCase):
 
         store.close()
 
+    def test_compression(self):
+        nrecords = 20
+
+        datas = []
+        for i in range(nrecords):
+            n = random.randint(0, 500)
+            data = num.cumsum(num.repeat(
+                num.random.normal(size=n//50+1), 50)[:n])
+            if i % 5 == 0:
+                data[:] = 0.0
+
+            datas.append(data.astype(gf.gf_dtype))
+
+        stores = []
+        for compression in (None, 'zlib'):
+            d = mkdtemp(prefix='gfstore')
+            self.tempdirs.append(d)
+            gf.BaseStore.create(d, 1.0, nrecords, compression=compression)
+            store = gf.BaseStore(d, mode='w')
+            for i, data in enumerate(datas):
+                store.put(i, gf.GFTrace(data=data, itmin=i))
+
+            store.close()
+            stores.append(gf.BaseStore(d))
+
+        store, store_z = stores
+        assert store.compression is None
+        assert store_z.compression == 'zlib'
+        assert store_z.size_data < store.size_data
+
+        for i in range(nrecords):
+            for implementation in ('c', 'python'):
+                tra = store.get(i, implementation=implementation)
+                trb = store_z.get(i, implementation=implementation)
+                self.assertEqual(tra.itmin, trb.itmin)
+                num.testing.assert_equal(tra.data, trb.data)
+
+        for i in range(50):
+            n = random.randint(0, 5)
+            indices = num.random.randint(nrecords, size=n)
+            weights = num.random.random(n)
+            shifts = num.random.random(n)*nrecords
+
+            a = store.sum(indices, shifts, weights)
+            b = store_z.sum(indices, shifts, weights)
+            self.assertEqual(a.itmin, b.itmin)
+            num.testing.assert_equal(a.data, b.data)
+
+        # records used repeatedly within one summation, as by neighboring
+        # source points, and static summation in several threads
+        ntargets = 7
+        indices = num.random.randint(
+            nrecords, size=ntargets*30).astype(num.uint64)
+        weights = num.random.random(indices.size).astype(num.float32)
+        delays = num.random.random(3).astype(num.float32) * nrecords
+
+        a = store.sum(indices, num.repeat(delays, 70), weights)
+        b = store_z.sum(indices, num.repeat(delays, 70), weights)
+        self.assertEqual(a.itmin, b.itmin)
+        num.testing.assert_equal(a.data, b.data)
+
+        for it in range(0, 500, 50):
+            for nthreads in (1, 4):
+                a = store.sum_statics(
+                    indices, delays, weights, it, ntargets, nthreads)
+                b = store_z.sum_statics(
+                    indices, delays, weights, it, ntargets, nthreads)
+                num.testing.assert_equal(a, b)
+
+        store.close()
+        store_z.close()
+
+        store_dir = self.get_pulse_store_dir()
+        store_dir_z = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(store_dir_z)
+
+        store = gf.Store(store_dir)
+        store.make_converted(store_dir_z, compression='zlib', force=True)
+        store_z = gf.Store(store_dir_z)
+        assert store_z.config.compression == 'zlib'
+        assert store_z.compression == 'zlib'
+
+        sources = [
+            gf.ExplosionSource(time=0.0, depth=100., moment=1.0),
+            gf.RectangularExplosionSource(
+                time=0.0, depth=300., length=200., width=100., dip=45.,
+                strike=30., anchor='top', moment=1.0)]
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA', '', component),
+                north_shift=500.,
+                east_shift=100.)
+            for component in 'NEZ']
+
+        responses = []
+        for d in (store_dir, store_dir_z):
+            engine = gf.LocalEngine(store_dirs=[d])
+            responses.append(engine.process(sources, targets))
+
+        for tra, trb in zip(*[resp.pyrocko_traces() for resp in responses]):
+            assert tra.tmin == trb.tmin
+            num.testing.assert_equal(tra.ydata, trb.ydata)
+
+    def test_record_order(self):
+        store_dir = self.get_pulse_store_dir()
+        store = gf.Store(store_dir)
+
+        conf = store.config
+        num.testing.assert_equal(
+            gf.store.tiled_irecords(conf, (1, 7)), num.arange(conf.nrecords))
+
+        irecords = gf.store.tiled_irecords(conf, (3, 4))
+        num.testing.assert_equal(
+            num.sort(irecords), num.arange(conf.nrecords))
+
+        # first tile: 3 source depths times 4 distances, all components
+        ng = conf.ncomponents
+        ndist = len(conf.coords[2])
+        num.testing.assert_equal(
+            irecords[:3*4*ng],
+            [(isd*ndist + idist)*ng + ig
+             for isd in range(3) for idist in range(4) for ig in range(ng)])
+
+        # pulse store has equal depth and distance spacing
+        assert gf.store.default_tile_shape(conf, 2048, 4096) == (1, 1)
+        assert gf.store.default_tile_shape(conf, 400, 4096) == (3, 1)
+
+        store_dir_z = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(store_dir_z)
+        store.make_converted(
+            store_dir_z, record_order='tiled', tile_shape=(3, 4), force=True)
+        store_z = gf.Store(store_dir_z)
+        store_z.open()
+
+        offsets = store_z._records['data_offset'][irecords]
+        offsets = offsets[offsets > 2]
+        assert num.all(num.diff(offsets.astype(num.int64)) > 0)
+
+        for irecord in range(0, store.config.nrecords, 7):
+            tra = gf.BaseStore.get(store, irecord)
+            trb = gf.BaseStore.get(store_z, irecord)
+            assert tra.itmin == trb.itmin
+            num.testing.assert_equal(tra.data, trb.data)
+
     def test_store_dir_type(self):
         with self.assertRaises(TypeError):
             gf.LocalEngine(store_dirs='dummy')
@@ -509,6 +685,784 @@ class GFTestCase(unittest.TestCase):
 
             self.assertTrue(numeq(data, tr.ydata, 0.01))
 
+    def test_process_nprocs(self):
+        store_dir = self.get_pulse_store_dir()
+        engine = gf.LocalEngine(store_dirs=[store_dir])
+
+        sources = [
+            gf.ExplosionSource(
+                time=0.0,
+                depth=depth,
+                moment=moment)
+
+            for moment in (1.0, 2.0) for depth in [100., 200., 300.]
+        ]
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA%i' % ista, '', component),
+                north_shift=500. + ista * 50.,
+                east_shift=ista * 30.)
+
+            for component in 'ZNE' for ista in range(5)
+        ]
+
+        resps = [engine.process(sources, targets, nprocs=nprocs)
+                 for nprocs in (1, 3)]
+
+        iters = [resp.iter_results() for resp in resps]
+        for i in range(len(sources) * len(targets)):
+            s1, t1, tr1 = next(iters[0])
+            s2, t2, tr2 = next(iters[1])
+            self.assertEqual(t1.codes, t2.codes)
+            self.assertEqual(tr1.tmin, tr2.tmin)
+            assert_ae(tr1.ydata, tr2.ydata)
+
+    def test_seismograms(self):
+        store_dir = self.get_pulse_store_dir()
+        store = gf.Store(store_dir)
+
+        source = gf.RectangularExplosionSource(
+            depth=200.,
+            moment=1.0,
+            length=100.,
+            width=0.,
+            nucleation_x=-1).discretize_basesource(store)
+
+        receivers = [
+            gf.Receiver(
+                north_shift=500. + irec * 40.,
+                east_shift=irec * 25.,
+                depth=0.)
+            for irec in range(10)]
+
+        components = ['displacement.n', 'displacement.d']
+
+        for interpolation in ('nearest_neighbor', 'multilinear'):
+            seismograms = store.seismograms(
+                source, receivers, components,
+                interpolation=interpolation)
+
+            assert len(seismograms) == len(receivers)
+            for receiver, seismogram in zip(receivers, seismograms):
+                seismogram_ref = store.seismogram(
+                    source, receiver, components,
+                    interpolation=interpolation)
+
+                for comp in components:
+                    tr = seismogram[comp]
+                    tr_ref = seismogram_ref[comp]
+                    self.assertEqual(tr.itmin, tr_ref.itmin)
+                    assert_ae(tr.data, tr_ref.data)
+
+    def test_dsource_cache(self):
+        store_dir = self.get_pulse_store_dir()
+        store = gf.Store(store_dir)
+
+        def make_source(magnitude, **kwargs):
+            return gf.RectangularSource(
+                depth=300.,
+                length=100.,
+                width=50.,
+                magnitude=magnitude,
+                **kwargs)
+
+        cache = gf.DiscretizedSourceCache()
+        for magnitude in (4.0, 5.0, 4.0):
+            source = make_source(magnitude)
+            dsource = cache.get(source, store)
+            dsource_ref = source.discretize_basesource(store)
+            num.testing.assert_allclose(dsource.m6s, dsource_ref.m6s)
+
+        assert cache.n_misses == 1
+        assert cache.n_hits == 2
+        assert len(cache) == 1
+
+        nbytes = cache.nbytes
+        cache.set_nbytes_max(2 * nbytes)
+        for strike in (10., 20., 30.):
+            cache.get(make_source(4.0, strike=strike), store)
+
+        assert len(cache) == 2
+        assert cache.n_evictions == 2
+        assert cache.nbytes == 2 * nbytes
+
+        cache.invalidate(store_dir='nonexistent')
+        assert len(cache) == 2
+        cache.invalidate()
+        assert len(cache) == 0
+        assert cache.nbytes == 0
+
+    def test_base_seismograms_batch_size(self):
+        store_dir = self.get_pulse_store_dir()
+        engine = gf.LocalEngine(store_dirs=[store_dir])
+
+        source = gf.ExplosionSource(time=0.0, depth=200., moment=1.0)
+        targets = [
+            gf.Target(
+                codes=('', 'STA%i' % i, '', 'Z'),
+                north_shift=500. + 3.*i,
+                east_shift=100.)
+            for i in range(150)]
+
+        resp_ref = engine.process(source, targets)
+
+        ntargets = []
+        base_seismograms = engine.base_seismograms
+
+        def base_seismograms_counting(source, targets, *args):
+            ntargets.append(len(targets))
+            return base_seismograms(source, targets, *args)
+
+        engine.base_seismograms = base_seismograms_counting
+        resp = engine.process(source, targets)
+
+        # base seismograms held in memory together are limited
+        assert sum(ntargets) == len(targets)
+        assert max(ntargets) <= 64
+
+        for tr, tr_ref in zip(
+                resp.pyrocko_traces(), resp_ref.pyrocko_traces()):
+            num.testing.assert_equal(tr.ydata, tr_ref.ydata)
+
+    def test_iter_process(self):
+        store_dir = self.get_pulse_store_dir()
+        engine = gf.LocalEngine(store_dirs=[store_dir])
+
+        sources = [
+            gf.ExplosionSource(time=0.0, depth=depth, moment=1.0)
+            for depth in (100., 200., 300.)]
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA%i' % i, '', component),
+                north_shift=500.*i,
+                east_shift=100.)
+            for i in range(1, 3)
+            for component in 'NEZ']
+
+        resp = engine.process(sources, targets)
+
+        for nprocs in (None, 2):
+            iresults = set()
+            for isource, itarget, result in engine.iter_process(
+                    sources, targets, nprocs=nprocs):
+
+                tr = result.trace.pyrocko_trace()
+                tr_ref = resp.results_list[isource][itarget] \
+                    .trace.pyrocko_trace()
+
+                assert tr.nslc_id == tr_ref.nslc_id
+                num.testing.assert_equal(tr.ydata, tr_ref.ydata)
+                iresults.add((isource, itarget))
+
+            assert len(iresults) == len(sources) * len(targets)
+
+        it = engine.iter_process(sources, targets)
+        isource, itarget, result = next(it)
+        assert isinstance(result, gf.Result)
+        it.close()
+
+        # single source, many targets: results arrive before all base
+        # seismograms have been computed
+        targets = [
+            gf.Target(
+                codes=('', 'STA%i' % i, '', 'Z'),
+                north_shift=500. + 3.*i,
+                east_shift=100.)
+            for i in range(150)]
+
+        ntargets = []
+        base_seismograms = engine.base_seismograms
+
+        def base_seismograms_counting(source, targets, *args):
+            ntargets.append(len(targets))
+            return base_seismograms(source, targets, *args)
+
+        engine.base_seismograms = base_seismograms_counting
+        nresults = 0
+        for isource, itarget, result in engine.iter_process(
+                sources[0], targets):
+
+            if nresults == 0:
+                assert sum(ntargets) < len(targets)
+
+            nresults += 1
+
+        assert nresults == len(targets)
+        assert sum(ntargets) == len(targets)
+
+    def test_process_array(self):
+        store_dir = self.get_pulse_store_dir()
+        engine = gf.LocalEngine(store_dirs=[store_dir])
+
+        sources = [
+            gf.ExplosionSource(time=time, depth=depth, moment=1.0)
+            for (time, depth) in ((0.0, 100.), (1.5, 200.), (-2.0, 300.))]
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA%i' % i, '', component),
+                north_shift=500.*i,
+                east_shift=100.)
+            for i in range(1, 3)
+            for component in 'NEZ']
+
+        resp = engine.process(sources, targets)
+
+        for nprocs in (None, 2):
+            aresp = engine.process_array(sources, targets, nprocs=nprocs)
+            assert aresp.data.dtype == num.float32
+            assert aresp.data.flags.c_contiguous
+            assert aresp.data.shape[:2] == (len(sources), len(targets))
+            assert not aresp.errors
+
+            for isource, itarget in product(
+                    range(len(sources)), range(len(targets))):
+
+                tr_ref = resp.results_list[isource][itarget] \
+                    .trace.pyrocko_trace()
+                tr = aresp.trace(isource, itarget)
+                assert tr.nslc_id == tr_ref.nslc_id
+                assert tr.deltat == aresp.deltat == tr_ref.deltat
+                assert abs(tr.tmin - tr_ref.tmin) < 1e-6
+                num.testing.assert_allclose(
+                    tr.ydata, tr_ref.ydata, rtol=1e-6, atol=1e-30)
+
+                n = aresp.nsamples[isource, itarget]
+                assert num.all(
+                    aresp.data[isource, itarget, n:] == tr.ydata[-1])
+
+        assert len(aresp.pyrocko_traces()) == len(sources) * len(targets)
+
+        aresp = engine.process_array(sources, targets, nsamples=10)
+        assert aresp.data.shape == (len(sources), len(targets), 10)
+        assert num.all(aresp.nsamples <= 10)
+
+        with self.assertRaises(gf.BadRequest):
+            engine.process_array(sources, [gf.StaticTarget(
+                north_shifts=num.zeros(1),
+                east_shifts=num.zeros(1),
+                store_id=targets[0].store_id)])
+
+    def test_result_cache(self):
+        store_dir = self.get_pulse_store_dir()
+        cache_dir = mkdtemp(prefix='gfresultcache')
+        self.tempdirs.append(cache_dir)
+
+        engine = gf.LocalEngine(
+            store_dirs=[store_dir], result_cache_dir=cache_dir)
+
+        sources = [
+            gf.ExplosionSource(time=0.0, depth=100., moment=moment)
+            for moment in (1.0, 2.0)]
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA', '', component),
+                north_shift=500.,
+                east_shift=100.)
+            for component in 'NEZ']
+
+        resp1 = engine.process(sources, targets)
+        assert resp1.stats.n_result_cache_hits == 0
+        assert resp1.stats.n_result_cache_misses == 6
+
+        resp2 = engine.process(sources, targets)
+        assert resp2.stats.n_result_cache_hits == 6
+        assert resp2.stats.n_result_cache_misses == 0
+
+        for tr1, tr2 in zip(resp1.pyrocko_traces(), resp2.pyrocko_traces()):
+            assert tr1.nslc_id == tr2.nslc_id
+            assert tr1.tmin == tr2.tmin
+            assert tr1.deltat == tr2.deltat
+            num.testing.assert_equal(tr1.ydata, tr2.ydata)
+
+        sources.append(
+            gf.ExplosionSource(time=0.0, depth=100., moment=3.0))
+        resp3 = engine.process(sources, targets)
+        assert resp3.stats.n_result_cache_hits == 6
+        assert resp3.stats.n_result_cache_misses == 3
+        assert len(resp3.pyrocko_traces()) == 9
+
+        cache = engine.result_cache
+        nbytes = cache.nbytes
+        assert nbytes > 0
+        cache.shrink(nbytes // 2)
+        assert 0 < cache.nbytes <= nbytes // 2
+        cache.clear()
+        assert cache.nbytes == 0
+
+    def test_statics_chunked(self):
+        conf = gf.ConfigTypeA(
+            id='random_statics',
+            source_depth_min=0.,
+            source_depth_max=10*km,
+            source_depth_delta=1*km,
+            distance_min=0.,
+            distance_max=40*km,
+            distance_delta=1*km,
+            sample_rate=1.0,
+            ncomponents=10)
+
+        store_dir = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(store_dir)
+
+        gf.Store.create(store_dir, config=conf)
+        store = gf.Store(store_dir, 'w')
+        for args in conf.iter_nodes():
+            tr = gf.GFTrace(
+                data=num.random.normal(size=5),
+                itmin=0,
+                deltat=conf.deltat)
+            store.put(args, tr)
+
+        store.close()
+
+        source = gf.RectangularSource(
+            depth=5*km, length=6*km, width=3*km, dip=60., strike=30.,
+            rake=90., magnitude=6.)
+
+        npoints = 2000
+        target = gf.SatelliteTarget(
+            north_shifts=num.random.uniform(-10*km, 10*km, npoints),
+            east_shifts=num.random.uniform(-10*km, 10*km, npoints),
+            phi=num.full(npoints, num.pi/2.),
+            theta=num.full(npoints, num.pi/4.),
+            tsnapshot=2.,
+            interpolation='multilinear')
+
+        resp_ref = gf.LocalEngine(store_dirs=[store_dir]).process(
+            source, target, nthreads=1)
+
+        result_ref = resp_ref.static_results()[0].result
+
+        for nthreads in (1, 3):
+            engine = gf.LocalEngine(
+                store_dirs=[store_dir], statics_nbytes_max=100*1024)
+
+            result = engine.process(
+                source, target, nthreads=nthreads).static_results()[0].result
+
+            for k in result_ref:
+                num.testing.assert_equal(result[k], result_ref[k])
+
+    def test_mt_basis(self):
+        conf = gf.ConfigTypeA(
+            id='random_mt',
+            source_depth_min=0.,
+            source_depth_max=2*km,
+            source_depth_delta=1*km,
+            distance_min=1*km,
+            distance_max=10*km,
+            distance_delta=1*km,
+            sample_rate=10.0,
+            ncomponents=10)
+
+        store_dir = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(store_dir)
+
+        gf.Store.create(store_dir, config=conf)
+        store = gf.Store(store_dir, 'w')
+        for args in conf.iter_nodes():
+            tr = gf.GFTrace(
+                data=num.random.normal(size=random.randint(5, 20)),
+                itmin=random.randint(0, 10),
+                deltat=conf.deltat)
+            store.put(args, tr)
+
+        store.close()
+
+        engine = gf.LocalEngine(store_dirs=[store_dir])
+
+        sources = [
+            gf.DCSource(
+                time=float(i),
+                depth=1*km,
+                strike=random.uniform(0., 360.),
+                dip=random.uniform(0., 90.),
+                rake=random.uniform(-180., 180.),
+                magnitude=random.uniform(4., 6.))
+            for i in range(8)]
+
+        sources.extend(
+            gf.MTSource(depth=1*km, m6=num.random.normal(size=6))
+            for i in range(2))
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA%i' % i, '', component),
+                north_shift=random.uniform(2*km, 6*km),
+                east_shift=random.uniform(2*km, 6*km))
+            for i in range(3)
+            for component in 'NEZ']
+
+        request = gf.Request(sources=sources, targets=targets)
+        assert len(request.subsources_map()) == len(sources)
+        assert len(request.subsources_map(mt_basis=True)) == 1
+
+        resp_ref = engine.process(request)
+        resp = engine.process(request, mt_basis=True)
+
+        for tr_ref, tr in zip(resp_ref.pyrocko_traces(),
+                              resp.pyrocko_traces()):
+
+            assert tr_ref.nslc_id == tr.nslc_id
+            assert abs(tr_ref.tmin - tr.tmin) < 1e-6
+            num.testing.assert_allclose(
+                tr.ydata, tr_ref.ydata,
+                atol=1e-5 * num.max(num.abs(tr_ref.ydata)), rtol=1e-4)
+
+    def test_stf_fft(self):
+        store_dir = self._create_smooth_store()
+        engine = gf.LocalEngine(store_dirs=[store_dir])
+
+        base = gf.RectangularSource(
+            depth=10*km, length=20*km, width=5*km, dip=60., strike=20.,
+            rake=45., nucleation_x=-0.5, velocity=2.5*km, magnitude=6.0)
+
+        sources = []
+        for i, stf_class in enumerate(
+                [gf.BoxcarSTF, gf.TriangularSTF, gf.HalfSinusoidSTF]):
+            for duration in (0.0, 1.3, 4.7, 12.0):
+                source = base.clone(
+                    time=0.37 * i,
+                    stf=stf_class(duration=duration))
+                sources.append(source)
+
+        sources.append(base.clone())
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA%i' % i, '', component),
+                north_shift=distance * math.cos(i),
+                east_shift=distance * math.sin(i),
+                store_id='smooth')
+            for (i, distance) in enumerate([50*km, 150*km, 300*km])
+            for component in 'NEZ']
+
+        request = gf.Request(sources=sources, targets=targets)
+        assert len(request.subsources_map()) == 1
+
+        resp_ref = engine.process(request)
+        resp = engine.process(request, stf_fft=True)
+
+        assert resp.stats.n_records_stacked \
+            < resp_ref.stats.n_records_stacked
+
+        for tr_ref, tr in zip(resp_ref.pyrocko_traces(),
+                              resp.pyrocko_traces()):
+
+            assert tr_ref.nslc_id == tr.nslc_id
+            assert abs(tr_ref.tmin - tr.tmin) < 1e-6
+            assert tr_ref.ydata.size == tr.ydata.size
+            num.testing.assert_allclose(
+                tr.ydata, tr_ref.ydata,
+                atol=1e-9 * num.max(num.abs(tr_ref.ydata)), rtol=0.)
+
+        data_ref = engine.process_array(request).data
+        data = engine.process_array(request, stf_fft=True).data
+        num.testing.assert_allclose(
+            data, data_ref, atol=1e-6 * num.max(num.abs(data_ref)), rtol=0.)
+
+    def _create_random_store(self, seed=0, changed_records=()):
+        conf = gf.ConfigTypeA(
+            id='random_decimate',
+            source_depth_min=0.,
+            source_depth_max=10*km,
+            source_depth_delta=2*km,
+            distance_min=1*km,
+            distance_max=20*km,
+            distance_delta=1*km,
+            sample_rate=10.,
+            ncomponents=2,
+            component_scheme='elastic2')
+
+        store_dir = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(store_dir)
+
+        gf.Store.create(store_dir, config=conf)
+        store = gf.Store(store_dir, mode='w')
+        rstate = num.random.RandomState(seed)
+        for irecord, args in enumerate(conf.iter_nodes()):
+            data = rstate.normal(size=rstate.randint(10, 50))
+            if irecord in changed_records:
+                data *= 2.
+
+            tr = gf.GFTrace(
+                data=data, itmin=rstate.randint(-10, 10), deltat=conf.deltat)
+            store.put(args, tr)
+
+        store.close()
+        return store_dir
+
+    def _create_smooth_store(self):
+        conf = gf.ConfigTypeA(
+            id='smooth',
+            source_depth_min=0.,
+            source_depth_max=20*km,
+            source_depth_delta=2*km,
+            distance_min=10*km,
+            distance_max=500*km,
+            distance_delta=2*km,
+            sample_rate=1.0,
+            ncomponents=10,
+            earthmodel_1d=cake.load_model())
+
+        store_dir = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(store_dir)
+
+        gf.Store.create(store_dir, config=conf)
+        store = gf.Store(store_dir, mode='w')
+        for args in conf.iter_nodes():
+            sz, x, ig = args
+            t0 = math.sqrt(x**2 + sz**2) / (6.*km)
+            itmin = int(math.floor(t0)) - 20
+            t = (itmin + num.arange(40)) * conf.deltat
+            data = num.exp(-((t - t0) / 4.)**2) * (1. + 0.1*ig) * km / x
+            store.put(args, gf.GFTrace(data=data, itmin=itmin, deltat=1.0))
+
+        store.close()
+        return store_dir
+
+    def test_merge_subsources(self):
+        store_dir = self._create_smooth_store()
+
+        source = gf.RectangularSource(
+            depth=10*km, length=30*km, width=10*km, dip=60., strike=20.,
+            rake=45., nucleation_x=-0.5, nucleation_y=0., velocity=2.5*km,
+            magnitude=6.5)
+
+        targets = [
+            gf.Target(
+                codes=('', '%i' % (distance/km), '%i' % azimuth, 'NEZ'[icha]),
+                north_shift=distance * math.cos(azimuth*d2r),
+                east_shift=distance * math.sin(azimuth*d2r),
+                quantity='displacement',
+                store_id='smooth')
+            for distance in (40*km, 400*km)
+            for azimuth in (10., 130.)
+            for icha in range(3)]
+
+        engine_full = gf.LocalEngine(store_dirs=[store_dir])
+        resp_full = engine_full.process(source, targets)
+        assert resp_full.stats.n_records_merged == 0
+
+        engine = gf.LocalEngine(store_dirs=[store_dir], merge_tolerance=0.5)
+        resp = engine.process(source, targets)
+
+        assert resp.stats.n_records_merged > 0
+        assert resp.stats.n_records_stacked \
+            < resp_full.stats.n_records_stacked
+
+        fractions = []
+        for result_full, result in zip(
+                resp_full.results_list[0], resp.results_list[0]):
+
+            tr_full = result_full.trace.pyrocko_trace()
+            tr = result.trace.pyrocko_trace()
+            tmin = max(tr.tmin, tr_full.tmin)
+            tmax = min(tr.tmax, tr_full.tmax)
+            amax = num.max(num.abs(tr_full.ydata))
+            tr.chop(tmin, tmax)
+            tr_full.chop(tmin, tmax)
+            assert num.max(num.abs(tr.ydata - tr_full.ydata)) < 0.01 * amax
+
+            fractions.append(result.n_records_merged)
+
+        # coarser merging at larger distance
+        assert fractions[0] < fractions[-1]
+
+        # engines with and without merging sharing a result cache
+        cache_dir = mkdtemp(prefix='gfresultcache')
+        self.tempdirs.append(cache_dir)
+
+        def data(resp):
+            return [tr.ydata for tr in resp.pyrocko_traces()]
+
+        resps = {}
+        for tolerance in (None, 0.5, None, 0.5):
+            engine = gf.LocalEngine(
+                store_dirs=[store_dir], merge_tolerance=tolerance,
+                result_cache_dir=cache_dir)
+
+            resps.setdefault(tolerance, []).append(
+                engine.process(source, targets))
+
+        for tolerance, resp_ref in ((None, resp_full), (0.5, resp)):
+            resp1, resp2 = resps[tolerance]
+            assert resp1.stats.n_result_cache_hits == 0
+            assert resp2.stats.n_result_cache_hits == len(targets)
+            for resp_ in (resp1, resp2):
+                for a, b in zip(data(resp_), data(resp_ref)):
+                    num.testing.assert_equal(a, b)
+
+        assert any(
+            a.size != b.size or num.any(a != b)
+            for (a, b) in zip(data(resps[None][1]), data(resps[0.5][1])))
+
+    def test_decimate_parallel_incremental(self):
+
+        def compare_stores(dir_a, dir_b):
+            store_a = gf.Store(dir_a)
+            store_b = gf.Store(dir_b)
+            for args in store_a.config.iter_nodes():
+                tr_a = store_a.get(args)
+                tr_b = store_b.get(args)
+                assert tr_a.itmin == tr_b.itmin
+                num.testing.assert_equal(tr_a.data, tr_b.data)
+
+        def load_digests(store_dir):
+            with open(os.path.join(store_dir, '.blocks'), 'r') as f:
+                f.readline()
+                return dict(line.split() for line in f)
+
+        store_dir = self._create_random_store()
+        store = gf.Store(store_dir)
+        nrecords = store.config.nrecords
+
+        store_dir2 = self._create_random_store()
+        store2 = gf.Store(store_dir2)
+
+        store.make_decimated(2, nworkers=1)
+        store2.make_decimated(2, nworkers=2, nrecords_block=50)
+        dec_dir = store._decimated_store_dir(2)
+        dec_dir2 = store2._decimated_store_dir(2)
+        compare_stores(dec_dir, dec_dir2)
+        digests = load_digests(dec_dir2)
+        assert len(digests) == (nrecords - 1) // 50 + 1
+
+        # resume interrupted run, with some blocks already partially written
+        os.rename(dec_dir2, dec_dir2 + '-incomplete')
+        with open(os.path.join(dec_dir2 + '-incomplete', '.status'), 'w') \
+                as f:
+            f.write('50\n')
+            for iblock in sorted(digests, key=int)[:3]:
+                f.write('%s %s\n' % (iblock, digests[iblock]))
+
+        os.remove(os.path.join(dec_dir2 + '-incomplete', '.blocks'))
+        store2 = gf.Store(store_dir2)
+        store2.make_decimated(2, nworkers=2, nrecords_block=50, continue_=True)
+        compare_stores(dec_dir, dec_dir2)
+        assert load_digests(dec_dir2) == digests
+
+        with self.assertRaises(gf.CannotCreate):
+            store2.make_decimated(2)
+
+        # incremental update after changing some source records
+        changed = [3, 4, 170]
+        store_dir3 = self._create_random_store(changed_records=changed)
+        shutil.copytree(
+            dec_dir2, gf.Store(store_dir3)._decimated_store_dir(2))
+
+        store3 = gf.Store(store_dir3)
+        store3.make_decimated(2, nworkers=2, nrecords_block=50,
+                              incremental=True)
+
+        digests3 = load_digests(store3._decimated_store_dir(2))
+        assert sorted(
+            k for k in digests if digests[k] != digests3[k]) \
+            == sorted(set(str(irecord // 50) for irecord in changed))
+
+        store4 = gf.Store(
+            self._create_random_store(changed_records=changed))
+        store4.make_decimated(2)
+        compare_stores(
+            store3._decimated_store_dir(2), store4._decimated_store_dir(2))
+
+    def test_make_ttt_incremental(self):
+        store_dir = self.get_regional_ttt_store_dir()
+        store_dir_copy = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(store_dir_copy)
+        shutil.rmtree(store_dir_copy)
+        shutil.copytree(store_dir, store_dir_copy)
+
+        store = gf.Store(store_dir_copy)
+        phases_dir = os.path.join(store_dir_copy, 'phases')
+
+        def mtimes():
+            return dict(
+                (fn, os.stat(os.path.join(phases_dir, fn)).st_mtime)
+                for fn in os.listdir(phases_dir) if fn.endswith('.phase'))
+
+        mtimes1 = mtimes()
+        store.make_ttt()
+        assert mtimes() == mtimes1
+
+        for fn in os.listdir(phases_dir):
+            assert fn.endswith('.phase') or fn.endswith('.phase.sha1')
+
+        args = (10*km, 1500*km)
+        tp = store.t('stored:P', args)
+        store.config.tabulated_phases[2] = gf.TPDef(id='P', definition='S')
+        time.sleep(0.01)
+        store.make_ttt(nworkers=2)
+        mtimes2 = mtimes()
+        assert [fn for fn in mtimes2 if mtimes2[fn] != mtimes1[fn]] \
+            == ['P.phase']
+
+        assert store.t('stored:P', args) == store.t('stored:S', args)
+        assert store.t('stored:P', args) != tp
+
+        # type B, receiver depth is a dimension of the store
+        store = gf.Store(self._create_regional_ttt_store_type_b())
+        phases_dir = os.path.join(store.store_dir, 'phases')
+        mtimes1 = mtimes()
+        store.make_ttt()
+        assert mtimes() == mtimes1
+        assert store.t('stored:P', (1*km, 10*km, 1050*km)) is not None
+
+    def test_run_cache(self):
+        cache_dir = mkdtemp(prefix='gfruncache')
+        self.tempdirs.append(cache_dir)
+
+        store_dirs = []
+        for i in range(2):
+            store_dir = mkdtemp(prefix='gfstore')
+            self.tempdirs.append(store_dir)
+            config = gf.meta.ConfigTypeA(
+                id='dummy_%i' % i,
+                ncomponents=2,
+                component_scheme='elastic2',
+                sample_rate=1.0,
+                source_depth_min=0*km,
+                source_depth_max=8*km,
+                source_depth_delta=4*km,
+                distance_min=4*km,
+                distance_max=20*km,
+                distance_delta=4*km,
+                modelling_code_id='dummy')
+
+            gf.Store.create_editables(store_dir, config=config, force=True)
+            store_dirs.append(store_dir)
+
+        fomosto_dummy.build(store_dirs[0], run_cache=cache_dir)
+
+        keys = []
+        for d in os.listdir(cache_dir):
+            keys.extend(os.listdir(os.path.join(cache_dir, d)))
+
+        assert len(keys) == 3
+
+        # tamper with one cached run to see that it is reused
+        fn = os.path.join(
+            cache_dir, keys[0][:2], keys[0], 'output', 'output.npy')
+        data = num.load(fn)
+        num.save(fn, data + 1.0)
+        irecords_tampered = set(data[:, 0].astype(num.int))
+
+        fomosto_dummy.build(store_dirs[1], run_cache=cache_dir)
+
+        stores = [gf.Store(d) for d in store_dirs]
+        for args in stores[0].config.iter_nodes():
+            irecord = stores[0].config.irecord(*args)
+            values = [
+                tr.data[0] if tr.data.size else 0.0
+                for tr in [store.get(args) for store in stores]]
+
+            assert values[0] == irecord
+            assert values[1] == irecord + float(irecord in irecords_tampered)
+
     def test_pulse_decimate(self):
         store_dir = self.get_pulse_store_dir()
 
@@ -779,6 +1733,143 @@ class GFTestCase(unittest.TestCase):
             store.t('{cake:P}', args) + store.t('{vel_surface:10}', args),
             0.1)
 
+    def test_timing_many(self):
+        store_dir = self.get_regional_ttt_store_dir()
+
+        store = gf.Store(store_dir)
+        conf = store.config
+
+        n = 200
+        args = num.zeros((n, 2))
+        args[:, 0] = num.random.uniform(
+            conf.source_depth_min, conf.source_depth_max, n)
+        args[:, 1] = num.random.uniform(
+            conf.distance_min, conf.distance_max, n)
+
+        for timing in [
+                'P', 'stored:S', '{stored:P}-10', 'first{stored:S|stored:P}',
+                'last{stored:S|stored:P}', '{stored:S|stored:P}',
+                'vel:5', 'vel_surface:15', '+0.1S', '{stored:P}+0.1S', '42']:
+
+            ts = store.t_many(timing, args)
+            assert ts.shape == (n,)
+            for i in range(n):
+                t = store.t(timing, tuple(args[i]))
+                if t is None:
+                    assert num.isnan(ts[i])
+                else:
+                    assert numeq(ts[i], t, 1e-6)
+
+        ts = store.t_many('first{cake:P|vel_surface:15}', args[:5])
+        for i in range(5):
+            assert numeq(
+                ts[i],
+                store.t('first{cake:P|vel_surface:15}', tuple(args[i])),
+                1e-6)
+
+        assert store.t_many('P', num.zeros((0, 2))).shape == (0,)
+
+        with self.assertRaises(gf.NoSuchPhase):
+            store.t_many('nonexistant', args)
+
+        with self.assertRaises(gf.OutOfBounds):
+            store.t_many('P', [(10*km, 1500*km), (10*km, 5000*km)])
+
+        nodes = conf.nodes(level=-1)
+        assert nodes.shape == (conf.nrecords // conf.ncomponents, 2)
+        for node, node_iter in zip(nodes, conf.iter_nodes(level=-1)):
+            assert tuple(node) == tuple(node_iter)
+
+    def test_dynamic_phase(self):
+        from pyrocko.gf import store as gf_store
+
+        store_dir = self.get_regional_ttt_store_dir()
+        store = gf.Store(store_dir)
+        conf = store.config
+
+        cache_dir = mkdtemp(prefix='gfcache')
+        self.tempdirs.append(cache_dir)
+
+        n = 300
+        args = num.zeros((n, 2))
+        args[:, 0] = num.random.uniform(
+            conf.source_depth_min, conf.source_depth_max, n)
+        # evenly spread, so that every cell gets enough points
+        args[:, 1] = num.linspace(conf.distance_min, conf.distance_max, n)
+
+        phase = gf_store.DynamicPhase(conf, 'cake', 'P', cache_dir=cache_dir)
+
+        # no table before enough points of a cell have been traced
+        icells = set(map(tuple, phase.cell_index(args)))
+        assert all(phase.get_cell_table(icell) is None for icell in icells)
+
+        t0 = time.time()
+        ts_exact = phase.evaluate_many(args)
+        t1 = time.time()
+        assert phase.nexact == n
+        assert len(phase._exact) == n
+
+        # tables are built cell by cell, not over the whole store
+        t2 = time.time()
+        ts = phase.evaluate_many(args)
+        t3 = time.time()
+        tables = [phase.get_cell_table(icell) for icell in icells]
+        assert all(table is not None for table in tables)
+        for icell, table in zip(icells, tables):
+            lo = phase.xbounds[:, 0] + num.array(icell) * phase.cell_size
+            num.testing.assert_allclose(table.xbounds[:, 0], lo)
+            assert num.all(
+                table.xbounds[:, 1] - table.xbounds[:, 0]
+                <= phase.cell_size * (1.0 + 1e-9))
+
+        assert phase.nexact == n
+        assert len(phase._exact) == 0
+
+        num.testing.assert_equal(num.isnan(ts), num.isnan(ts_exact))
+        iok = num.isfinite(ts)
+        assert num.all(num.abs(ts[iok] - ts_exact[iok]) <= 2.*phase.ftol)
+
+        ts_stored = store.t_many('stored:P', args)
+        assert num.all(num.abs(ts[iok] - ts_stored[iok]) <= 2.*phase.ftol)
+
+        # load from disk cache
+        for icell in icells:
+            del gf_store.g_dynamic_phase_tables[phase.key, icell]
+
+        phase2 = gf_store.DynamicPhase(
+            conf, 'cake', 'P', cache_dir=cache_dir)
+        num.testing.assert_equal(phase2.evaluate_many(args), ts)
+        assert phase2.nexact == 0
+        assert phase2(tuple(args[0])) == ts[0]
+
+        # memoized exact values are bounded
+        nexact_cache_max = gf_store.g_dynamic_phase_nexact_cache_max
+        gf_store.g_dynamic_phase_nexact_cache_max = 10
+        try:
+            phase3 = gf_store.DynamicPhase(
+                conf, 'cake', 'P', cache_dir=cache_dir)
+            phase3.key = None
+            for i in range(20):
+                phase3.exact(args[i])
+
+            assert len(phase3._exact) == 10
+        finally:
+            gf_store.g_dynamic_phase_nexact_cache_max = nexact_cache_max
+
+        print(
+            'dynamic phase: %i points, %i cells: exact %.2f s, '
+            'building tables and interpolating %.2f s' % (
+                n, len(icells), t1 - t0, t3 - t2))
+
+    def test_dynamic_phase_type_b(self):
+        store = gf.Store(self._create_regional_ttt_store_type_b())
+
+        args = (1*km, 10*km, 1050*km)
+        phase = store.get_phase('cake:P')
+        assert phase.receiver_depth is None
+        assert phase(args) == phase.exact(args)
+        assert numeq(store.t('{cake:P}', args), store.t('stored:P', args), 0.1)
+
     def dummy_store(self):
         if self._dummy_store is None:
 
@@ -6,6 +6,9 @@ import unittest
 from tempfile import mkdtemp
 import logging
 import shutil
+import os
+import multiprocessing
+import time
 
 import numpy as num
 
@@ -62,6 +65,123 @@ class GFAhfullTestCase(unittest.TestCase):
         store.make_ttt()
         ahfullgreen.build(d)
 
+    def test_build_distributed(self):
+        d_serial = mkdtemp(prefix='gfstore')
+        d_distributed = mkdtemp(prefix='gfstore')
+        self.tempdirs.extend([d_serial, d_distributed])
+        for d in (d_serial, d_distributed):
+            ahfullgreen.init(d, None)
+
+        ahfullgreen.build(d_serial)
+
+        # block claimed by a worker which crashed
+        queue = gf.BlockQueue(d_distributed, lease=1.0, worker_id='crashed')
+        queue.initialize(d_distributed)
+        with open(queue._claim_fn(0, 3), 'w') as f:
+            f.write('crashed 0\n')
+
+        procs = [
+            multiprocessing.Process(
+                target=ahfullgreen.build,
+                args=(d_distributed,),
+                kwargs=dict(distributed=True, lease=1.0))
+            for i in range(3)]
+
+        for proc in procs:
+            proc.start()
+
+        for proc in procs:
+            proc.join()
+            assert proc.exitcode == 0
+
+        assert not os.listdir(queue.claims_dir)
+
+        store_serial = gf.Store(d_serial)
+        store_distributed = gf.Store(d_distributed)
+        builder = ahfullgreen.AhfullGFBuilder(d_serial, 0, {})
+        timings = queue.timings()
+        assert [x[:2] for x in timings] == [
+            (0, iblock) for iblock in range(builder.nblocks)]
+
+        for (_, _, worker_id, tstart, tend) in timings:
+            assert worker_id != 'crashed'
+            assert tstart <= tend
+
+        for args in store_serial.config.iter_nodes():
+            tr_serial = store_serial.get(args)
+            tr_distributed = store_distributed.get(args)
+            assert tr_serial.itmin == tr_distributed.itmin
+            num.testing.assert_array_equal(
+                tr_serial.data, tr_distributed.data)
+
+    def test_build_distributed_lost_claim(self):
+        d = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(d)
+        ahfullgreen.init(d, None)
+
+        calls = []
+
+        class Builder(ahfullgreen.AhfullGFBuilder):
+            def work_block(self, iblock):
+                calls.append(iblock)
+                if calls.count(iblock) == 1 and iblock == 2:
+                    # another worker breaks the claim while the block is
+                    # being worked on
+                    queue = gf.BlockQueue(d, lease=1.0, worker_id='other')
+                    queue._write_claim(queue._claim_fn(0, iblock), 0)
+                    time.sleep(0.6)
+
+                ahfullgreen.AhfullGFBuilder.work_block(self, iblock)
+
+        timings = Builder.build_distributed(d, lease=1.0, poll=0.1)
+
+        # the lost block is not marked finished but is reclaimed after the
+        # other worker's lease has expired and done again
+        assert calls.count(2) == 2
+        assert [x[:2] for x in timings] == [
+            (0, iblock) for iblock in range(len(set(calls)))]
+
+        assert all(x[2] != 'other' for x in timings)
+        assert not os.listdir(gf.BlockQueue(d).claims_dir)
+
+    def test_block_queue_races(self):
+        d = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(d)
+        ahfullgreen.init(d, None)
+
+        queue_a = gf.BlockQueue(d, lease=1.0, worker_id='a')
+        queue_b = gf.BlockQueue(d, lease=1.0, worker_id='b')
+        queue_a.initialize(d)
+
+        def listdir():
+            return sorted(os.listdir(queue_a.claims_dir))
+
+        # claim renewed between staleness check and breaking: it is restored
+        assert queue_a.claim(0, [0]) == 0
+        fn = queue_a._claim_fn(0, 0)
+        assert not queue_b._is_stale(fn)
+        queue_b._seen[fn] = (queue_b._seen[fn][0], time.time() - 2.0)
+        assert queue_b._is_stale(fn)
+        assert queue_a.renew(0, 0, 1)
+        assert not queue_b._break(fn)
+        assert listdir() == ['0-0']
+        assert queue_a.owns(0, 0)
+        assert queue_a.renew(0, 0, 2)
+
+        # claim taken over between ownership check and renewal: the owner
+        # gives up
+        write_claim = queue_a._write_claim
+
+        def write_claim_racing(fn, counter):
+            write_claim(fn, counter)
+            queue_b._write_claim(fn, 0)
+
+        queue_a._write_claim = write_claim_racing
+        assert not queue_a.renew(0, 0, 3)
+        assert queue_b.owns(0, 0)
+        assert queue_b.renew(0, 0, 1)
+        assert listdir() == ['0-0']
+
 
 if __name__ == '__main__':
     util.setup_logging('test_gf_ahfull', 'warning')
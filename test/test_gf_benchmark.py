@@ -7,6 +7,9 @@ import cProfile
 import math
 import logging
 import shutil
+import resource
+import time
+import tracemalloc
 
 from tempfile import mkdtemp
 from .common import Benchmark
@@ -188,6 +191,191 @@ class GFBenchmarkTest(unittest.TestCase):
                 for nt in ntargets:
                     test_weights_bench(store, d, nt, interpolation)
 
+    def test_record_order_benchmark(self):
+        conf = gf.ConfigTypeA(
+            id='record_order',
+            source_depth_min=0.,
+            source_depth_max=20*km,
+            source_depth_delta=1*km,
+            distance_min=0.,
+            distance_max=100*km,
+            distance_delta=1*km,
+            sample_rate=10.0,
+            ncomponents=10)
+
+        ng = conf.ncomponents
+        nnodes = conf.nrecords // ng
+
+        # short records, about 10 nodes per page, as in near field static or
+        # low sample rate stores, where the layout matters
+        nsamples = 10
+
+        # emulate a store built out of order, e.g. by concurrent builders
+        store_dir_shuffled = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(store_dir_shuffled)
+        gf.Store.create(store_dir_shuffled, config=conf, force=True)
+        store = gf.Store(store_dir_shuffled, 'w')
+        for inode in random.permutation(nnodes):
+            for ig in range(ng):
+                store._put(int(inode*ng + ig), gf.GFTrace(
+                    data=random.normal(size=nsamples), itmin=0,
+                    deltat=conf.deltat))
+
+        store.close()
+
+        store_dirs = {'shuffled': store_dir_shuffled}
+        store = gf.Store(store_dir_shuffled)
+        for record_order in ('index', 'tiled'):
+            store_dir = mkdtemp(prefix='gfstore')
+            self.tempdirs.append(store_dir)
+            store.make_converted(
+                store_dir, record_order=record_order, force=True)
+            store_dirs[record_order] = store_dir
+
+        sources = [
+            gf.RectangularSource(
+                depth=8*km, length=12*km, width=6*km, dip=60., strike=30.),
+            gf.RectangularSource(
+                depth=10*km, length=20*km, width=10*km, dip=45., strike=0.),
+            gf.RectangularSource(
+                depth=6*km, length=8*km, width=8*km, dip=85., strike=70.)]
+
+        targets = [
+            gf.Target(
+                north_shift=dist*math.cos(azi),
+                east_shift=dist*math.sin(azi),
+                interpolation='multilinear')
+            for dist in (20*km, 50*km)
+            for azi in num.linspace(0., 2.*math.pi, 4, endpoint=False)]
+
+        receivers = [target.receiver(store) for target in targets]
+        receiver_coords = num.array([r.coords5 for r in receivers])
+
+        pagesize = resource.getpagesize()
+
+        def pages_touched(store_dir, source):
+            # number of distinct traces file pages read by the summation,
+            # i.e. the number of major page faults on a cold page cache
+            # without read-ahead
+            from pyrocko.gf import store_ext
+            store = gf.Store(store_dir)
+            store.open()
+            dsource = source.discretize_basesource(store)
+            pages = set()
+            for _, irecords in store_ext.make_sum_params(
+                    store.cstore, dsource.coords5(), dsource.m6s,
+                    receiver_coords, 'elastic10', 'multilinear', 0):
+
+                for irecord in num.unique(irecords):
+                    offset, _, nsamples, _, _ = \
+                        gf.BaseStore.get_record(store, irecord)
+                    if offset > 2:
+                        pages.update(range(
+                            int(offset) // pagesize,
+                            int(offset + nsamples*4 - 1) // pagesize + 1))
+
+            store.close()
+            return len(pages)
+
+        npages = {}
+        for k, store_dir in sorted(store_dirs.items()):
+            npages[k] = [
+                pages_touched(store_dir, source) for source in sources]
+
+        print('Record order benchmark (%i RectangularSources, %i targets, '
+              'tile shape %s)' % (
+                  len(sources), len(targets),
+                  gf.store.default_tile_shape(
+                      conf, nsamples * 4 * ng, pagesize)))
+
+        print('  %-10s %14s' % ('order', 'pages touched'))
+        for k in sorted(npages.keys()):
+            print('  %-10s %14s' % (
+                k, ' '.join('%4i' % n for n in npages[k])))
+
+        for k in npages:
+            npages[k] = sum(npages[k])
+
+        assert npages['index'] < npages['shuffled']
+        assert npages['tiled'] < npages['index']
+
+    def test_statics_chunked_benchmark(self):
+        conf = gf.ConfigTypeA(
+            id='statics_chunked',
+            source_depth_min=0.,
+            source_depth_max=10*km,
+            source_depth_delta=1*km,
+            distance_min=0.,
+            distance_max=100*km,
+            distance_delta=1*km,
+            sample_rate=1.0,
+            ncomponents=10)
+
+        store_dir = mkdtemp(prefix='gfstore')
+        self.tempdirs.append(store_dir)
+
+        gf.Store.create(store_dir, config=conf)
+        store = gf.Store(store_dir, 'w')
+        for args in conf.iter_nodes():
+            store.put(args, gf.GFTrace(
+                data=random.normal(size=3), itmin=0, deltat=conf.deltat))
+
+        store.close()
+
+        source = gf.RectangularSource(
+            depth=5*km, length=4*km, width=2*km, dip=60., strike=30.,
+            rake=90., magnitude=6.)
+
+        store = gf.Store(store_dir)
+
+        print('Statics benchmark (RectangularSource)')
+        print('  %-8s %-12s %8s %10s %16s' % (
+            'points', 'budget [MB]', 'threads', 'time [s]',
+            'peak alloc [MB]'))
+
+        nbytes_extra = {}
+        for npoints in (250000, 1000000):
+            target = gf.SatelliteTarget(
+                north_shifts=random.uniform(-50*km, 50*km, npoints),
+                east_shifts=random.uniform(-50*km, 50*km, npoints),
+                phi=num.full(npoints, num.pi/2.),
+                theta=num.full(npoints, num.pi/4.),
+                interpolation='nearest_neighbor')
+
+            base_source = source.discretize_basesource(store, target)
+
+            for nbytes_max in (16*1024**2, 64*1024**2):
+                for nthreads in (1, 4):
+                    # peak of the allocations made during the computation,
+                    # not counting the returned displacements
+                    tracemalloc.start()
+                    t0 = time.time()
+                    result = store.statics(
+                        base_source, target, 0, ['displacement.n'],
+                        'nearest_neighbor', nthreads, nbytes_max=nbytes_max)
+                    t1 = time.time()
+                    _, nbytes_peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+
+                    nbytes_result = sum(v.nbytes for v in result.values())
+                    nbytes_extra[npoints, nbytes_max, nthreads] = \
+                        nbytes_peak - nbytes_result
+
+                    print('  %-8i %-12i %8i %10.2f %16.1f' % (
+                        npoints, nbytes_max // 1024**2, nthreads, t1 - t0,
+                        nbytes_peak / 1024.**2))
+
+                    assert result['displacement.n'].size == npoints
+
+                    del result
+
+        # memory used besides the result is bounded by the budget and does
+        # not grow with the number of points
+        for (npoints, nbytes_max, nthreads), nbytes in nbytes_extra.items():
+            assert nbytes < nbytes_max * 1.1
+            assert nbytes > nbytes_max * 0.5
+            assert nbytes < 1.1 * nbytes_extra[250000, nbytes_max, nthreads]
+
 
 if __name__ == '__main__':
     util.setup_logging('test_gf', 'warning')
@@ -5,13 +5,22 @@ import os
 import asyncore
 import threading
 import logging
+import socket
 import tempfile
+import time
+import zlib
+from io import BytesIO
 
+import numpy as num
+import requests
+
+from pyrocko import gf
 from pyrocko.gf import server, LocalEngine, ws, store
 from pyrocko import util
 from pyrocko.fomosto import ahfullgreen
 
 op = os.path
+km = 1000.
 logger = logging.getLogger('pyrocko.test.test_gf_ws')
 
 
@@ -68,6 +77,325 @@ class GFWSTestCase(unittest.TestCase):
             t_ws.s.close()
             t_ws.join(1.)
 
+    def test_local_server_workers(self):
+        engine = LocalEngine(store_dirs=[self.serve_dir])
+        port = 32484
+        s = server.Server(
+            'localhost', port, server.SeismosizerHandler,
+            LocalEngine(store_dirs=[self.serve_dir]),
+            nworkers=2,
+            max_requests_per_client=3,
+            nresults_per_chunk=4)
+
+        t_ws = threading.Thread(target=asyncore.loop, args=(0.1, True))
+        t_ws.daemon = True
+        t_ws.start()
+
+        site = 'http://localhost:%i' % port
+
+        sources = [
+            gf.ExplosionSource(depth=depth, moment=1e15)
+            for depth in (1*km, 2*km, 3*km)]
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA%i' % i, '', component),
+                north_shift=i*1*km, east_shift=2*km,
+                store_id=self.store_id)
+            for i in range(1, 4)
+            for component in 'NEZ']
+
+        request = gf.Request(sources=sources, targets=targets)
+
+        try:
+            resp_ref = engine.process(request)
+
+            def check(isource, itarget, result):
+                tr = result.trace.pyrocko_trace()
+                tr_ref = resp_ref.results_list[isource][itarget] \
+                    .trace.pyrocko_trace()
+
+                assert tr.nslc_id == tr_ref.nslc_id
+                num.testing.assert_equal(tr.ydata, tr_ref.ydata)
+
+            resp = ws.seismosizer(site=site, request=request)
+            for isource, results in enumerate(resp.results_list):
+                for itarget, result in enumerate(results):
+                    check(isource, itarget, result)
+
+            results_clients = []
+
+            def client():
+                results = []
+                for chunk in ws.seismosizer_stream(
+                        site=site, request=request):
+                    assert len(chunk.results) <= 4
+                    results.extend(chunk.iter_results())
+
+                results_clients.append(results)
+
+            # more clients than workers
+            threads = [threading.Thread(target=client) for i in range(2)]
+            for t in threads:
+                t.start()
+
+            client()
+
+            for t in threads:
+                t.join()
+
+            assert len(results_clients) == 3
+            for results in results_clients:
+                assert len(results) == len(sources) * len(targets)
+                for isource, itarget, result in results:
+                    check(isource, itarget, result)
+
+            # concurrency limit per client
+            s.nrequests_client['127.0.0.1'] += 3
+            with self.assertRaises(requests.HTTPError) as cm:
+                ws.seismosizer(site=site, request=request)
+
+            assert cm.exception.response.status_code == 429
+            s.nrequests_client['127.0.0.1'] -= 3
+
+            # errors are reported to the client
+            request_bad = gf.Request(
+                sources=sources,
+                targets=[gf.Target(store_id='nonexistent')])
+
+            with self.assertRaises(requests.HTTPError) as cm:
+                list(ws.seismosizer_stream(site=site, request=request_bad))
+
+            assert cm.exception.response.status_code == 400
+
+            stats = requests.get(
+                site + '/gfws/seismosizer/1/stats').json()
+
+            assert stats['n_requests'] == 5
+            assert stats['n_requests_rejected'] == 1
+            assert stats['n_requests_failed'] == 1
+            assert stats['n_requests_active'] == 0
+            assert stats['n_requests_queued'] == 0
+            assert stats['n_results'] == 4 * len(sources) * len(targets)
+            assert stats['t_latency_max'] > 0.
+
+        finally:
+            s.close()
+            t_ws.join(1.)
+
+    def test_local_server_slow_client(self):
+        port = 32486
+        nbytes_outgoing_max = 16*1024
+        s = server.Server(
+            'localhost', port, server.SeismosizerHandler,
+            LocalEngine(store_dirs=[self.serve_dir]),
+            nworkers=1,
+            nresults_per_chunk=1,
+            nbytes_outgoing_max=nbytes_outgoing_max)
+
+        t_ws = threading.Thread(target=asyncore.loop, args=(0.1, True))
+        t_ws.daemon = True
+        t_ws.start()
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA%i' % i, '', 'Z'),
+                north_shift=(1. + i*0.001)*km, east_shift=2*km,
+                store_id=self.store_id)
+            for i in range(6000)]
+
+        request = gf.Request(
+            sources=[gf.ExplosionSource(depth=2*km, moment=1e15)],
+            targets=targets)
+
+        body = zlib.compress(request.dump().encode('utf-8'))
+        header = (
+            'POST /gfws/seismosizer/1/stream HTTP/1.1\r\n'
+            'Host: localhost\r\n'
+            'Content-Type: application/x-pyrocko-gf-request+zlib\r\n'
+            'Content-Length: %i\r\n\r\n' % len(body)).encode('ascii')
+
+        def connect():
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            sock.connect(('localhost', port))
+            sock.sendall(header + body)
+            return sock
+
+        def handlers():
+            return [
+                obj for obj in list(asyncore.socket_map.values())
+                if isinstance(obj, server.SeismosizerHandler)]
+
+        def wait(condition):
+            for i in range(200):
+                if condition():
+                    return True
+
+                time.sleep(0.05)
+
+            return False
+
+        try:
+            # client not reading: the server buffers no more than about
+            # nbytes_outgoing_max and the worker waits
+            sock = connect()
+            n_results = 0
+            while n_results == 0 or n_results != s.stats.n_results:
+                n_results = s.stats.n_results
+                time.sleep(1.)
+
+            assert 0 < n_results < len(targets)
+            assert s.stats.n_requests_active == 1
+            handler, = handlers()
+            assert handler.nbytes_outgoing() < 2*nbytes_outgoing_max
+
+            data = []
+            while True:
+                d = sock.recv(65536)
+                if not d:
+                    break
+
+                data.append(d)
+                if b''.join(data[-2:]).endswith(b'\r\n0\r\n\r\n'):
+                    break
+
+            sock.close()
+            data = b''.join(data)
+            assert wait(lambda: s.stats.n_requests_active == 0)
+            assert s.stats.n_results == len(targets)
+            assert len(data) > 20*nbytes_outgoing_max
+
+            # client going away: output is dropped, the job is completed
+            sock = connect()
+            time.sleep(1.)
+            assert s.stats.n_requests_active == 1
+            sock.close()
+            assert wait(lambda: s.stats.n_requests_active == 0)
+            assert wait(lambda: not handlers())
+            assert not s.nrequests_client
+
+        finally:
+            s.close()
+            t_ws.join(1.)
+
+    def test_response_chunk_binary(self):
+        results = [
+            (0, 1, gf.Result(
+                trace=gf.SeismosizerTrace(
+                    codes=('NET', 'STA', '', 'Z'),
+                    data=num.random.normal(size=100).astype(num.float32),
+                    deltat=0.5,
+                    tmin=10.),
+                n_records_stacked=12,
+                n_shared_stacking=3)),
+            (2, 0, gf.SeismosizerError('out of bounds')),
+            (1, 1, gf.Result())]
+
+        chunk = gf.ResponseChunk.from_results(results)
+        data = chunk.dump_binary()
+        assert len(data) < len(chunk.dump())
+
+        chunks = list(gf.ResponseChunk.iload_binary(BytesIO(data * 2)))
+        assert len(chunks) == 2
+        for chunk2 in chunks:
+            results2 = list(chunk2.iter_results())
+            assert len(results2) == 3
+            for (isource, itarget, result), (isource2, itarget2, result2) \
+                    in zip(sorted(results, key=lambda x: x[:2]),
+                           sorted(results2, key=lambda x: x[:2])):
+
+                assert (isource, itarget) == (isource2, itarget2)
+                if isinstance(result, Exception):
+                    assert isinstance(result2, gf.SeismosizerError)
+                    assert str(result2) == str(result)
+                elif result.trace is None:
+                    assert result2.trace is None
+                else:
+                    tr, tr2 = result.trace, result2.trace
+                    assert tr.codes == tr2.codes
+                    assert tr.tmin == tr2.tmin
+                    assert tr.deltat == tr2.deltat
+                    num.testing.assert_equal(tr.data, tr2.data)
+                    assert result.n_records_stacked \
+                        == result2.n_records_stacked
+
+        # chunks of other format versions are rejected
+        for magic in (b'GFRC', b'GFR\x03'):
+            with self.assertRaises(gf.SeismosizerError) as cm:
+                list(gf.ResponseChunk.iload_binary(
+                    BytesIO(magic + data[4:])))
+
+            assert 'version' in str(cm.exception)
+
+        with self.assertRaises(gf.SeismosizerError):
+            list(gf.ResponseChunk.iload_binary(BytesIO(b'XXXX' + data[4:])))
+
+    def test_remote_engine(self):
+        port = 32485
+        s = server.Server(
+            'localhost', port, server.SeismosizerHandler,
+            LocalEngine(store_dirs=[self.serve_dir]),
+            nworkers=2,
+            max_requests_per_client=2)
+
+        t_ws = threading.Thread(target=asyncore.loop, args=(0.1, True))
+        t_ws.daemon = True
+        t_ws.start()
+
+        sources = [
+            gf.ExplosionSource(depth=depth, moment=1e15)
+            for depth in (1*km, 2*km, 3*km)]
+
+        targets = [
+            gf.Target(
+                codes=('', 'STA%i' % i, '', component),
+                north_shift=i*1*km, east_shift=2*km,
+                store_id=self.store_id)
+            for i in range(1, 4)
+            for component in 'NEZ']
+
+        try:
+            resp_ref = LocalEngine(store_dirs=[self.serve_dir]).process(
+                sources, targets)
+
+            # more parallel batches than allowed per client, to exercise
+            # retries
+            engine = gf.RemoteEngine(
+                site='http://localhost:%i' % port,
+                nparallel=4,
+                nresults_per_batch=4)
+
+            batches = list(engine.iter_batches(
+                gf.Request(sources=sources, targets=targets)))
+            assert len(batches) == 3 * 3
+
+            for i in range(2):
+                resp = engine.process(sources=sources, targets=targets)
+                assert resp.stats.n_subrequests == len(batches)
+
+                for isource in range(len(sources)):
+                    for itarget in range(len(targets)):
+                        result = resp.results_list[isource][itarget]
+                        result_ref = resp_ref.results_list[isource][itarget]
+                        tr = result.trace.pyrocko_trace()
+                        tr_ref = result_ref.trace.pyrocko_trace()
+                        assert tr.nslc_id == tr_ref.nslc_id
+                        assert tr.tmin == tr_ref.tmin
+                        num.testing.assert_equal(tr.ydata, tr_ref.ydata)
+
+            with self.assertRaises(gf.BadRequest):
+                engine.process(
+                    sources=sources,
+                    targets=[gf.Target(
+                        north_shift=1000*km, store_id=self.store_id)])
+
+            engine.close()
+
+        finally:
+            s.close()
+            t_ws.join(1.)
+
 
 if __name__ == '__main__':
     util.setup_logging('test_gf_ws', 'warning')
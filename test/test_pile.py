@@ -38,6 +38,17 @@ def makeManyFiles(nfiles, nsamples, networks, stations, channels, tmin):
     return datadir
 
 
+def _index_put_files(cachedir, filenames):
+    index = pile.TracesFileIndex(cachedir)
+    for fn in filenames:
+        abspath = os.path.abspath(fn)
+        index.put(abspath, pile.TracesFile(
+            None, abspath, 'mseed', mtime=os.stat(fn)[8]))
+        index.dump_modified()
+
+    index.close()
+
+
 class PileTestCase(unittest.TestCase):
 
     def testPileTraversal(self):
@@ -109,6 +120,341 @@ class PileTestCase(unittest.TestCase):
         pile.get_cache(cachedir).clean()
         shutil.rmtree(datadir)
 
+    def testTracesFileIndex(self):
+        import shutil
+        from multiprocessing import Process
+
+        nfiles = 50
+        nsamples = 100
+        tmin = 1234567890
+        datadir = makeManyFiles(
+            nfiles, nsamples, ['xx'], ['AAA', 'BBB'], ['HHZ'], tmin)
+
+        filenames = sorted(util.select_files([datadir], show_progress=False))
+        cachedir = pjoin(datadir, '_cache_')
+
+        p = pile.Pile()
+        p.load_files(filenames=filenames, cache=pile.get_cache(cachedir),
+                     show_progress=False)
+
+        # fresh index object, entries must come from the database
+        index = pile.TracesFileIndex(cachedir)
+        assert index.get_nfiles() == nfiles
+        for fn in filenames:
+            tfile = index.get(os.path.abspath(fn))
+            assert tfile is not None
+            assert tfile.format == 'mseed'
+            assert tfile.mtime == os.stat(fn)[8]
+            assert len(tfile.traces) == 1
+            tr = tfile.traces[0]
+            assert tr.file is tfile
+            assert tr.data_len() == nsamples
+            assert tr.nslc_id in p.nslc_ids
+
+        assert index.get('/does/not/exist') is None
+
+        # queries by time span and codes
+        tq = tmin + 10.5 * nsamples
+        paths = list(index.iter_paths(tmin=tq, tmax=tq + 1.))
+        assert len(paths) == 1
+        assert list(index.iter_paths(tmin=tmin - 1000., tmax=tmin - 500.)) \
+            == []
+
+        entries = list(index.iter_traces(codes=('xx', 'AAA', None, 'H?Z')))
+        assert 0 < len(entries) < nfiles
+        assert all(nslc[1] == 'AAA' for (_, nslc, _, _, _) in entries)
+        assert len(list(index.iter_paths(codes=('xx', '*', '*', '*')))) \
+            == nfiles
+
+        # pile from index produces the same contents
+        p2 = pile.Pile()
+        p2.load_files(filenames=filenames, cache=index, show_progress=False)
+        assert p2.nslc_ids == p.nslc_ids
+        assert p2.tmin == p.tmin and p2.tmax == p.tmax
+        trs = p2.all(include_last=True)
+        assert sum(tr.data_len() for tr in trs) == nfiles * nsamples
+
+        # concurrent writers
+        procs = [
+            Process(target=_index_put_files,
+                    args=(cachedir, filenames[i::3]))
+            for i in range(3)]
+
+        for proc in procs:
+            proc.start()
+
+        for proc in procs:
+            proc.join()
+            assert proc.exitcode == 0
+
+        assert index.get_nfiles() == nfiles
+
+        # incremental update and removal of missing files
+        os.unlink(filenames[0])
+        index.clean()
+        assert index.get_nfiles() == nfiles - 1
+        assert index.get(os.path.abspath(filenames[0])) is None
+
+        index.close()
+        shutil.rmtree(datadir)
+
+    def testParallelScan(self):
+        import shutil
+
+        nfiles = 100
+        nsamples = 100
+        tmin = 1234567890
+        datadir = makeManyFiles(
+            nfiles, nsamples, ['xx'], ['AAA', 'BBB'], ['HHZ', 'HHN'], tmin)
+
+        filenames = sorted(util.select_files([datadir], show_progress=False))
+        fn_bad = pjoin(datadir, 'bad.mseed')
+        with open(fn_bad, 'wb') as f:
+            f.write(b'not a miniseed file' * 100)
+
+        filenames.append(fn_bad)
+
+        p_ref = pile.Pile()
+        p_ref.load_files(filenames=filenames, show_progress=False)
+
+        counts = []
+
+        def update_progress(label, i, n):
+            if label == 'Scanning files':
+                counts.append((i, n))
+
+        cachedir = pjoin(datadir, '_cache_')
+        p = pile.Pile()
+        p.load_files(filenames=filenames, cache=pile.get_cache(cachedir),
+                     show_progress=False, update_progress=update_progress,
+                     nprocs=3)
+
+        assert counts[-1][0] == counts[-1][1] == nfiles + 1
+        assert len(list(p.iter_files())) == nfiles
+        assert p.nslc_ids == p_ref.nslc_ids
+        assert p.tmin == p_ref.tmin and p.tmax == p_ref.tmax
+        assert pile.get_cache(cachedir).get_nfiles() == nfiles
+
+        for tr in p.iter_traces(load_data=True):
+            assert tr.data_len() == nsamples
+
+        # abort scanning early
+        def update_progress_abort(label, i, n):
+            return label == 'Scanning files' and i > 10
+
+        p = pile.Pile()
+        p.load_files(filenames=filenames, cache=None,
+                     show_progress=False,
+                     update_progress=update_progress_abort,
+                     nprocs=3)
+
+        assert 0 < len(list(p.iter_files())) < nfiles
+
+        shutil.rmtree(datadir)
+
+    def testPartialLoad(self):
+        import shutil
+        from pyrocko.io import mseed
+
+        datadir = tempfile.mkdtemp()
+        tmin = 1234567890.
+        deltat = 0.01
+        nsamples = 200000
+
+        traces = []
+        for cha in ('HHZ', 'HHN'):
+            for (itmin, n) in ((0, nsamples), (nsamples + 500, 10000)):
+                traces.append(trace.Trace(
+                    'XX', 'STA', '', cha,
+                    tmin=tmin + itmin*deltat, deltat=deltat,
+                    ydata=num.random.randint(
+                        -1000, 1000, size=n).astype(num.int32)))
+
+        fn = pjoin(datadir, 'day.mseed')
+        io.save(traces, fn)
+
+        traces_ref, index = mseed.load_record_index(fn)
+        assert len(traces_ref) == 4
+        assert 1 < index.size < num.sum(index['nbytes']) // 512
+        assert num.sum(index['nbytes']) == os.stat(fn).st_size
+
+        cachedir = pjoin(datadir, '_cache_')
+        p = pile.Pile()
+        p.load_files([fn], cache=pile.get_cache(cachedir),
+                     show_progress=False)
+
+        p_cached = pile.Pile()
+        p_cached.load_files(
+            [fn], cache=pile.TracesFileIndex(cachedir), show_progress=False)
+
+        tfile = list(p_cached.iter_files())[0]
+        assert tfile.record_index is None
+        assert tfile.get_record_index().size == index.size
+
+        p_full = pile.Pile()
+        p_full.partial_load_fraction = 0.0
+        p_full.load_files([fn], show_progress=False)
+
+        wins = [(tmin + 10.003, 60.), (tmin + 1999.5, 5.), (tmin + 1990., 30.),
+                (tmin - 1., 3.), (tmin + 2004.5, 1.), (tmin + 2099.99, 3.)]
+
+        for i in range(20):
+            wins.append((
+                tmin + random.uniform(-10., 2200.), random.uniform(0.1, 100.)))
+
+        for wmin, wlen in wins:
+            for pile_ in (p, p_cached):
+                trs, files = pile_.chop(
+                    wmin, wmin + wlen,
+                    trace_selector=lambda tr: tr.channel == 'HHZ')
+
+                assert not files
+                assert all(not tfile.data_loaded for tfile in
+                           pile_.iter_files())
+
+                trs_full, files_full = p_full.chop(
+                    wmin, wmin + wlen,
+                    trace_selector=lambda tr: tr.channel == 'HHZ')
+
+                trs.sort(key=lambda tr: tr.tmin)
+                trs_full.sort(key=lambda tr: tr.tmin)
+                assert len(trs) == len(trs_full)
+                for tr, tr_full in zip(trs, trs_full):
+                    assert tr.nslc_id == tr_full.nslc_id
+                    assert abs(tr.tmin - tr_full.tmin) < deltat * 1e-3
+                    num.testing.assert_equal(tr.ydata, tr_full.ydata)
+
+                for tfile in files_full:
+                    tfile.drop_data()
+
+        for trs in p.chopper(tmin=tmin + 100., tmax=tmin + 160., tinc=20.):
+            assert len(trs) == 2
+            for tr in trs:
+                assert tr.data_len() == 2000
+
+        shutil.rmtree(datadir)
+
+    def testChopperPrefetch(self):
+        import shutil
+        import threading
+
+        nfiles = 40
+        nsamples = 1000
+        tmin = 1234567890
+        datadir = makeManyFiles(
+            nfiles, nsamples, ['xx'], ['AAA', 'BBB'], ['HHZ', 'HHN'], tmin)
+
+        filenames = util.select_files([datadir], show_progress=False)
+        p = pile.Pile()
+        p.load_files(filenames=filenames, show_progress=False)
+
+        def sums(traces):
+            return sorted(
+                (tr.nslc_id, tr.tmin, num.sum(tr.ydata)) for tr in traces)
+
+        nthreads = threading.active_count()
+        for tinc, tpad in ((700., 0.), (130., 10.), (10000., 0.)):
+            ref = [sums(trs) for trs in p.chopper(tinc=tinc, tpad=tpad)]
+            for prefetch in (1, 3):
+                res = [sums(trs) for trs in p.chopper(
+                       tinc=tinc, tpad=tpad, prefetch=prefetch)]
+
+                assert res == ref
+                assert all(not f.data_loaded for f in p.iter_files())
+                assert all(f.data_use_count == 0 for f in p.iter_files())
+
+        # stop early, keep files open
+        for i, trs in enumerate(p.chopper(
+                tinc=500., prefetch=2, keep_current_files_open=True)):
+            if i == 2:
+                break
+
+        assert threading.active_count() == nthreads
+        assert any(f.data_loaded for f in p.iter_files())
+
+        shutil.rmtree(datadir)
+
+    def testDataCache(self):
+        import shutil
+
+        nfiles = 20
+        nsamples = 1000
+        tmin = 1234567890
+        datadir = makeManyFiles(
+            nfiles, nsamples, ['xx'], ['AAA', 'BBB'], ['HHZ', 'HHN'], tmin)
+
+        filenames = util.select_files([datadir], show_progress=False)
+
+        def sums(traces):
+            return sorted(
+                (tr.nslc_id, tr.tmin, num.sum(tr.ydata)) for tr in traces)
+
+        p = pile.Pile()
+        p.load_files(filenames=filenames, show_progress=False)
+        ref = [sums(trs) for trs in p.chopper(tinc=500.)]
+        stats = p.get_data_cache_stats()
+        assert stats['nbytes'] == 0
+        assert stats['nmisses'] == nfiles
+        assert all(not f.data_loaded for f in p.iter_files())
+        ref_long = [sums(trs) for trs in p.chopper(tinc=3000.)]
+
+        # repeated chop() calls do not reload the file
+        for k, nbytes_max in enumerate((0, 10 * 8 * nsamples)):
+            p.set_data_cache_nbytes(nbytes_max)
+            nmisses = p.get_data_cache_stats()['nmisses']
+            tmin_file = tmin + k * nsamples
+            for i in range(50):
+                trs, used = p.chop(tmin_file + i, tmin_file + 600. + i)
+                assert len(used) == 1
+                assert sum(tr.data_len() for tr in trs) == 600
+
+            assert p.get_data_cache_stats()['nmisses'] == nmisses + 1
+            assert used.pop().data_loaded
+
+        # unlimited: everything stays in memory and is reused
+        p = pile.Pile(data_cache_nbytes=None)
+        p.load_files(filenames=filenames, show_progress=False)
+        for i in range(2):
+            assert [sums(trs) for trs in p.chopper(tinc=500.)] == ref
+
+        stats = p.get_data_cache_stats()
+        assert all(f.data_loaded for f in p.iter_files())
+        assert all(f.data_use_count == 0 for f in p.iter_files())
+        assert stats['nfiles'] == nfiles
+        assert stats['nmisses'] == nfiles
+        assert stats['nhits'] > 0
+        assert stats['nevictions'] == 0
+        nbytes_file = stats['nbytes'] // nfiles
+        assert nbytes_file > 0
+
+        # budget: least recently used data is evicted
+        p.set_data_cache_nbytes(5 * nbytes_file)
+        stats = p.get_data_cache_stats()
+        assert stats['nbytes'] <= 5 * nbytes_file
+        assert stats['nevictions'] == nfiles - 5
+        loaded = [f for f in p.iter_files() if f.data_loaded]
+        assert len(loaded) == 5
+        assert all(f.tmin >= tmin + (nfiles-5)*nsamples for f in loaded)
+
+        for trs in p.chopper(tinc=500., accessor_id='a'):
+            assert p.get_data_cache_stats()['nbytes'] <= 5 * nbytes_file
+
+        # second accessor, data in use by it is not evicted
+        it = p.chopper(tinc=3000., accessor_id='b')
+        res_long = [sums(next(it))]
+        nopen = len(p.open_files['b'])
+        assert nopen >= 3
+        p.set_data_cache_nbytes(0)
+        assert p.get_data_cache_stats()['nbytes'] == nopen * nbytes_file
+        res_long.extend(sums(trs) for trs in it)
+        assert res_long == ref_long
+
+        stats = p.get_data_cache_stats()
+        assert stats['nbytes'] == 0
+        assert stats['nfiles'] == 0
+
+        shutil.rmtree(datadir)
+
     def testMemTracesFile(self):
         tr = trace.Trace(ydata=num.arange(100, dtype=num.float))
 
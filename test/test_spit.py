@@ -0,0 +1,86 @@
+from __future__ import division, print_function, absolute_import
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import numpy as num
+
+from pyrocko import spit
+
+
+def f_sphere(x):
+    x = num.asarray(x)
+    x0 = num.full(x.size, 0.5)
+    if num.sqrt(num.sum((x-x0)**2)) < 0.5:
+        return num.sum(x**2) + x[0]**4
+
+    return None
+
+
+class SpitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='pyrocko-spit')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def make_points(self, ndim, npoints):
+        x = num.random.uniform(-0.1, 1.1, size=(npoints, ndim))
+
+        # points on cell boundaries and corners
+        x[:npoints//4] = num.round(x[:npoints//4] * 16.) / 16.
+        return x
+
+    def test_interpolate_many(self):
+        for ndim, xtol in [(1, 0.01), (2, 0.05), (3, 0.1)]:
+            tree = spit.SPTree(
+                f=f_sphere,
+                ftol=0.01,
+                xbounds=[[0., 1.]]*ndim,
+                xtols=[xtol]*ndim)
+
+            fn = os.path.join(self.tempdir, 'tree.spit')
+            tree.dump(fn)
+            tree_loaded = spit.SPTree(filename=fn)
+
+            x = self.make_points(ndim, 5000)
+            y_ref = tree.root.interpolate_many(x)
+            assert num.any(num.isfinite(y_ref))
+            assert num.any(num.isnan(y_ref))
+
+            for t in (tree, tree_loaded):
+                for nthreads in (0, 1, 3):
+                    y = t.interpolate_many(x, nthreads=nthreads)
+                    num.testing.assert_array_equal(y, y_ref)
+
+            y = tree.interpolate_many(num.zeros((0, ndim)))
+            assert y.shape == (0,)
+
+    def test_interpolate_many_speed(self):
+        ndim = 2
+        tree = spit.SPTree(
+            f=f_sphere,
+            ftol=0.001,
+            xbounds=[[0., 1.]]*ndim,
+            xtols=[0.01]*ndim)
+
+        x = self.make_points(ndim, 100000)
+        t0 = time.time()
+        y_ref = tree.root.interpolate_many(x)
+        t1 = time.time()
+        y = tree.interpolate_many(x)
+        t2 = time.time()
+        y = tree.interpolate_many(x)
+        t3 = time.time()
+
+        num.testing.assert_array_equal(y, y_ref)
+        print('%i cells, %i points: python %.3f s, C %.3f s '
+              '(first call, including flattening %.3f s)' % (
+                  len(tree), x.shape[0], t1 - t0, t3 - t2, t2 - t1))
+
+
+if __name__ == '__main__':
+    unittest.main()